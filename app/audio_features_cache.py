@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import dialect_insert
+from app.models import AudioFeatures, AudioFeaturesMiss
+
+
+class AudioFeaturesCache:
+    """
+    Process-wide LRU of track IDs whose audio features need no lookup:
+    tracks with stored features, and tracks Spotify recently returned no
+    features for (persisted in audio_features_misses, retried after a TTL).
+
+    Entries are only learned from the database, so a rolled back sync never
+    leaves the cache claiming features that were not stored.
+    """
+
+    def __init__(self, max_size: int, miss_retry: timedelta):
+        self.max_size = max_size
+        self.miss_retry = miss_retry
+        # track_id -> monotonic expiry for misses, None for stored features
+        self._known: "OrderedDict[str, float | None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, track_id: str, expires_at: float | None) -> None:
+        self._known[track_id] = expires_at
+        self._known.move_to_end(track_id)
+        while len(self._known) > self.max_size:
+            self._known.popitem(last=False)
+
+    def unseen_track_ids(self, db: Session, track_ids: Iterable[str]) -> List[str]:
+        """
+        Filter track IDs down to those that need features from Spotify:
+        not stored, and not a miss within the retry TTL
+        """
+        now = time.monotonic()
+        candidates: List[str] = []
+        with self._lock:
+            for track_id in dict.fromkeys(track_ids):
+                if track_id in self._known:
+                    expires_at = self._known[track_id]
+                    if expires_at is None or expires_at > now:
+                        self._known.move_to_end(track_id)
+                        continue
+                    del self._known[track_id]
+                candidates.append(track_id)
+
+        if not candidates:
+            return []
+
+        stored = {
+            r[0]
+            for r in db.query(AudioFeatures.track_id)
+            .filter(AudioFeatures.track_id.in_(candidates))
+            .all()
+        }
+        retry_before = datetime.now() - self.miss_retry
+        recent_misses: Dict[str, datetime] = {
+            r.track_id: r.checked_at
+            for r in db.query(AudioFeaturesMiss.track_id, AudioFeaturesMiss.checked_at)
+            .filter(
+                AudioFeaturesMiss.track_id.in_(candidates),
+                AudioFeaturesMiss.checked_at > retry_before,
+            )
+            .all()
+        }
+
+        with self._lock:
+            for track_id in stored:
+                self._remember(track_id, None)
+            for track_id, checked_at in recent_misses.items():
+                remaining = checked_at - retry_before
+                self._remember(track_id, now + remaining.total_seconds())
+
+        return [
+            track_id
+            for track_id in candidates
+            if track_id not in stored and track_id not in recent_misses
+        ]
+
+    def record_misses(self, db: Session, track_ids: Iterable[str]) -> None:
+        """
+        Persist tracks Spotify returned no features for. Does not commit:
+        call it inside the transaction that stores the features that were found.
+        """
+        rows = [
+            {"track_id": track_id, "checked_at": datetime.now(), "attempts": 1}
+            for track_id in dict.fromkeys(track_ids)
+        ]
+        if not rows:
+            return
+        stmt = dialect_insert(db, AudioFeaturesMiss).values(rows)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["track_id"],
+                set_={
+                    "checked_at": stmt.excluded.checked_at,
+                    "attempts": AudioFeaturesMiss.attempts + 1,
+                },
+            )
+        )
+
+    def clear(self) -> None:
+        """
+        Forget all in-process entries
+        """
+        with self._lock:
+            self._known.clear()
+
+
+# Process-wide cache shared by all syncs
+audio_features_cache = AudioFeaturesCache(
+    settings.AUDIO_FEATURES_CACHE_SIZE,
+    timedelta(hours=settings.AUDIO_FEATURES_MISS_RETRY_HOURS),
+)
@@ -4,7 +4,7 @@ from datetime import datetime, timedelta, timezone  # Import timezone
 from typing import Any  # Import Any for precise type hinting
 from urllib.parse import urlencode
 
-import requests
+import httpx
 from fastapi import (
     APIRouter,
     Depends,
@@ -13,14 +13,19 @@ from fastapi import (
     Response,
     status,
 )  # Import Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
 from jose import JWTError, jwt  # Import JWT handling
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.config import settings
-from app.database import get_db
+from app.database import SessionLocal, get_async_db, get_db
 from app.models import User
+from app.spotify_http import spotify_http
+from app.token_manager import TOKEN_REFRESH_MARGIN, token_manager, token_needs_refresh
+from app.user_cache import user_cache
 
 router = APIRouter()
 
@@ -66,60 +71,63 @@ def create_access_token(data: dict[str, Any], expires_delta: timedelta | None =
 # --- Spotify API Interaction (existing functions slightly adapted) ---
 
 
-def get_spotify_tokens(code: str):
-    """Exchange the authorization code for access and refresh tokens"""
+def spotify_token_headers() -> dict[str, str]:
+    """Client credentials headers for requests to the Spotify token endpoint"""
     auth_string = f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}"
     auth_bytes = auth_string.encode("utf-8")
     auth_base64 = base64.b64encode(auth_bytes).decode("utf-8")
 
-    headers = {
+    return {
         "Authorization": f"Basic {auth_base64}",
         "Content-Type": "application/x-www-form-urlencoded",
     }
+
+
+def get_spotify_tokens(code: str):
+    """Exchange the authorization code for access and refresh tokens"""
+    headers = spotify_token_headers()
     data = {
         "grant_type": "authorization_code",
         "code": code,
         "redirect_uri": settings.SPOTIFY_REDIRECT_URI,
     }
 
-    response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
-    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+    response = spotify_http.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+    response.raise_for_status()  # Raise HTTPStatusError for bad responses (4xx or 5xx)
     return response.json()
 
 
 def refresh_spotify_token(refresh_token: str):
     """Refresh the Spotify access token using the refresh token"""
-    auth_string = f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}"
-    auth_bytes = auth_string.encode("utf-8")
-    auth_base64 = base64.b64encode(auth_bytes).decode("utf-8")
-
-    headers = {
-        "Authorization": f"Basic {auth_base64}",
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
+    headers = spotify_token_headers()
     data = {"grant_type": "refresh_token", "refresh_token": refresh_token}
 
-    response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
-    response.raise_for_status()  # Raise HTTPError for bad responses
+    response = spotify_http.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+    response.raise_for_status()  # Raise HTTPStatusError for bad responses
     return response.json()
 
 
 def get_spotify_user_info(access_token: str):
     """Get the user's Spotify profile information"""
     headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(f"{SPOTIFY_API_BASE_URL}/me", headers=headers)
-    response.raise_for_status()  # Raise HTTPError for bad responses
+    response = spotify_http.get(f"{SPOTIFY_API_BASE_URL}/me", headers=headers)
+    response.raise_for_status()  # Raise HTTPStatusError for bad responses
     return response.json()
 
 
 # --- Authentication Dependency ---
 
 
-async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
-    """
-    Dependency to get the current user based on the JWT stored in the cookie.
-    Handles token validation, expiration, and Spotify token refresh if needed.
-    """
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _user_id_from_cookie(request: Request) -> str:
+    """Validate the JWT stored in the cookie and return its user_id"""
     token = request.cookies.get(ACCESS_TOKEN_COOKIE)
     if not token:
         raise HTTPException(
@@ -128,11 +136,6 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     try:
         # Decode the JWT
         payload = jwt.decode(
@@ -141,70 +144,100 @@ async def get_current_user(request: Request, db: Session = Depends(get_db)) -> U
         # Fix for: Type "Any | None" is not assignable to declared type "str"
         _jwt_sub = payload.get("sub")  # "sub" is the standard claim for subject
         if not isinstance(_jwt_sub, str):  # Ensures _jwt_sub is a string, handles None
-            raise credentials_exception
+            raise _credentials_exception()
         user_id: str = _jwt_sub  # Now _jwt_sub is confirmed to be str.
         token_data_model = TokenData(user_id=user_id)  # Renamed to avoid clash later
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return str(token_data_model.user_id)
+
+
+def _refresh_user_token(db: Session, user: User) -> None:
+    """
+    Refresh the stored Spotify token if it is expired or close to expiring;
+    concurrent requests for the same user share a single refresh
+    """
+    try:
+        token_manager.ensure_fresh(db, user, refresh_spotify_token)
+    except httpx.HTTPError as e:
+        # If refresh fails, the user might need to re-authenticate
+        print(
+            f"Spotify token refresh failed for user {user.user_id}: {e}"
+        )  # Add logging
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Failed to refresh Spotify token: {str(e)}. Please login again.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    except Exception as e:  # Catch other potential errors during refresh
+        print(
+            f"Unexpected error during Spotify token refresh for user {user.user_id}: {e}"
+        )  # Add logging
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred during token refresh.",
+        )
+
+
+def _load_user(db: Session, user_id: str, refresh_token: bool = True) -> User:
+    """
+    Load the user, serving their auth fields from the cache unless their
+    Spotify token is due for a refresh. With refresh_token=False a due token
+    is left for the caller to refresh.
+    """
+    refresh_before = datetime.now(timezone.utc) + TOKEN_REFRESH_MARGIN
+    user = user_cache.get(
+        db, user_id, token_valid_until=refresh_before.replace(tzinfo=None)
+    )
+    if user is not None:
+        return user
 
     # Find user in database using the internal user_id from the JWT
-    user = db.query(User).filter(User.user_id == token_data_model.user_id).first()
+    user = db.query(User).filter(User.user_id == user_id).first()
     if user is None:
-        raise credentials_exception
-
-    # --- Spotify Token Refresh Logic (Optional but recommended here) ---
-    # Check if the stored Spotify token is expired or close to expiring
-    # Add a buffer (e.g., 5 minutes) to refresh before actual expiry
-    # Make naive datetime timezone-aware by replacing it with a timezone-aware one
-    token_expires_at_utc = user.token_expires_at.replace(tzinfo=timezone.utc)
-    if token_expires_at_utc < datetime.now(timezone.utc) + timedelta(minutes=5):
-        try:
-            print(f"Refreshing Spotify token for user {user.user_id}")  # Add logging
-            # Fix for: Argument of type "Column[str]" cannot be assigned to parameter "refresh_token"
-            refreshed_token_payload = refresh_spotify_token(str(user.refresh_token))
-
-            # Update user with new Spotify tokens
-            user.access_token = refreshed_token_payload.get("access_token")
-            # Ensure expires_in is handled correctly, default to 1 hour if missing
-            expires_in = refreshed_token_payload.get("expires_in", 3600)
-            # Store naive datetime to match the model's DateTime column definition
-            expiry_time = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
-            # Fix for: "datetime" is not assignable to "Column[datetime]"
-            setattr(user, "token_expires_at", expiry_time.replace(tzinfo=None))
-
-            # Spotify might issue a new refresh token
-            if "refresh_token" in refreshed_token_payload:
-                user.refresh_token = refreshed_token_payload["refresh_token"]
-
-            db.commit()
-            db.refresh(user)
-            print(
-                f"Spotify token refreshed successfully for user {user.user_id}"
-            )  # Add logging
-        except requests.exceptions.RequestException as e:
-            # If refresh fails, the user might need to re-authenticate
-            db.rollback()
-            print(
-                f"Spotify token refresh failed for user {user.user_id}: {e}"
-            )  # Add logging
-            # Depending on the error, you might let the request proceed
-            # or force re-authentication by raising an error.
-            # For now, let's raise an error to indicate the issue.
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=f"Failed to refresh Spotify token: {str(e)}. Please login again.",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        except Exception as e:  # Catch other potential errors during refresh
-            db.rollback()
-            print(
-                f"Unexpected error during Spotify token refresh for user {user.user_id}: {e}"
-            )  # Add logging
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="An error occurred during token refresh.",
-            )
+        raise _credentials_exception()
 
+    if refresh_token:
+        _refresh_user_token(db, user)
+    if not token_needs_refresh(user):
+        user_cache.put(user)
+    return user
+
+
+def _refresh_user_token_in_own_session(user_id: str) -> None:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_id == user_id).first()
+        if user is None:
+            raise _credentials_exception()
+        _refresh_user_token(db, user)
+    finally:
+        db.close()
+
+
+async def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+    """
+    Dependency to get the current user based on the JWT stored in the cookie.
+    Handles token validation, expiration, and Spotify token refresh if needed.
+    """
+    return _load_user(db, _user_id_from_cookie(request))
+
+
+async def get_current_user_async(
+    request: Request, db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """
+    get_current_user for endpoints on an AsyncSession. The lookup runs on the
+    async connection; a due Spotify token refresh (rare, as the background
+    refresher renews tokens first) runs in a worker thread, so neither
+    blocks the event loop.
+    """
+    user_id = _user_id_from_cookie(request)
+    user = await db.run_sync(_load_user, user_id, False)
+    if token_needs_refresh(user):
+        await run_in_threadpool(_refresh_user_token_in_own_session, user_id)
+        await db.refresh(user)
+        user_cache.put(user)
     return user
 
 
@@ -332,7 +365,7 @@ def callback(
 
         return response
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         # Handle errors during communication with Spotify
         print(f"Spotify API request failed: {e}")  # Log the error
         raise HTTPException(
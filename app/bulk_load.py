@@ -0,0 +1,236 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, dialect_insert
+from app.insights_cache import bump_data_version
+from app.models import ListeningHistory
+from app.rollups import apply_plays_to_rollups
+
+logger = logging.getLogger(__name__)
+
+# Records per COPY / executemany batch; each batch is committed on its own
+DEFAULT_BATCH_SIZE = 10_000
+
+LOAD_COLUMNS = [
+    "user_id",
+    "track_id",
+    "track_name",
+    "artist_id",
+    "artist_name",
+    "album_id",
+    "album_name",
+    "played_at",
+    "duration_ms",
+]
+# Columns of the listening_history unique constraint
+DEDUPE_COLUMNS = ["user_id", "track_id", "played_at"]
+
+STAGING_TABLE = "listening_history_staging"
+# Marks NULL fields in the COPY CSV stream, so empty strings stay strings
+COPY_NULL = "\\N"
+
+# Rows returned for each inserted play, as needed by the rollups
+RETURNING_COLUMNS = [
+    ListeningHistory.user_id,
+    ListeningHistory.track_id,
+    ListeningHistory.track_name,
+    ListeningHistory.artist_id,
+    ListeningHistory.artist_name,
+    ListeningHistory.played_at,
+    ListeningHistory.duration_ms,
+]
+
+
+def _to_naive_utc(value: Any) -> datetime | None:
+    # played_at is stored as naive UTC, like the Spotify sync stores it
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _record_to_row(record: Any) -> Dict[str, Any]:
+    """
+    Normalize a ListeningHistory-shaped record (mapping or object)
+    """
+    if isinstance(record, Mapping):
+        row = {column: record.get(column) for column in LOAD_COLUMNS}
+    else:
+        row = {column: getattr(record, column, None) for column in LOAD_COLUMNS}
+    row["played_at"] = _to_naive_utc(row["played_at"])
+    return row
+
+
+def _batches(records: Iterable[Any], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(records)
+    while batch := [_record_to_row(record) for record in islice(iterator, batch_size)]:
+        yield batch
+
+
+def _copy_batch(db: Session, rows: List[Dict[str, Any]]) -> List[Any]:
+    """
+    COPY a batch into the staging table and merge it into listening_history.
+    Returns the inserted rows.
+    """
+    db.execute(
+        text(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} "
+            "(user_id varchar, track_id varchar, track_name varchar, "
+            "artist_id varchar, artist_name varchar, album_id varchar, "
+            "album_name varchar, played_at timestamp, duration_ms integer) "
+            "ON COMMIT DELETE ROWS"
+        )
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            [
+                COPY_NULL if row[column] is None else row[column]
+                for column in LOAD_COLUMNS
+            ]
+        )
+    buffer.seek(0)
+
+    # COPY needs the DBAPI cursor, on the connection the session is using
+    dbapi_connection = db.connection().connection.driver_connection
+    with dbapi_connection.cursor() as cursor:  # type: ignore[union-attr]
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(LOAD_COLUMNS)}) FROM STDIN "
+            f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer,
+        )
+
+    columns = ", ".join(LOAD_COLUMNS)
+    returning = ", ".join(column.key for column in RETURNING_COLUMNS)
+    dedupe = ", ".join(DEDUPE_COLUMNS)
+    return list(
+        db.execute(
+            text(
+                f"INSERT INTO listening_history ({columns}) "
+                f"SELECT DISTINCT ON ({dedupe}) {columns} FROM {STAGING_TABLE} "
+                f"ON CONFLICT ({dedupe}) DO NOTHING "
+                f"RETURNING {returning}"
+            )
+        ).all()
+    )
+
+
+def _executemany_batch(db: Session, rows: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Fallback for databases without COPY (SQLite): executemany insert that
+    skips duplicates. Returns the inserted rows.
+    """
+    stmt = (
+        dialect_insert(db, ListeningHistory)
+        .on_conflict_do_nothing(index_elements=DEDUPE_COLUMNS)
+        .returning(*RETURNING_COLUMNS)
+    )
+    return list(db.execute(stmt, rows).all())
+
+
+def load(
+    records: Iterable[Any],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    db: Session | None = None,
+) -> Dict[str, Any]:
+    """
+    Bulk load ListeningHistory-shaped records (mappings or objects with the
+    listening_history columns) into listening_history.
+
+    records may be any iterable, including a generator; it is consumed one
+    batch at a time, so memory is bounded by batch_size. Plays already stored
+    (same user, track and played_at) are skipped. Each batch updates the
+    rollups and the users' data_version and is committed, so an interrupted
+    load can be resumed by loading the same records again.
+
+    Returns throughput stats: records read, inserted, skipped as duplicates,
+    batches, seconds and rows per second.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+
+    owns_session = db is None
+    session = db if db is not None else SessionLocal()
+    use_copy = session.get_bind().dialect.name == "postgresql"
+    load_batch = _copy_batch if use_copy else _executemany_batch
+
+    read = 0
+    inserted = 0
+    batches = 0
+    started = time.perf_counter()
+    try:
+        for rows in _batches(records, batch_size):
+            inserted_rows = load_batch(session, rows)
+
+            apply_plays_to_rollups(session, inserted_rows)
+            user_ids: Set[str] = {str(row.user_id) for row in inserted_rows}
+            for user_id in user_ids:
+                bump_data_version(session, user_id)
+            session.commit()
+
+            read += len(rows)
+            inserted += len(inserted_rows)
+            batches += 1
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Bulk load batch {batches}: {read} records read, "
+                f"{inserted} inserted ({read / elapsed:.0f} records/s)"
+            )
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        if owns_session:
+            session.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "read": read,
+        "inserted": inserted,
+        "skipped": read - inserted,
+        "batches": batches,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(read / seconds, 1) if seconds else 0.0,
+    }
+
+
+def _read_json_lines(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main() -> None:
+    """
+    Load command: python -m app.bulk_load PLAYS.jsonl [--batch-size N]
+    """
+    parser = argparse.ArgumentParser(
+        description="Bulk load listening history from a JSON lines dump"
+    )
+    parser.add_argument("path", help="File with one listening_history record per line")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = load(_read_json_lines(args.path), batch_size=args.batch_size)
+    logger.info(f"Bulk load finished: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import copy
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple, Type
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.insights import InsightsGenerator
+from app.models import ListeningHistory, User
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only the columnar engine needs it
+    np = None  # type: ignore
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECONDS_PER_HOUR = 3_600_000_000
+MICROSECONDS_PER_DAY = 24 * MICROSECONDS_PER_HOUR
+# Marks plays without a played_at timestamp
+MISSING_PLAYED_AT = -(2**63)
+# Rows fetched per round trip while loading a snapshot
+LOAD_BATCH_SIZE = 10_000
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError(
+            "The columnar insights engine requires numpy (pip install numpy)"
+        )
+
+
+def _to_epoch_us(value: datetime | None) -> int:
+    if value is None:
+        return MISSING_PLAYED_AT
+    return (value.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_epoch_us(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _sort_key(key: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    # Order like SQL tie-breaks on the group columns, with NULLs last
+    return tuple((part is None, part or "") for part in key)
+
+
+class HistorySnapshot:
+    """
+    Compact in-memory copy of one user's listening history.
+    played_at is int64 epoch microseconds; tracks and artists are int32 codes
+    into dictionaries of their (id, name...) group keys, matching the
+    groupings of the SQL sections.
+    """
+
+    def __init__(self, user_id: str):
+        _require_numpy()
+        self.user_id = user_id
+        self.last_id = 0
+        # users.data_version the snapshot was loaded at
+        self.data_version: int | None = None
+        self.played_at = np.empty(0, dtype=np.int64)
+        self.track_codes = np.empty(0, dtype=np.int32)
+        self.artist_codes = np.empty(0, dtype=np.int32)
+        self.duration_ms = np.empty(0, dtype=np.int32)
+        self.track_keys: List[Tuple[Any, Any, Any]] = []
+        self.artist_keys: List[Tuple[Any, Any]] = []
+        self._track_index: Dict[Tuple[Any, Any, Any], int] = {}
+        self._artist_index: Dict[Tuple[Any, Any], int] = {}
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory used by the arrays and the key dictionaries
+        """
+        array_bytes = (
+            self.played_at.nbytes
+            + self.track_codes.nbytes
+            + self.artist_codes.nbytes
+            + self.duration_ms.nbytes
+        )
+        # Rough per-entry cost of the key tuples, their strings and index dicts
+        key_bytes = 200 * (len(self.track_keys) + len(self.artist_keys))
+        return array_bytes + key_bytes
+
+    def copy(self) -> "HistorySnapshot":
+        """
+        Copy that can be refreshed while readers keep using this snapshot
+        """
+        snapshot = copy.copy(self)
+        snapshot.track_keys = list(self.track_keys)
+        snapshot.artist_keys = list(self.artist_keys)
+        snapshot._track_index = dict(self._track_index)
+        snapshot._artist_index = dict(self._artist_index)
+        return snapshot
+
+    def refresh(self, db: Session) -> int:
+        """
+        Append plays with ids above the last loaded one; returns how many
+        were added. Plays committed out of id order are missed, so callers
+        check the row count (see SnapshotCache).
+        """
+        played_at: List[int] = []
+        track_codes: List[int] = []
+        artist_codes: List[int] = []
+        durations: List[int] = []
+
+        rows = (
+            db.query(
+                ListeningHistory.id,
+                ListeningHistory.played_at,
+                ListeningHistory.track_id,
+                ListeningHistory.track_name,
+                ListeningHistory.artist_id,
+                ListeningHistory.artist_name,
+                ListeningHistory.duration_ms,
+            )
+            .filter(
+                ListeningHistory.user_id == self.user_id,
+                ListeningHistory.id > self.last_id,
+            )
+            .order_by(ListeningHistory.id)
+            .yield_per(LOAD_BATCH_SIZE)
+        )
+        for r in rows:
+            track_key = (r.track_id, r.track_name, r.artist_name)
+            track_code = self._track_index.get(track_key)
+            if track_code is None:
+                track_code = self._track_index[track_key] = len(self.track_keys)
+                self.track_keys.append(track_key)
+
+            artist_key = (r.artist_id, r.artist_name)
+            artist_code = self._artist_index.get(artist_key)
+            if artist_code is None:
+                artist_code = self._artist_index[artist_key] = len(self.artist_keys)
+                self.artist_keys.append(artist_key)
+
+            played_at.append(_to_epoch_us(r.played_at))
+            track_codes.append(track_code)
+            artist_codes.append(artist_code)
+            durations.append(r.duration_ms or 0)
+            self.last_id = max(self.last_id, r.id)
+
+        if played_at:
+            self.played_at = np.concatenate(
+                [self.played_at, np.array(played_at, dtype=np.int64)]
+            )
+            self.track_codes = np.concatenate(
+                [self.track_codes, np.array(track_codes, dtype=np.int32)]
+            )
+            self.artist_codes = np.concatenate(
+                [self.artist_codes, np.array(artist_codes, dtype=np.int32)]
+            )
+            self.duration_ms = np.concatenate(
+                [self.duration_ms, np.array(durations, dtype=np.int32)]
+            )
+        return len(played_at)
+
+
+class SnapshotCache:
+    """
+    LRU of user history snapshots bounded by a memory budget.
+    A snapshot is reused while the user's data_version (bumped by every
+    write to their history) is unchanged. Otherwise plays inserted since it
+    was loaded are appended, and it is rebuilt if the row count shows plays
+    that were committed out of id order.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._snapshots: "OrderedDict[str, HistorySnapshot]" = OrderedDict()
+        # Guards the LRU only; loads run under the user's own lock
+        self._lock = threading.Lock()
+        self._user_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._user_locks[user_id] = lock
+            return lock
+
+    def get(self, db: Session, user_id: str) -> HistorySnapshot:
+        """
+        Get an up-to-date snapshot for the user, loading it if needed
+        """
+        with self._user_lock(user_id):
+            with self._lock:
+                snapshot = self._snapshots.get(user_id)
+            data_version = (
+                db.query(User.data_version).filter(User.user_id == user_id).scalar()
+            )
+            if snapshot is None or snapshot.data_version != data_version:
+                snapshot = self._load(db, user_id, snapshot)
+                snapshot.data_version = data_version
+
+            with self._lock:
+                self._snapshots[user_id] = snapshot
+                self._snapshots.move_to_end(user_id)
+                self._evict(keep=user_id)
+            return snapshot
+
+    @staticmethod
+    def _load(
+        db: Session, user_id: str, snapshot: HistorySnapshot | None
+    ) -> HistorySnapshot:
+        """
+        Refresh a copy of the snapshot, or load it from scratch when there is
+        none or plays were committed below its last id
+        """
+        stored = (
+            db.query(func.count(ListeningHistory.id))
+            .filter(ListeningHistory.user_id == user_id)
+            .scalar()
+        )
+        if snapshot is not None:
+            snapshot = snapshot.copy()
+            snapshot.refresh(db)
+            if len(snapshot.played_at) == stored:
+                return snapshot
+        snapshot = HistorySnapshot(user_id)
+        snapshot.refresh(db)
+        return snapshot
+
+    def invalidate(self, user_id: str) -> None:
+        """
+        Drop a user's snapshot, e.g. after history rows were deleted
+        """
+        with self._lock:
+            self._snapshots.pop(user_id, None)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(snapshot.nbytes for snapshot in self._snapshots.values())
+
+    def _evict(self, keep: str) -> None:
+        """
+        Drop least recently used snapshots until the cache fits the budget
+        """
+        while self.nbytes > self.budget_bytes and len(self._snapshots) > 1:
+            oldest = next(iter(self._snapshots))
+            if oldest == keep:
+                break
+            del self._snapshots[oldest]
+
+
+# Process-wide snapshot cache used by ColumnarInsightsGenerator by default
+snapshot_cache = SnapshotCache(settings.COLUMNAR_SNAPSHOT_BUDGET_MB * 1024 * 1024)
+
+
+class ColumnarInsightsGenerator(InsightsGenerator):
+    """
+    InsightsGenerator that computes the listening history sections (totals,
+    top-k, time stats, time of day, recent favorites, trends) with vectorized
+    operations over a cached snapshot instead of SQL scans. Sections based
+    on top items and audio features still use SQL.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        user_id: str,
+        cache: SnapshotCache | None = None,
+        **kwargs: Any,
+    ):
+        # Sections are computed from the snapshot, not combined SQL statements
+        kwargs["single_query"] = False
+        super().__init__(db, user_id, **kwargs)
+        self.cache = cache or snapshot_cache
+        self._history_snapshot: HistorySnapshot | None = None
+
+    def _snapshot(self) -> HistorySnapshot:
+        # Resolved once per generator, so a payload checks data_version once
+        if self._history_snapshot is None:
+            self._history_snapshot = self.cache.get(self.db, self.user_id)
+        return self._history_snapshot
+
+    def _get_total_tracks_listened(self) -> int:
+        return int(len(self._snapshot().played_at))
+
+    def _rank_codes(
+        self, codes: Any, keys: List[Tuple[Any, ...]], limit: int
+    ) -> List[Tuple[Tuple[Any, ...], int]]:
+        """
+        Top codes by count, ties broken on the group key like the SQL sections
+        """
+        counts = np.bincount(codes, minlength=len(keys))
+        played = np.flatnonzero(counts)
+        ranked = sorted(played, key=lambda code: (-counts[code], _sort_key(keys[code])))
+        return [(keys[code], int(counts[code])) for code in ranked[:limit]]
+
+    def _get_top_artists(self, limit: int = 5) -> List[Dict[str, Any]]:
+        snapshot = self._snapshot()
+        return [
+            {"artist_id": artist_id, "artist_name": artist_name, "listen_count": count}
+            for (artist_id, artist_name), count in self._rank_codes(
+                snapshot.artist_codes, snapshot.artist_keys, limit
+            )
+        ]
+
+    def _get_top_tracks(self, limit: int = 5) -> List[Dict[str, Any]]:
+        snapshot = self._snapshot()
+        return self._format_track_ranking(
+            self._rank_codes(snapshot.track_codes, snapshot.track_keys, limit)
+        )
+
+    def _get_recent_favorites(
+        self, days: int = 30, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        # Whole days from the cutoff day, like the rollup-based section
+        snapshot = self._snapshot()
+        cutoff_day = (datetime.now() - timedelta(days=days)).date()
+        cutoff_us = _to_epoch_us(datetime.combine(cutoff_day, datetime.min.time()))
+        recent = snapshot.played_at >= cutoff_us
+        return self._format_track_ranking(
+            self._rank_codes(snapshot.track_codes[recent], snapshot.track_keys, limit)
+        )
+
+    def _format_track_ranking(
+        self, ranking: List[Tuple[Tuple[Any, ...], int]]
+    ) -> List[Dict[str, Any]]:
+        return [
+            {
+                "track_id": track_id,
+                "track_name": track_name,
+                "artist_name": artist_name,
+                "listen_count": count,
+            }
+            for (track_id, track_name, artist_name), count in ranking
+        ]
+
+    def _get_listening_time_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot()
+        played = snapshot.played_at[snapshot.played_at != MISSING_PLAYED_AT]
+        if not len(played):
+            return self._format_listening_time_stats(0, None, None)
+
+        total_duration = int(
+            snapshot.duration_ms[snapshot.played_at != MISSING_PLAYED_AT].sum(
+                dtype=np.int64
+            )
+        )
+        return self._format_listening_time_stats(
+            total_duration,
+            _from_epoch_us(played.min()),
+            _from_epoch_us(played.max()),
+        )
+
+    def _get_listening_time_distribution(self) -> Dict[str, Any]:
+        snapshot = self._snapshot()
+        played = snapshot.played_at[snapshot.played_at != MISSING_PLAYED_AT]
+
+        hours = (played // MICROSECONDS_PER_HOUR) % 24
+        # 1970-01-01 was a Thursday; 0 = Sunday like SQL's day of week
+        days_of_week = (played // MICROSECONDS_PER_DAY + 4) % 7
+        grid = np.bincount(days_of_week * 24 + hours, minlength=7 * 24)
+
+        return self._format_listening_time_distribution(
+            [(cell // 24, cell % 24, int(grid[cell])) for cell in np.flatnonzero(grid)]
+        )
+
+    def _get_listening_trends(
+        self, granularity: str = "month", periods: int = 6
+    ) -> Dict[str, int]:
+        if granularity not in self.TREND_GRANULARITIES:
+            raise ValueError(f"Unsupported trend granularity: {granularity}")
+
+        snapshot = self._snapshot()
+        period_starts = self._get_trend_period_starts(granularity, periods)
+        edges = np.array(
+            [
+                _to_epoch_us(datetime.combine(start, datetime.min.time()))
+                for start in period_starts
+            ],
+            dtype=np.int64,
+        )
+
+        # Bucket index per play; plays before the first period get -1
+        buckets = np.searchsorted(edges, snapshot.played_at, side="right") - 1
+        counts = np.bincount(buckets[buckets >= 0], minlength=len(period_starts))
+
+        label_format = self.TREND_GRANULARITIES[granularity]
+        return {
+            start.strftime(label_format): int(count)
+            for start, count in zip(period_starts, counts)
+        }
+
+
+def insights_generator_class() -> Type[InsightsGenerator]:
+    """
+    InsightsGenerator class selected by the INSIGHTS_ENGINE setting
+    """
+    if settings.INSIGHTS_ENGINE == "columnar":
+        return ColumnarInsightsGenerator
+    return InsightsGenerator
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import AnyHttpUrl, PostgresDsn
 from pydantic_settings import BaseSettings
 
@@ -21,6 +23,96 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     FRONTEND_CALLBACK_URL: AnyHttpUrl
 
+    # Debug mode: adds diagnostics such as per-section timings to responses
+    DEBUG: bool = False
+
+    # Insights settings
+    # Threads shared by all requests for evaluating detailed insights sections
+    # concurrently; each running section holds one pooled DB connection
+    INSIGHTS_SECTION_WORKERS: int = 4
+    # Cached insights payloads kept per user (one per distinct query
+    # parameters); the least recently computed are dropped beyond this
+    INSIGHTS_CACHE_MAX_ENTRIES_PER_USER: int = 20
+    # Engine for the listening history sections: "sql" queries the database,
+    # "columnar" computes them from in-memory snapshots (needs numpy)
+    INSIGHTS_ENGINE: Literal["sql", "columnar"] = "sql"
+    # Memory budget for the columnar listening history snapshots (app.columnar)
+    COLUMNAR_SNAPSHOT_BUDGET_MB: int = 256
+
+    # Spotify HTTP client settings (app.spotify_client, app.spotify_http)
+    # Connections kept in the shared pool, across all Spotify hosts
+    SPOTIFY_HTTP_MAX_CONNECTIONS: int = 100
+    SPOTIFY_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    # Concurrent in-flight requests allowed per host (api / accounts), per
+    # client: the async pool and the blocking pool each apply it
+    SPOTIFY_HTTP_MAX_PER_HOST: int = 20
+    SPOTIFY_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    SPOTIFY_HTTP_TIMEOUT_SECONDS: float = 15.0
+    # Concurrent Spotify requests made on behalf of one user during a sync
+    SPOTIFY_PER_USER_CONCURRENCY: int = 3
+
+    # Spotify rate limiting (app.rate_limit)
+    # Requests per second and burst shared by all users; "local" limits each
+    # process, "database" shares one bucket between processes
+    SPOTIFY_RATE_LIMIT_PER_SECOND: float = 10.0
+    SPOTIFY_RATE_LIMIT_BURST: int = 20
+    SPOTIFY_RATE_LIMIT_BACKEND: Literal["local", "database"] = "local"
+    # Retries for 429 and 5xx responses, with exponential backoff for 5xx
+    SPOTIFY_MAX_RETRIES: int = 4
+    SPOTIFY_BACKOFF_BASE_SECONDS: float = 0.5
+    SPOTIFY_BACKOFF_MAX_SECONDS: float = 30.0
+
+    # Audio features cache settings (app.audio_features_cache)
+    # Track IDs remembered in-process as having features or a recent miss
+    AUDIO_FEATURES_CACHE_SIZE: int = 100_000
+    # Hours before a track Spotify had no features for is requested again
+    AUDIO_FEATURES_MISS_RETRY_HOURS: int = 7 * 24
+
+    # Sync job worker settings (app.jobs, worker.py)
+    # Seconds an idle worker waits before polling for pending jobs again
+    SYNC_WORKER_POLL_SECONDS: float = 2.0
+    # Running jobs without a progress update for this long are assumed lost
+    SYNC_JOB_STALE_MINUTES: int = 30
+
+    # Scheduled sync settings (app.scheduler, scheduler.py)
+    # Spotify requests per second the scheduled syncs may use in total, and
+    # the requests one sync is assumed to make
+    SCHEDULER_REQUESTS_PER_SECOND: float = 5.0
+    SCHEDULER_REQUESTS_PER_SYNC: int = 10
+    SCHEDULER_TICK_SECONDS: float = 10.0
+    # How often the per-user intervals are recomputed from listening history
+    SCHEDULER_REFRESH_MINUTES: int = 60
+    # Days of listening history the plays per hour are measured over
+    SCHEDULER_RATE_WINDOW_DAYS: int = 14
+    SCHEDULER_MIN_INTERVAL_MINUTES: int = 15
+    SCHEDULER_MAX_INTERVAL_HOURS: int = 24
+
+    # Background token refresher settings (app.token_refresher)
+    # Tokens expiring within the lead time are refreshed ahead of requests;
+    # keep it well above the 5 minute margin requests refresh inline at
+    TOKEN_REFRESHER_ENABLED: bool = True
+    TOKEN_REFRESHER_LEAD_MINUTES: int = 15
+    TOKEN_REFRESHER_INTERVAL_SECONDS: float = 60.0
+    # Concurrent refreshes, and users refreshed per scan
+    TOKEN_REFRESHER_CONCURRENCY: int = 4
+    TOKEN_REFRESHER_BATCH_SIZE: int = 200
+    # Minutes before a user whose refresh failed is tried again
+    TOKEN_REFRESHER_RETRY_MINUTES: int = 15
+
+    # Spotify profile cache settings (app.profile_cache)
+    # Profiles younger than the TTL are served as is; older ones up to the
+    # max stale age are served while being refreshed in the background
+    PROFILE_CACHE_TTL_SECONDS: int = 60 * 60
+    PROFILE_CACHE_MAX_STALE_SECONDS: int = 7 * 24 * 60 * 60
+
+    # Authenticated user cache settings (app.user_cache)
+    # Seconds a user's auth fields are served from cache; 0 disables it
+    USER_CACHE_TTL_SECONDS: int = 60
+    USER_CACHE_MAX_SIZE: int = 10_000
+    # Optional "module:attribute" of a shared backend object (get/set/delete),
+    # so invalidations reach every worker process; in-process LRU if unset
+    USER_CACHE_BACKEND: str | None = None
+
     # JWT Settings
     # Generate a strong secret key, e.g., using: openssl rand -hex 32
     JWT_SECRET_KEY: str
@@ -1,6 +1,10 @@
+from typing import Any
+
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import QueuePool
 
 from app.config import settings
@@ -32,3 +36,58 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Async driver for each database backend
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+_async_session_factory: async_sessionmaker[AsyncSession] | None = None
+
+
+def async_database_url(url: str) -> str:
+    """
+    The database URL with the backend's async driver, e.g.
+    postgresql+psycopg2://... -> postgresql+asyncpg://...
+    """
+    scheme, _, rest = url.partition("://")
+    backend = scheme.split("+")[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}://{rest}"
+
+
+def get_async_session_factory() -> async_sessionmaker[AsyncSession]:
+    """
+    Session factory on the async engine. Created on first use, so processes
+    that never take the async path (workers, scripts) need no async driver.
+    """
+    global _async_session_factory
+    if _async_session_factory is None:
+        async_engine = create_async_engine(
+            async_database_url(str(settings.DATABASE_URL)),
+            pool_size=5,
+            max_overflow=10,
+            pool_pre_ping=True,
+        )
+        _async_session_factory = async_sessionmaker(
+            async_engine, autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    """
+    Dependency to get an async database session.
+    Yields an AsyncSession and ensures it's closed after use.
+    """
+    async with get_async_session_factory()() as db:
+        yield db
+
+
+def dialect_insert(db: Session, model: Any) -> Any:
+    """
+    Return an INSERT construct for the session's dialect that supports
+    ON CONFLICT clauses (PostgreSQL in production, SQLite in tests).
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
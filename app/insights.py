@@ -1,10 +1,34 @@
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Tuple
-
-from sqlalchemy import desc, distinct, func
-from sqlalchemy.orm import Session
-
-from app.models import AudioFeatures, ListeningHistory, TopArtist, TopTrack
+import asyncio
+import copy
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple, Type, TypeVar
+
+from sqlalchemy import and_, case, desc, extract, func, literal, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query, Session
+
+from app.config import settings
+from app.models import (
+    AudioFeatures,
+    DailyArtistRollup,
+    DailyListeningRollup,
+    DailyTrackRollup,
+    ListeningHistory,
+    TopArtist,
+    TopTrack,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Bounded pool shared across requests for parallel section evaluation
+_section_executor = ThreadPoolExecutor(
+    max_workers=settings.INSIGHTS_SECTION_WORKERS, thread_name_prefix="insights"
+)
 
 
 class InsightsGenerator:
@@ -12,20 +36,89 @@ class InsightsGenerator:
     Class to generate insights from user's Spotify data
     """
 
-    def __init__(self, db: Session, user_id: str):
+    # Audio features averaged in the basic insights payload
+    AUDIO_FEATURE_FIELDS = [
+        "danceability",
+        "energy",
+        "speechiness",
+        "acousticness",
+        "instrumentalness",
+        "liveness",
+        "valence",
+    ]
+
+    # Hour ranges [start, end) for the time-of-day buckets
+    TIME_OF_DAY_RANGES = {
+        "morning": (6, 12),  # 6 AM - 12 PM
+        "afternoon": (12, 18),  # 12 PM - 6 PM
+        "evening": (18, 24),  # 6 PM - 12 AM
+        "night": (0, 6),  # 12 AM - 6 AM
+    }
+
+    # Default popularity brackets [min, max) on Spotify's 0-100 scale
+    POPULARITY_BRACKETS = {
+        "mainstream": (80, 101),  # Very popular (inclusive of 100)
+        "popular": (60, 80),  # Popular
+        "mixed": (40, 60),  # Moderate popularity
+        "niche": (20, 40),  # Less popular
+        "obscure": (0, 20),  # Very obscure
+    }
+
+    # Supported listening trend buckets and their label formats
+    TREND_GRANULARITIES = {
+        "day": "%Y-%m-%d",
+        "week": "%Y-%m-%d",
+        "month": "%Y-%m",
+    }
+
+    # Row order of the day-of-week x hour heatmap
+    WEEKDAY_NAMES = [
+        "monday",
+        "tuesday",
+        "wednesday",
+        "thursday",
+        "friday",
+        "saturday",
+        "sunday",
+    ]
+
+    def __init__(
+        self,
+        db: Session,
+        user_id: str,
+        single_query: bool = False,
+        weight_features_by_plays: bool = False,
+        session_factory: Callable[[], Session] | None = None,
+    ):
+        """
+        single_query: compute the basic insights payload with two aggregate
+        statements instead of one query per section
+        weight_features_by_plays: average audio features over every play
+        instead of once per distinct track
+        session_factory: when given, detailed insights sections run
+        concurrently, each on its own session from this factory
+        """
         self.db = db
         self.user_id = user_id
+        self.single_query = single_query
+        self.weight_features_by_plays = weight_features_by_plays
+        self.session_factory = session_factory
+        self._audio_feature_averages: Any = None
 
     def get_basic_insights(self) -> Dict[str, Any]:
         """
         Generate basic insights about user's listening history
         """
+        if self.single_query:
+            return self._get_basic_insights_single_query()
+
+        time_distribution = self._get_listening_time_distribution()
         insights: Dict[str, Any] = {
             "total_tracks_listened": self._get_total_tracks_listened(),
             "top_artists": self._get_top_artists(),
             "top_tracks": self._get_top_tracks(),
             "listening_time_stats": self._get_listening_time_stats(),
-            "listening_by_time_of_day": self._get_listening_by_time_of_day(),
+            **time_distribution,
             "recent_favorites": self._get_recent_favorites(),
             "audio_features_averages": self._get_audio_features_averages(),
         }
@@ -44,17 +137,21 @@ class InsightsGenerator:
 
     def _get_top_artists(self, limit: int = 5) -> List[Dict[str, Any]]:
         """
-        Get the top 5 most listened artists overall
+        Get the top 5 most listened artists overall (from the daily artist rollup)
         """
         results = (
             self.db.query(
-                ListeningHistory.artist_id,
-                ListeningHistory.artist_name,
-                func.count(ListeningHistory.id).label("listen_count"),
+                DailyArtistRollup.artist_id,
+                DailyArtistRollup.artist_name,
+                func.sum(DailyArtistRollup.play_count).label("listen_count"),
+            )
+            .filter(DailyArtistRollup.user_id == self.user_id)
+            .group_by(DailyArtistRollup.artist_id, DailyArtistRollup.artist_name)
+            .order_by(
+                desc("listen_count"),
+                DailyArtistRollup.artist_id,
+                DailyArtistRollup.artist_name,
             )
-            .filter(ListeningHistory.user_id == self.user_id)
-            .group_by(ListeningHistory.artist_id, ListeningHistory.artist_name)
-            .order_by(desc("listen_count"))
             .limit(limit)
             .all()
         )
@@ -63,29 +160,44 @@ class InsightsGenerator:
             {
                 "artist_id": r.artist_id,
                 "artist_name": r.artist_name,
-                "listen_count": r.listen_count,
+                "listen_count": int(r.listen_count),
             }
             for r in results
         ]
 
     def _get_top_tracks(self, limit: int = 5) -> List[Dict[str, Any]]:
         """
-        Get the top 5 most listened tracks overall
+        Get the top 5 most listened tracks overall (from the daily track rollup)
+        """
+        return self._query_top_tracks_from_rollup(limit)
+
+    def _query_top_tracks_from_rollup(
+        self, limit: int, since: date | None = None
+    ) -> List[Dict[str, Any]]:
         """
+        Rank tracks by summed daily play counts, optionally from a given day on
+        """
+        query = self.db.query(
+            DailyTrackRollup.track_id,
+            DailyTrackRollup.track_name,
+            DailyTrackRollup.artist_name,
+            func.sum(DailyTrackRollup.play_count).label("listen_count"),
+        ).filter(DailyTrackRollup.user_id == self.user_id)
+        if since is not None:
+            query = query.filter(DailyTrackRollup.day >= since)
+
         results = (
-            self.db.query(
-                ListeningHistory.track_id,
-                ListeningHistory.track_name,
-                ListeningHistory.artist_name,
-                func.count(ListeningHistory.id).label("listen_count"),
+            query.group_by(
+                DailyTrackRollup.track_id,
+                DailyTrackRollup.track_name,
+                DailyTrackRollup.artist_name,
             )
-            .filter(ListeningHistory.user_id == self.user_id)
-            .group_by(
-                ListeningHistory.track_id,
-                ListeningHistory.track_name,
-                ListeningHistory.artist_name,
+            .order_by(
+                desc("listen_count"),
+                DailyTrackRollup.track_id,
+                DailyTrackRollup.track_name,
+                DailyTrackRollup.artist_name,
             )
-            .order_by(desc("listen_count"))
             .limit(limit)
             .all()
         )
@@ -95,7 +207,7 @@ class InsightsGenerator:
                 "track_id": r.track_id,
                 "track_name": r.track_name,
                 "artist_name": r.artist_name,
-                "listen_count": r.listen_count,
+                "listen_count": int(r.listen_count),
             }
             for r in results
         ]
@@ -104,29 +216,31 @@ class InsightsGenerator:
         """
         Get stats about listening time (total, average per day, etc.)
         """
-        # Get total duration in ms
-        total_duration = (
-            self.db.query(func.sum(ListeningHistory.duration_ms))
-            .filter(ListeningHistory.user_id == self.user_id)
-            .scalar()
-            or 0
+        # Total duration in ms and earliest/latest listen from the daily rollup
+        totals = (
+            self.db.query(
+                func.sum(DailyListeningRollup.total_duration_ms).label(
+                    "total_duration"
+                ),
+                func.min(DailyListeningRollup.first_played_at).label("earliest"),
+                func.max(DailyListeningRollup.last_played_at).label("latest"),
+            )
+            .filter(DailyListeningRollup.user_id == self.user_id)
+            .one()
         )
 
-        # Convert to hours
-        total_hours = total_duration / (1000 * 60 * 60)
-
-        # Get earliest and latest listen
-        earliest = (
-            self.db.query(func.min(ListeningHistory.played_at))
-            .filter(ListeningHistory.user_id == self.user_id)
-            .scalar()
+        return self._format_listening_time_stats(
+            int(totals.total_duration or 0), totals.earliest, totals.latest
         )
 
-        latest = (
-            self.db.query(func.max(ListeningHistory.played_at))
-            .filter(ListeningHistory.user_id == self.user_id)
-            .scalar()
-        )
+    def _format_listening_time_stats(
+        self, total_duration: int, earliest: datetime | None, latest: datetime | None
+    ) -> Dict[str, Any]:
+        """
+        Build the listening time stats payload from the raw aggregates
+        """
+        # Convert to hours
+        total_hours = total_duration / (1000 * 60 * 60)
 
         # Calculate days of data
         days_of_data = 1  # Default to 1 to avoid division by zero
@@ -149,136 +263,407 @@ class InsightsGenerator:
         """
         Get listening patterns by time of day
         """
-        # Define time ranges
-        time_ranges = {
-            "morning": (6, 12),  # 6 AM - 12 PM
-            "afternoon": (12, 18),  # 12 PM - 6 PM
-            "evening": (18, 24),  # 6 PM - 12 AM
-            "night": (0, 6),  # 12 AM - 6 AM
-        }
-
-        # Initialize results
-        results: Dict[str, int] = {period: 0 for period in time_ranges.keys()}
-
-        # Query all played times
-        played_time_tuples = (
-            self.db.query(ListeningHistory.played_at)
-            .filter(ListeningHistory.user_id == self.user_id)
-            .all()
-        )
+        return self._get_listening_time_distribution()["listening_by_time_of_day"]
 
-        # Count plays in each time range
-        for pt_tuple in played_time_tuples:
-            played_at_time = pt_tuple[
-                0
-            ]  # Querying a single column returns a list of tuples
-            if isinstance(played_at_time, datetime):
-                hour = played_at_time.hour
-                for period, (start, end) in time_ranges.items():
-                    if start <= hour < end:
-                        results[period] += 1
-                        break
-            # else: Consider logging or handling if played_at_time is not a datetime object
-
-        return results
-
-    def _get_recent_favorites(
-        self, days: int = 30, limit: int = 5
-    ) -> List[Dict[str, Any]]:
+    def _get_listening_time_distribution(self) -> Dict[str, Any]:
         """
-        Get the most listened tracks in the last 30 days
+        Get the time-of-day buckets, the 24-hour histogram and the
+        day-of-week x hour heatmap from one grouped query
         """
-        cutoff_date = datetime.now() - timedelta(days=days)
-
-        results = (
+        grid_rows = (
             self.db.query(
-                ListeningHistory.track_id,
-                ListeningHistory.track_name,
-                ListeningHistory.artist_name,
+                extract("dow", ListeningHistory.played_at).label("dow"),
+                extract("hour", ListeningHistory.played_at).label("hour"),
                 func.count(ListeningHistory.id).label("listen_count"),
             )
             .filter(
                 ListeningHistory.user_id == self.user_id,
-                ListeningHistory.played_at >= cutoff_date,
-            )
-            .group_by(
-                ListeningHistory.track_id,
-                ListeningHistory.track_name,
-                ListeningHistory.artist_name,
+                ListeningHistory.played_at.isnot(None),
             )
-            .order_by(desc("listen_count"))
-            .limit(limit)
+            .group_by("dow", "hour")
             .all()
         )
 
-        return [
-            {
-                "track_id": r.track_id,
-                "track_name": r.track_name,
-                "artist_name": r.artist_name,
-                "listen_count": r.listen_count,
-            }
-            for r in results
-        ]
+        return self._format_listening_time_distribution(
+            [(r.dow, r.hour, r.listen_count) for r in grid_rows]
+        )
+
+    def _format_listening_time_distribution(
+        self, grid_rows: List[Tuple[Any, Any, int]]
+    ) -> Dict[str, Any]:
+        """
+        Build the time-of-day payloads from (day of week, hour, count) rows.
+        Day of week follows SQL's convention of 0 = Sunday.
+        """
+        by_hour: List[int] = [0] * 24
+        heatmap: Dict[str, List[int]] = {day: [0] * 24 for day in self.WEEKDAY_NAMES}
+        sunday_first_days = self.WEEKDAY_NAMES[-1:] + self.WEEKDAY_NAMES[:-1]
+
+        for dow, hour, listen_count in grid_rows:
+            if dow is None or hour is None:
+                continue
+            by_hour[int(hour)] += listen_count
+            heatmap[sunday_first_days[int(dow)]][int(hour)] += listen_count
+
+        by_time_of_day: Dict[str, int] = {
+            period: sum(by_hour[start:end])
+            for period, (start, end) in self.TIME_OF_DAY_RANGES.items()
+        }
+
+        return {
+            "listening_by_time_of_day": by_time_of_day,
+            "listening_by_hour": by_hour,
+            "listening_heatmap": heatmap,
+        }
+
+    def _get_recent_favorites(
+        self, days: int = 30, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the most listened tracks in the last 30 days.
+        Counted in whole days from the daily track rollup, so plays from
+        earlier in the cutoff day are included.
+        """
+        cutoff_day = (datetime.now() - timedelta(days=days)).date()
+        return self._query_top_tracks_from_rollup(limit, since=cutoff_day)
 
     def _get_audio_features_averages(self) -> Dict[str, float]:
         """
         Get average audio features for user's listening history
         """
-        # Get all track IDs from user's listening history
-        track_ids_tuples = (
-            self.db.query(distinct(ListeningHistory.track_id))
+        averages = self._get_audio_feature_averages_row()
+        if not averages.sample_count:
+            return {}
+
+        return self._format_audio_features_averages(
+            {field: getattr(averages, field) for field in self.AUDIO_FEATURE_FIELDS}
+        )
+
+    def _audio_feature_averages_query(self) -> Query[Any]:
+        """
+        Averages of every audio feature over the user's history as one join.
+        Averages are per distinct track by default, or per play when
+        weight_features_by_plays is set; sample_count is 0 without history.
+        """
+        feature_columns = [
+            func.avg(getattr(AudioFeatures, field)).label(field)
+            for field in self.AUDIO_FEATURE_FIELDS
+        ]
+
+        if self.weight_features_by_plays:
+            return (
+                self.db.query(
+                    func.count(ListeningHistory.id).label("sample_count"),
+                    *feature_columns,
+                )
+                .select_from(ListeningHistory)
+                .outerjoin(
+                    AudioFeatures, AudioFeatures.track_id == ListeningHistory.track_id
+                )
+                .filter(ListeningHistory.user_id == self.user_id)
+            )
+
+        played_tracks = (
+            self.db.query(ListeningHistory.track_id)
             .filter(ListeningHistory.user_id == self.user_id)
-            .all()
+            .distinct()
+            .subquery("played_tracks")
+        )
+        return (
+            self.db.query(func.count().label("sample_count"), *feature_columns)
+            .select_from(played_tracks)
+            .outerjoin(
+                AudioFeatures, AudioFeatures.track_id == played_tracks.c.track_id
+            )
         )
-        track_ids: List[str] = [r[0] for r in track_ids_tuples]
 
-        if not track_ids:
-            return {}
+    def _get_audio_feature_averages_row(self) -> Any:
+        """
+        Run the audio feature averages query once per generator; it feeds both
+        the basic averages and the mood analysis
+        """
+        if self._audio_feature_averages is None:
+            self._audio_feature_averages = self._audio_feature_averages_query().one()
+        return self._audio_feature_averages
 
-        # Calculate averages for each audio feature
-        feature_fields = [
-            "danceability",
-            "energy",
-            "speechiness",
-            "acousticness",
-            "instrumentalness",
-            "liveness",
-            "valence",
+    def _format_audio_features_averages(
+        self, raw_averages: Dict[str, float | None]
+    ) -> Dict[str, float]:
+        """
+        Round raw feature averages, treating missing averages as 0.0
+        """
+        avg_results: Dict[str, float] = {}
+        for field in self.AUDIO_FEATURE_FIELDS:
+            avg_value = raw_averages.get(field)
+            avg_results[field] = round(avg_value if avg_value is not None else 0.0, 3)
+
+        return avg_results
+
+    def _get_basic_insights_single_query(
+        self, limit: int = 5, recent_days: int = 30
+    ) -> Dict[str, Any]:
+        """
+        Compute the basic insights payload in two statements: one for the
+        totals and the play time grid, one for the ranked top-k sections.
+        Returns the same shape as the per-section path.
+        """
+        user_filter = ListeningHistory.user_id == self.user_id
+
+        # Statement 1: the (day of week, hour) play grid, left-joined onto
+        # one row of listening time totals from the daily rollup and audio
+        # feature averages so an empty history still returns the totals
+        time_grid = (
+            self.db.query(
+                extract("dow", ListeningHistory.played_at).label("dow"),
+                extract("hour", ListeningHistory.played_at).label("hour"),
+                func.count(ListeningHistory.id).label("listen_count"),
+            )
+            .filter(user_filter)
+            .group_by("dow", "hour")
+            .cte("time_grid")
+        )
+
+        rollup_totals = (
+            self.db.query(
+                func.sum(DailyListeningRollup.total_duration_ms).label(
+                    "total_duration"
+                ),
+                func.min(DailyListeningRollup.first_played_at).label("earliest"),
+                func.max(DailyListeningRollup.last_played_at).label("latest"),
+            )
+            .filter(DailyListeningRollup.user_id == self.user_id)
+            .cte("rollup_totals")
+        )
+
+        feature_totals = self._audio_feature_averages_query().cte("feature_totals")
+
+        totals_rows = (
+            self.db.query(rollup_totals, feature_totals, time_grid)
+            .select_from(rollup_totals)
+            .join(feature_totals, true())
+            .outerjoin(time_grid, true())
+            .all()
+        )
+        totals = totals_rows[0]
+        grid_rows = [
+            (r.dow, r.hour, r.listen_count)
+            for r in totals_rows
+            if r.listen_count is not None
         ]
+        total_tracks = sum(listen_count for _, _, listen_count in grid_rows)
+
+        # Statement 2: top artists, top tracks and recent favorites ranked
+        # from the rollups with a window function, as a single result set
+        cutoff_day = (datetime.now() - timedelta(days=recent_days)).date()
+        artist_count = func.sum(DailyArtistRollup.play_count)
+        track_count = func.sum(DailyTrackRollup.play_count)
+        track_columns = (
+            DailyTrackRollup.track_id,
+            DailyTrackRollup.track_name,
+            DailyTrackRollup.artist_name,
+        )
 
-        avg_results: Dict[str, float] = {}
-        for field in feature_fields:
-            avg_value_query_result = (
-                self.db.query(func.avg(getattr(AudioFeatures, field)))
-                .filter(AudioFeatures.track_id.in_(track_ids))
-                .scalar()
+        top_artists_ranked = (
+            self.db.query(
+                literal("top_artists").label("section"),
+                DailyArtistRollup.artist_id.label("item_id"),
+                DailyArtistRollup.artist_name.label("item_name"),
+                DailyArtistRollup.artist_name.label("artist_name"),
+                artist_count.label("listen_count"),
+                func.row_number()
+                .over(
+                    order_by=(
+                        artist_count.desc(),
+                        DailyArtistRollup.artist_id,
+                        DailyArtistRollup.artist_name,
+                    )
+                )
+                .label("rank"),
             )
-            avg_value = (
-                avg_value_query_result if avg_value_query_result is not None else 0.0
+            .filter(DailyArtistRollup.user_id == self.user_id)
+            .group_by(DailyArtistRollup.artist_id, DailyArtistRollup.artist_name)
+        )
+
+        def ranked_tracks(section: str, *filters: Any) -> Query[Any]:
+            return (
+                self.db.query(
+                    literal(section).label("section"),
+                    DailyTrackRollup.track_id.label("item_id"),
+                    DailyTrackRollup.track_name.label("item_name"),
+                    DailyTrackRollup.artist_name.label("artist_name"),
+                    track_count.label("listen_count"),
+                    func.row_number()
+                    .over(order_by=(track_count.desc(), *track_columns))
+                    .label("rank"),
+                )
+                .filter(DailyTrackRollup.user_id == self.user_id, *filters)
+                .group_by(*track_columns)
             )
 
-            avg_results[field] = round(avg_value, 3)
+        ranked = top_artists_ranked.union_all(
+            ranked_tracks("top_tracks"),
+            ranked_tracks("recent_favorites", DailyTrackRollup.day >= cutoff_day),
+        ).subquery("ranked")
 
-        return avg_results
+        ranked_rows = (
+            self.db.query(ranked)
+            .filter(ranked.c.rank <= limit)
+            .order_by(ranked.c.section, ranked.c.rank)
+            .all()
+        )
+
+        sections: Dict[str, List[Dict[str, Any]]] = {
+            "top_artists": [],
+            "top_tracks": [],
+            "recent_favorites": [],
+        }
+        for r in ranked_rows:
+            if r.section == "top_artists":
+                sections["top_artists"].append(
+                    {
+                        "artist_id": r.item_id,
+                        "artist_name": r.item_name,
+                        "listen_count": int(r.listen_count),
+                    }
+                )
+            else:
+                sections[r.section].append(
+                    {
+                        "track_id": r.item_id,
+                        "track_name": r.item_name,
+                        "artist_name": r.artist_name,
+                        "listen_count": int(r.listen_count),
+                    }
+                )
+
+        # Assemble the payload in the same order as the per-section path
+        has_history = total_tracks > 0
+        return {
+            "total_tracks_listened": total_tracks,
+            "top_artists": sections["top_artists"],
+            "top_tracks": sections["top_tracks"],
+            "listening_time_stats": self._format_listening_time_stats(
+                int(totals.total_duration or 0), totals.earliest, totals.latest
+            ),
+            **self._format_listening_time_distribution(grid_rows),
+            "recent_favorites": sections["recent_favorites"],
+            "audio_features_averages": (
+                self._format_audio_features_averages(
+                    {
+                        field: getattr(totals, field)
+                        for field in self.AUDIO_FEATURE_FIELDS
+                    }
+                )
+                if has_history
+                else {}
+            ),
+        }
 
-    def get_detailed_insights(self) -> Dict[str, Any]:
+    def get_detailed_insights(
+        self,
+        granularity: str = "month",
+        periods: int = 6,
+        popularity_brackets: Dict[str, Tuple[int, int]] | None = None,
+    ) -> Dict[str, Any]:
         """
         Generate more detailed insights about user's listening habits
+        granularity: 'day', 'week' or 'month' buckets for the listening trends
+        periods: number of trend buckets, ending with the current one
+        popularity_brackets: custom [min, max) popularity distribution brackets
         """
-        basic_insights = self.get_basic_insights()
+        sections = self._detailed_sections(granularity, periods, popularity_brackets)
+        results, timings = self._evaluate_sections(sections)
+        return self._combine_detailed_sections(self.user_id, results, timings)
+
+    @staticmethod
+    def _detailed_sections(
+        granularity: str,
+        periods: int,
+        popularity_brackets: Dict[str, Tuple[int, int]] | None,
+    ) -> Dict[str, Callable[["InsightsGenerator"], Any]]:
+        """
+        Independent sections of the detailed insights payload, in order
+        """
+        return {
+            "basic": lambda g: g.get_basic_insights(),
+            "genre_distribution": lambda g: g._get_genre_distribution(),
+            f"listening_trends_by_{granularity}": lambda g: g._get_listening_trends(
+                granularity, periods
+            ),
+            "popular_vs_obscure": lambda g: g._get_popular_vs_obscure_ratio(
+                popularity_brackets
+            ),
+            "mood_analysis": lambda g: g._analyze_mood_based_on_features(),
+        }
 
+    @staticmethod
+    def _combine_detailed_sections(
+        user_id: str, results: Dict[str, Any], timings: Dict[str, float]
+    ) -> Dict[str, Any]:
         # Add more detailed insights
-        detailed_insights: Dict[str, Any] = {
-            **basic_insights,
-            "genre_distribution": self._get_genre_distribution(),
-            "listening_trends_by_month": self._get_listening_trends_by_month(),
-            "popular_vs_obscure": self._get_popular_vs_obscure_ratio(),
-            "mood_analysis": self._analyze_mood_based_on_features(),
-        }
+        detailed_insights: Dict[str, Any] = {**results.pop("basic"), **results}
+
+        logger.debug(f"Detailed insights section timings (ms) for {user_id}: {timings}")
+        if settings.DEBUG:
+            detailed_insights["section_timings_ms"] = timings
 
         return detailed_insights
 
+    def _evaluate_sections(
+        self, sections: Dict[str, Callable[["InsightsGenerator"], Any]]
+    ) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """
+        Evaluate independent insight sections and time each one.
+        Runs them one after another on this generator's session, or
+        concurrently on their own sessions when a session_factory is set.
+        Returns results and timings keyed and ordered like sections.
+        """
+        if self.session_factory is None:
+            results: Dict[str, Any] = {}
+            timings: Dict[str, float] = {}
+            for name, section in sections.items():
+                started = time.perf_counter()
+                results[name] = section(self)
+                timings[name] = round((time.perf_counter() - started) * 1000, 2)
+            return results, timings
+
+        futures = {
+            name: _section_executor.submit(
+                self._run_section_on_own_session, self.session_factory, section
+            )
+            for name, section in sections.items()
+        }
+        results = {}
+        timings = {}
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+        return results, timings
+
+    def _run_section_on_own_session(
+        self,
+        session_factory: Callable[[], Session],
+        section: Callable[["InsightsGenerator"], Any],
+    ) -> Tuple[Any, float]:
+        """
+        Run one section on a fresh session from the session factory
+        """
+        started = time.perf_counter()
+        db = session_factory()
+        try:
+            result = section(self._with_session(db))
+        finally:
+            db.close()
+        return result, round((time.perf_counter() - started) * 1000, 2)
+
+    def _with_session(self, db: Session) -> "InsightsGenerator":
+        """
+        Copy of this generator, with the same options, bound to another session
+        """
+        generator = copy.copy(self)
+        generator.db = db
+        generator._audio_feature_averages = None
+        return generator
+
     def _get_genre_distribution(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
         Get the distribution of genres based on top artists
@@ -319,116 +704,164 @@ class InsightsGenerator:
         """
         Get listening trends by month for the last N months
         """
-        result: Dict[str, int] = {}
-        now = datetime.now()
-
-        for i in range(months - 1, -1, -1):
-            current_month_zero_indexed = now.month - 1
+        return self._get_listening_trends("month", months)
 
-            # Calculate total months from year 0 up to current month, then subtract i
-            total_months_from_epoch_current = now.year * 12 + current_month_zero_indexed
-            total_months_from_epoch_target = total_months_from_epoch_current - i
+    def _get_listening_trends(
+        self, granularity: str = "month", periods: int = 6
+    ) -> Dict[str, int]:
+        """
+        Get play counts for the last N days, weeks or months in one grouped
+        query over the daily rollup; periods without plays are filled with 0.
+        Months are labelled YYYY-MM, days and weeks (starting Monday) YYYY-MM-DD.
+        """
+        if granularity not in self.TREND_GRANULARITIES:
+            raise ValueError(f"Unsupported trend granularity: {granularity}")
 
-            target_year = total_months_from_epoch_target // 12
-            target_month_one_indexed = (total_months_from_epoch_target % 12) + 1
+        period_starts = self._get_trend_period_starts(granularity, periods)
+        period_start = self._truncate_day_expression(granularity).label("period_start")
 
-            month_start_dt = datetime(
-                target_year, target_month_one_indexed, 1, 0, 0, 0, 0
+        results = (
+            self.db.query(
+                period_start,
+                func.sum(DailyListeningRollup.play_count).label("listen_count"),
+            )
+            .filter(
+                DailyListeningRollup.user_id == self.user_id,
+                DailyListeningRollup.day >= period_starts[0],
             )
+            .group_by("period_start")
+            .all()
+        )
 
-            if target_month_one_indexed == 12:
-                next_month_start_dt = datetime(target_year + 1, 1, 1, 0, 0, 0, 0)
-            else:
-                next_month_start_dt = datetime(
-                    target_year, target_month_one_indexed + 1, 1, 0, 0, 0, 0
-                )
+        label_format = self.TREND_GRANULARITIES[granularity]
+        counts: Dict[str, int] = {
+            self._to_date(r.period_start).strftime(label_format): int(r.listen_count)
+            for r in results
+        }
 
-            # Determine month_end_dt
-            # If this iteration is for the current calendar month (i.e., i=0 and calculated year/month match now's year/month)
-            # then the end date is 'now'. Otherwise, it's the start of the next month.
-            if (
-                i == 0
-                and target_year == now.year
-                and target_month_one_indexed == now.month
-            ):
-                month_end_dt = now
-            else:
-                month_end_dt = next_month_start_dt
+        return {
+            start.strftime(label_format): counts.get(start.strftime(label_format), 0)
+            for start in period_starts
+        }
 
-            month_label = month_start_dt.strftime("%Y-%m")
+    def _get_trend_period_starts(self, granularity: str, periods: int) -> List[date]:
+        """
+        Get the first day of each of the last N periods, oldest first
+        """
+        today = datetime.now().date()
 
-            count = (
-                self.db.query(ListeningHistory)
-                .filter(
-                    ListeningHistory.user_id == self.user_id,
-                    ListeningHistory.played_at >= month_start_dt,
-                    ListeningHistory.played_at < month_end_dt,
-                )
-                .count()
-            )
-            result[month_label] = count
-        return result
+        if granularity == "day":
+            return [today - timedelta(days=i) for i in range(periods - 1, -1, -1)]
 
-    def _get_popular_vs_obscure_ratio(self) -> Dict[str, Any]:
+        if granularity == "week":
+            this_week = today - timedelta(days=today.weekday())
+            return [this_week - timedelta(weeks=i) for i in range(periods - 1, -1, -1)]
+
+        # Count months from year 0 so subtracting i crosses year boundaries
+        current_month_index = today.year * 12 + today.month - 1
+        return [
+            date((current_month_index - i) // 12, (current_month_index - i) % 12 + 1, 1)
+            for i in range(periods - 1, -1, -1)
+        ]
+
+    def _truncate_day_expression(self, granularity: str) -> Any:
+        """
+        SQL expression truncating the rollup day to the start of its period
+        """
+        if self.db.get_bind().dialect.name == "postgresql":
+            return func.date_trunc(granularity, DailyListeningRollup.day)
+
+        # SQLite stores dates as YYYY-MM-DD text
+        if granularity == "day":
+            return DailyListeningRollup.day
+        if granularity == "week":
+            return func.date(DailyListeningRollup.day, "weekday 0", "-6 days")
+        return func.strftime("%Y-%m-01", DailyListeningRollup.day)
+
+    def _to_date(self, value: Any) -> date:
+        """
+        Normalize a truncated period value (date, datetime or ISO text) to a date
+        """
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return date.fromisoformat(str(value)[:10])
+
+    def _get_popular_vs_obscure_ratio(
+        self, brackets: Dict[str, Tuple[int, int]] | None = None
+    ) -> Dict[str, Any]:
         """
         Analyze the ratio of popular vs obscure music in the user's listening
         Based on Spotify's popularity score (0-100)
+        brackets: label -> [min, max) popularity ranges, defaults to
+        POPULARITY_BRACKETS; see make_popularity_brackets for even buckets
         """
-        # Get average popularity from top tracks
-        avg_popularity_query_result = (
-            self.db.query(func.avg(TopTrack.popularity))
+        brackets = brackets or self.POPULARITY_BRACKETS
+        popularity = TopTrack.popularity
+
+        # Average popularity and every bracket count in one aggregate
+        bracket_columns = [
+            func.sum(
+                case(
+                    # max_pop is exclusive
+                    (and_(popularity >= min_pop, popularity < max_pop), 1),
+                    else_=0,
+                )
+            ).label(f"bracket_{i}")
+            for i, (min_pop, max_pop) in enumerate(brackets.values())
+        ]
+        result = (
+            self.db.query(
+                func.avg(popularity).label("average_popularity"), *bracket_columns
+            )
             .filter(
                 TopTrack.user_id == self.user_id,
                 TopTrack.term.in_(["short_term", "medium_term"]),
             )
-            .scalar()
+            .one()
         )
+
         avg_popularity = (
-            avg_popularity_query_result
-            if avg_popularity_query_result is not None
-            else 50.0
+            result.average_popularity if result.average_popularity is not None else 50.0
         )
-
-        brackets = {
-            "mainstream": (80, 101),  # Very popular (inclusive of 100)
-            "popular": (60, 80),  # Popular
-            "mixed": (40, 60),  # Moderate popularity
-            "niche": (20, 40),  # Less popular
-            "obscure": (0, 20),  # Very obscure
+        counts: Dict[str, int] = {
+            label: int(getattr(result, f"bracket_{i}") or 0)
+            for i, label in enumerate(brackets)
         }
 
-        counts: Dict[str, int] = {}
-        for label, (min_pop, max_pop) in brackets.items():
-            count = (
-                self.db.query(TopTrack)
-                .filter(
-                    TopTrack.user_id == self.user_id,
-                    TopTrack.popularity >= min_pop,
-                    TopTrack.popularity < max_pop,  # max_pop is exclusive
-                    TopTrack.term.in_(["short_term", "medium_term"]),
-                )
-                .count()
-            )
-            counts[label] = count
-
         return {
             "average_popularity": round(avg_popularity, 1),
             "popularity_distribution": counts,
         }
 
+    @staticmethod
+    def make_popularity_brackets(width: int = 10) -> Dict[str, Tuple[int, int]]:
+        """
+        Build evenly sized popularity brackets, most popular first,
+        e.g. width=10 gives deciles labelled "90-100", "80-89", ..., "0-9"
+        """
+        if not 1 <= width <= 100:
+            raise ValueError(f"Popularity bracket width must be 1-100, got {width}")
+
+        brackets: Dict[str, Tuple[int, int]] = {}
+        for min_pop in reversed(range(0, 100, width)):
+            max_pop = min(min_pop + width, 100)
+            # The top bracket includes 100
+            if max_pop == 100:
+                brackets[f"{min_pop}-100"] = (min_pop, 101)
+            else:
+                brackets[f"{min_pop}-{max_pop - 1}"] = (min_pop, max_pop)
+        return brackets
+
     def _analyze_mood_based_on_features(self) -> Dict[str, Any]:
         """
         Analyze the overall mood of the user's music based on audio features
         """
-        track_ids_tuples = (
-            self.db.query(distinct(ListeningHistory.track_id))
-            .filter(ListeningHistory.user_id == self.user_id)
-            .all()
-        )
-        track_ids: List[str] = [r[0] for r in track_ids_tuples]
+        averages = self._get_audio_feature_averages_row()
 
-        if not track_ids:
-            # Return a default structure if no track_ids to avoid errors downstream
+        if not averages.sample_count:
+            # Return a default structure if there is no history to avoid errors downstream
             return {
                 "primary_mood": "Unknown",
                 "mood_indicators": {
@@ -440,28 +873,11 @@ class InsightsGenerator:
                 "mood_quadrant_values": {"valence": 0.0, "energy": 0.0},
             }
 
-        # Get average values for mood-related features
-        avg_valence_qr = (
-            self.db.query(func.avg(AudioFeatures.valence))  # type: ignore
-            .filter(AudioFeatures.track_id.in_(track_ids))
-            .scalar()
-        )
-        avg_valence = avg_valence_qr if avg_valence_qr is not None else 0.5
-
-        avg_energy_qr = (
-            self.db.query(func.avg(AudioFeatures.energy))  # type: ignore
-            .filter(AudioFeatures.track_id.in_(track_ids))
-            .scalar()
-        )
-        avg_energy = avg_energy_qr if avg_energy_qr is not None else 0.5
-
-        avg_danceability_qr = (
-            self.db.query(func.avg(AudioFeatures.danceability))  # type: ignore
-            .filter(AudioFeatures.track_id.in_(track_ids))
-            .scalar()
-        )
+        # Average values for mood-related features, 0.5 when none are known
+        avg_valence = averages.valence if averages.valence is not None else 0.5
+        avg_energy = averages.energy if averages.energy is not None else 0.5
         avg_danceability = (
-            avg_danceability_qr if avg_danceability_qr is not None else 0.5
+            averages.danceability if averages.danceability is not None else 0.5
         )
 
         # Determine mood quadrant
@@ -502,3 +918,112 @@ class InsightsGenerator:
                 "energy": round(avg_energy, 3),
             },
         }
+
+
+class AsyncInsightsGenerator:
+    """
+    InsightsGenerator for an AsyncSession. Each call builds the payload with
+    the sync generator on the session's async connection (run_sync), so the
+    queries do not block the event loop.
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        single_query: bool = False,
+        weight_features_by_plays: bool = False,
+        session_factory: Callable[[], AsyncSession] | None = None,
+        generator_class: Type[InsightsGenerator] = InsightsGenerator,
+    ):
+        """
+        session_factory: when given, detailed insights sections run
+        concurrently on the event loop, each on its own session from this
+        factory
+        generator_class: sync generator the payload is built with, e.g.
+        ColumnarInsightsGenerator
+        """
+        self.db = db
+        self.user_id = user_id
+        self.single_query = single_query
+        self.weight_features_by_plays = weight_features_by_plays
+        self.session_factory = session_factory
+        self.generator_class = generator_class
+
+    def _generator(self, session: Session) -> InsightsGenerator:
+        return self.generator_class(
+            session,
+            self.user_id,
+            single_query=self.single_query,
+            weight_features_by_plays=self.weight_features_by_plays,
+        )
+
+    async def run(self, build: Callable[[InsightsGenerator], T]) -> T:
+        """
+        Call build with an InsightsGenerator on the session's connection,
+        e.g. to read through the insights cache in the same transaction
+        """
+        return await self.db.run_sync(lambda session: build(self._generator(session)))
+
+    async def get_basic_insights(self) -> Dict[str, Any]:
+        """
+        Generate basic insights about user's listening history
+        """
+        return await self.run(lambda generator: generator.get_basic_insights())
+
+    async def get_detailed_insights(
+        self,
+        granularity: str = "month",
+        periods: int = 6,
+        popularity_brackets: Dict[str, Tuple[int, int]] | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate more detailed insights about user's listening habits
+        """
+        if self.session_factory is None:
+            return await self.run(
+                lambda generator: generator.get_detailed_insights(
+                    granularity, periods, popularity_brackets
+                )
+            )
+
+        sections = InsightsGenerator._detailed_sections(
+            granularity, periods, popularity_brackets
+        )
+        # Bounds the connections one request holds at a time
+        slots = asyncio.Semaphore(settings.INSIGHTS_SECTION_WORKERS)
+        evaluated = await asyncio.gather(
+            *(
+                self._run_section_on_own_session(self.session_factory, section, slots)
+                for section in sections.values()
+            )
+        )
+        results = {name: result for name, (result, _) in zip(sections, evaluated)}
+        timings = {name: timing for name, (_, timing) in zip(sections, evaluated)}
+        return InsightsGenerator._combine_detailed_sections(
+            self.user_id, results, timings
+        )
+
+    async def _run_section_on_own_session(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        section: Callable[[InsightsGenerator], Any],
+        slots: asyncio.Semaphore,
+    ) -> Tuple[Any, float]:
+        """
+        Run one section on a fresh session from the session factory
+        """
+        async with slots:
+            return await self._run_section(session_factory, section)
+
+    async def _run_section(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        section: Callable[[InsightsGenerator], Any],
+    ) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        async with session_factory() as db:
+            result = await db.run_sync(
+                lambda session: section(self._generator(session))
+            )
+        return result, round((time.perf_counter() - started) * 1000, 2)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import InsightsCache, User
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the shape or computation of an insights payload changes, so
+# clients holding an ETag from the previous release refetch.
+INSIGHTS_VERSION = 1
+
+# Sent with insights responses: browsers may store them but must revalidate
+INSIGHTS_CACHE_CONTROL = "private, no-cache"
+
+
+def bump_data_version(db: Session, user_id: str | None) -> None:
+    """
+    Mark the user's stored data (every user's, for None) as changed so
+    cached insights are rebuilt. Does not commit: call it inside the
+    transaction that writes the new data.
+    """
+    query = db.query(User)
+    if user_id is not None:
+        query = query.filter(User.user_id == user_id)
+    query.update({User.data_version: User.data_version + 1}, synchronize_session=False)
+
+
+def insights_etag(user: User, payload_type: str) -> str:
+    """
+    Strong ETag for a user's insights payload.
+    Derived from the same inputs as cache freshness (data_version, which
+    every sync bumps, and the current day) plus INSIGHTS_VERSION, so it can
+    be computed without loading or building the payload.
+    """
+    data_version = int(getattr(user, "data_version", 0) or 0)
+    key = (
+        f"{INSIGHTS_VERSION}:{user.user_id}:{payload_type}:{data_version}"
+        f":{datetime.now().date().isoformat()}"
+    )
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/ prefixed tags also match
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def get_cached_insights_json(
+    db: Session,
+    user: User,
+    payload_type: str,
+    compute: Callable[[], Dict[str, Any]],
+) -> str:
+    """
+    Return the serialized insights payload for a user, computing and storing
+    it only when the cached entry is missing or stale.
+
+    An entry is fresh while it was built from the user's current data_version
+    on the current day (recent favorites and monthly trends are relative to
+    today, so they roll over at midnight even without new data).
+    """
+    entry, payload = _read_cached_entry(db, user, payload_type)
+    if payload is not None:
+        return payload
+    payload = json.dumps(jsonable_encoder(compute()))
+    _store_cached_entry(db, user, payload_type, entry, payload)
+    return payload
+
+
+async def get_cached_insights_json_async(
+    db: AsyncSession,
+    user: User,
+    payload_type: str,
+    compute: Callable[[], Awaitable[Dict[str, Any]]],
+) -> str:
+    """
+    get_cached_insights_json for an AsyncSession, with an async compute,
+    e.g. one that evaluates sections concurrently on their own sessions
+    """
+    entry, payload = await db.run_sync(
+        lambda session: _read_cached_entry(session, user, payload_type)
+    )
+    if payload is not None:
+        return payload
+    payload = json.dumps(jsonable_encoder(await compute()))
+    await db.run_sync(
+        lambda session: _store_cached_entry(session, user, payload_type, entry, payload)
+    )
+    return payload
+
+
+def _read_cached_entry(
+    db: Session, user: User, payload_type: str
+) -> Tuple[InsightsCache | None, str | None]:
+    """
+    The user's cache entry for the payload type, and its payload if fresh
+    """
+    entry = (
+        db.query(InsightsCache)
+        .filter(
+            InsightsCache.user_id == user.user_id,
+            InsightsCache.payload_type == payload_type,
+        )
+        .first()
+    )
+    if (
+        entry is not None
+        and entry.data_version == int(getattr(user, "data_version", 0) or 0)
+        and entry.computed_at is not None
+        and entry.computed_at.date() == datetime.now().date()
+    ):
+        return entry, str(entry.payload)
+    return entry, None
+
+
+def _store_cached_entry(
+    db: Session,
+    user: User,
+    payload_type: str,
+    entry: InsightsCache | None,
+    payload: str,
+) -> None:
+    data_version = int(getattr(user, "data_version", 0) or 0)
+    now = datetime.now()
+    if entry is None:
+        entry = InsightsCache(user_id=user.user_id, payload_type=payload_type)
+        db.add(entry)
+    setattr(entry, "data_version", data_version)
+    setattr(entry, "payload", payload)
+    setattr(entry, "computed_at", now)
+    db.flush()
+    _prune_cached_entries(db, user, data_version, now)
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request stored the same entry first; serve our result
+        db.rollback()
+        logger.info(
+            f"Insights cache entry {payload_type} for user {user.user_id} "
+            "was stored concurrently"
+        )
+
+
+def _prune_cached_entries(
+    db: Session, user: User, data_version: int, now: datetime
+) -> None:
+    """
+    Delete the user's entries that can no longer be served (older data
+    version or day), then the least recently computed beyond the per-user
+    limit. Does not commit.
+    """
+    today = datetime.combine(now.date(), datetime.min.time())
+    db.query(InsightsCache).filter(
+        InsightsCache.user_id == user.user_id,
+        (InsightsCache.data_version != data_version)
+        | (InsightsCache.computed_at < today),
+    ).delete(synchronize_session=False)
+
+    keep = (
+        db.query(InsightsCache.id)
+        .filter(InsightsCache.user_id == user.user_id)
+        .order_by(InsightsCache.computed_at.desc(), InsightsCache.id.desc())
+        .limit(settings.INSIGHTS_CACHE_MAX_ENTRIES_PER_USER)
+    )
+    db.query(InsightsCache).filter(
+        InsightsCache.user_id == user.user_id,
+        InsightsCache.id.notin_(keep.scalar_subquery()),
+    ).delete(synchronize_session=False)
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, dialect_insert
+from app.models import SyncJob, User
+from app.spotify_api import SpotifyAPI
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+def enqueue_sync_job(db: Session, user_id: str) -> SyncJob:
+    """
+    Queue a sync for the user, or return the user's pending job if there is
+    one already (requests coalesce while a job waits to be claimed).
+    Commits.
+    """
+    stmt = (
+        dialect_insert(db, SyncJob)
+        .values(user_id=user_id, status=JOB_PENDING, attempts=0)
+        .on_conflict_do_nothing(
+            index_elements=["user_id"], index_where=SyncJob.status == JOB_PENDING
+        )
+    )
+    db.execute(stmt)
+    db.commit()
+    return (
+        db.query(SyncJob)
+        .filter(SyncJob.user_id == user_id, SyncJob.status == JOB_PENDING)
+        .one()
+    )
+
+
+def claim_next_job(db: Session, worker_id: str) -> SyncJob | None:
+    """
+    Claim the oldest pending job. Rows locked by other workers are skipped,
+    so any number of workers can poll concurrently. Commits.
+    """
+    job = (
+        db.query(SyncJob)
+        .filter(SyncJob.status == JOB_PENDING)
+        .order_by(SyncJob.created_at, SyncJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.commit()
+        return None
+
+    setattr(job, "status", JOB_RUNNING)
+    setattr(job, "worker_id", worker_id)
+    setattr(job, "attempts", (job.attempts or 0) + 1)
+    setattr(job, "started_at", func.now())
+    setattr(job, "updated_at", func.now())
+    db.commit()
+    return job
+
+
+def _set_progress(db: Session, job: SyncJob, progress: Dict[str, Any]) -> None:
+    setattr(job, "progress", json.dumps(progress))
+    setattr(job, "updated_at", func.now())
+    db.commit()
+
+
+def run_sync_job(db: Session, job: SyncJob) -> SyncJob:
+    """
+    Run a claimed job: sync recently played, then top items, recording
+    progress as it goes. Commits.
+    """
+    progress: Dict[str, Any] = {"step": "recently_played"}
+    try:
+        user = db.query(User).filter(User.user_id == job.user_id).first()
+        if user is None:
+            raise ValueError(f"User {job.user_id} no longer exists")
+
+        _set_progress(db, job, progress)
+        spotify = SpotifyAPI(user, db)
+
+        def on_page(page_progress: Dict[str, int]) -> None:
+            _set_progress(db, job, {**progress, "recently_played": page_progress})
+
+        results = {
+            "recently_played": spotify.backfill_recently_played(progress=on_page)
+        }
+
+        progress = {"step": "top_items", "recently_played": results["recently_played"]}
+        _set_progress(db, job, progress)
+        results["top_items"] = spotify.fetch_and_store_top_items()
+
+        errors = [
+            f"{step}: {result.get('message')}"
+            for step, result in results.items()
+            if result.get("status") == "error"
+        ]
+        setattr(job, "result", json.dumps(results))
+        setattr(job, "status", JOB_FAILED if errors else JOB_SUCCEEDED)
+        setattr(job, "error", "; ".join(errors) or None)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Sync job {job.id} failed: {e}")
+        setattr(job, "status", JOB_FAILED)
+        setattr(job, "error", str(e))
+
+    setattr(job, "progress", json.dumps({**progress, "step": "done"}))
+    setattr(job, "finished_at", func.now())
+    db.commit()
+    return job
+
+
+def requeue_stale_jobs(db: Session, stale_after: timedelta | None = None) -> int:
+    """
+    Fail running jobs whose worker stopped updating them (e.g. it was
+    killed) and queue a fresh sync for their users. Commits.
+    """
+    stale_after = stale_after or timedelta(minutes=settings.SYNC_JOB_STALE_MINUTES)
+    # Job timestamps are all set by the database clock, so compare against it
+    # rather than this process's clock and time zone
+    cutoff = db.scalar(select(func.now())) - stale_after
+    stale_jobs: List[SyncJob] = (
+        db.query(SyncJob)
+        .filter(
+            SyncJob.status == JOB_RUNNING,
+            SyncJob.updated_at < cutoff,
+        )
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in stale_jobs:
+        setattr(job, "status", JOB_FAILED)
+        setattr(job, "error", "Worker stopped responding")
+        setattr(job, "finished_at", func.now())
+    db.commit()
+
+    for job in stale_jobs:
+        enqueue_sync_job(db, str(job.user_id))
+    return len(stale_jobs)
+
+
+def sync_job_to_dict(job: SyncJob) -> Dict[str, Any]:
+    """
+    Serialize a job for the status endpoint
+    """
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "progress": json.loads(str(job.progress)) if job.progress else None,
+        "result": json.loads(str(job.result)) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def work(
+    worker_id: str | None = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    poll_interval: float | None = None,
+    stop: threading.Event | None = None,
+    max_jobs: int | None = None,
+) -> int:
+    """
+    Worker loop: claim and run pending jobs until stop is set or max_jobs
+    have run. Returns the number of jobs run.
+    """
+    worker_id = worker_id or default_worker_id()
+    poll_interval = (
+        settings.SYNC_WORKER_POLL_SECONDS if poll_interval is None else poll_interval
+    )
+    stop = stop or threading.Event()
+    jobs_run = 0
+
+    logger.info(f"Sync worker {worker_id} started")
+    while not stop.is_set() and (max_jobs is None or jobs_run < max_jobs):
+        db = session_factory()
+        try:
+            requeue_stale_jobs(db)
+            job = claim_next_job(db, worker_id)
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            logger.info(f"Worker {worker_id} running sync job {job.id}")
+            run_sync_job(db, job)
+            jobs_run += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Sync worker {worker_id} error: {e}")
+            stop.wait(poll_interval)
+        finally:
+            db.close()
+    return jobs_run
@@ -1,26 +1,42 @@
 import logging
+from contextlib import asynccontextmanager
+from typing import Literal
 
 from fastapi import (
     BackgroundTasks,
     Depends,
     FastAPI,
     HTTPException,
+    Query,
     Request,
     status,
 )  # Import Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.auth import get_current_user
+from app.auth import get_current_user_async
 
 # Import the specific function, not the whole router if using Depends
 from app.auth import router as auth_router
+from app.columnar import insights_generator_class
 from app.config import settings
-from app.database import get_db
-from app.insights import InsightsGenerator
-from app.models import User  # Keep User import if needed elsewhere
-from app.spotify_api import SpotifyAPI
+from app.database import get_async_db
+from app.insights import AsyncInsightsGenerator, InsightsGenerator
+from app.insights_cache import (
+    INSIGHTS_CACHE_CONTROL,
+    etag_matches,
+    get_cached_insights_json,
+    get_cached_insights_json_async,
+    insights_etag,
+)
+from app.jobs import enqueue_sync_job, sync_job_to_dict
+from app.models import SyncJob, User  # Keep User import if needed elsewhere
+from app.profile_cache import profile_cache
+from app.rate_limit import spotify_rate_limiter
+from app.spotify_client import spotify_client
+from app.token_refresher import token_refresher
 
 # Create all tables in the database (consider using Alembic for migrations in production)
 # Base.metadata.create_all(bind=engine) # Comment out if using migrations
@@ -32,11 +48,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the background token refresher alongside the API"""
+    if settings.TOKEN_REFRESHER_ENABLED:
+        token_refresher.start()
+    yield
+    token_refresher.stop(timeout=10)
+    # The pooled Spotify client is bound to this event loop
+    await spotify_client.aclose()
+
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     description="API for Spotify Listening History Insights",
     version="1.0.0",
+    lifespan=lifespan,
     # Add root_path if running behind a proxy like Nginx or Traefik
     # root_path="/api/v1" # Example if proxy strips /api/v1
 )
@@ -75,22 +104,18 @@ def read_root():
 # Use the User model from get_current_user dependency
 @app.get(f"{settings.API_V1_STR}/user/profile", summary="Get logged-in user's profile")
 async def get_user_profile(
-    current_user: User = Depends(get_current_user),  # Use the dependency
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user_async),  # Use the dependency
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get the authenticated user's Spotify profile information.
     Authentication is handled via JWT cookie.
     """
-    # The get_current_user dependency already fetches the user and handles refresh
-    # We just need the access token from the user object to call Spotify
-    spotify = SpotifyAPI(current_user, db)  # Pass the validated user object
-    # Consider wrapping Spotify API calls in try-except blocks here as well
+    # Served from the copy stored on the user row; a stale copy is returned
+    # as is and refreshed from Spotify after the response is sent
     try:
-        return spotify.get_user_profile()
-    except HTTPException as e:
-        # Re-raise HTTPExceptions from SpotifyAPI if needed
-        raise e
+        profile, revalidate = await profile_cache.get(db, current_user)
     except Exception as e:
         logger.error(
             f"Failed to get Spotify profile for user {current_user.user_id}: {e}"
@@ -99,49 +124,116 @@ async def get_user_profile(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Could not fetch profile from Spotify.",
         )
+    if revalidate:
+        background_tasks.add_task(
+            profile_cache.revalidate,
+            str(current_user.user_id),
+            str(current_user.access_token),
+        )
+    return profile
 
 
 @app.post(f"{settings.API_V1_STR}/data/sync", summary="Sync user data from Spotify")
 async def sync_user_data(
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),  # Use the dependency
-    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user_async),  # Use the dependency
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Trigger background synchronization of the authenticated user's data from Spotify.
+    Queue synchronization of the authenticated user's data from Spotify.
+    The sync is run by a worker process (worker.py); repeated requests
+    while a sync is still pending return the same job.
     """
-    logger.info(f"Initiating data sync for user: {current_user.user_id}")
-    spotify = SpotifyAPI(current_user, db)
-
-    # Add tasks to run in the background
-    background_tasks.add_task(spotify.fetch_and_store_recently_played)
-    background_tasks.add_task(spotify.fetch_and_store_top_items)
-    # Potentially add audio features sync task here too if needed
-    # background_tasks.add_task(spotify.fetch_and_store_audio_features_for_history)
+    logger.info(f"Queueing data sync for user: {current_user.user_id}")
+    job = await db.run_sync(enqueue_sync_job, str(current_user.user_id))
 
     return {
         "status": "success",
-        "message": "Data synchronization started in the background",
+        "message": "Data synchronization queued",
+        "job_id": job.id,
     }
 
 
+@app.get(
+    f"{settings.API_V1_STR}/data/sync/{{job_id}}", summary="Get the status of a sync"
+)
+async def get_sync_status(
+    job_id: int,
+    current_user: User = Depends(get_current_user_async),  # Use the dependency
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Get the status and progress of one of the authenticated user's sync jobs.
+    """
+    job = await db.scalar(
+        select(SyncJob).where(
+            SyncJob.id == job_id, SyncJob.user_id == current_user.user_id
+        )
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Sync job not found."
+        )
+    return sync_job_to_dict(job)
+
+
+def _etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": INSIGHTS_CACHE_CONTROL}
+
+
+async def _insights_etag(db: AsyncSession, user: User, payload_type: str) -> str:
+    # data_version may not be loaded yet (cached users), so read it on the
+    # session's connection
+    return await db.run_sync(lambda _: insights_etag(user, payload_type))
+
+
+def _not_modified(etag: str) -> Response:
+    """Answer a conditional request whose ETag still matches"""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED, headers=_etag_headers(etag)
+    )
+
+
 @app.get(
     f"{settings.API_V1_STR}/insights/basic", summary="Get basic listening insights"
 )
 async def get_basic_insights(
-    current_user: User = Depends(get_current_user),  # Use the dependency
-    db: Session = Depends(get_db),
+    request: Request,
+    weight_by_plays: bool = Query(
+        False, description="Weight audio feature averages by play count"
+    ),
+    current_user: User = Depends(get_current_user_async),  # Use the dependency
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get basic insights about the authenticated user's listening history.
+    Served from the insights cache until the user's data changes.
+    Supports conditional requests via ETag / If-None-Match.
     """
     logger.info(f"Fetching basic insights for user: {current_user.user_id}")
-    insights = InsightsGenerator(
-        db, str(current_user.user_id)
+    payload_type = f"basic:{weight_by_plays}"
+    etag = await _insights_etag(db, current_user, payload_type)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return _not_modified(etag)
+
+    insights = AsyncInsightsGenerator(
+        db,
+        str(current_user.user_id),
+        single_query=True,
+        weight_features_by_plays=weight_by_plays,
+        generator_class=insights_generator_class(),
     )  # Convert user_id to string to match expected type
     # Consider adding try-except block for insight generation
     try:
-        return insights.get_basic_insights()
+        content = await insights.run(
+            lambda generator: get_cached_insights_json(
+                generator.db, current_user, payload_type, generator.get_basic_insights
+            )
+        )
+        return Response(
+            content=content,
+            media_type="application/json",
+            headers=_etag_headers(etag),
+        )
     except Exception as e:
         logger.error(
             f"Failed to generate basic insights for user {current_user.user_id}: {e}"
@@ -157,17 +249,68 @@ async def get_basic_insights(
     summary="Get detailed listening insights",
 )
 async def get_detailed_insights(
-    current_user: User = Depends(get_current_user),  # Use the dependency
-    db: Session = Depends(get_db),
+    request: Request,
+    granularity: Literal["day", "week", "month"] = Query(
+        "month", description="Bucket size for the listening trends"
+    ),
+    periods: int = Query(
+        6, ge=1, le=366, description="Number of trend buckets to return"
+    ),
+    weight_by_plays: bool = Query(
+        False, description="Weight audio feature averages by play count"
+    ),
+    popularity_bucket_width: int | None = Query(
+        None,
+        ge=1,
+        le=100,
+        description="Use even popularity brackets of this width (10 = deciles)",
+    ),
+    current_user: User = Depends(get_current_user_async),  # Use the dependency
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Get detailed insights about the authenticated user's listening history.
+    Served from the insights cache until the user's data changes.
+    Supports conditional requests via ETag / If-None-Match.
     """
     logger.info(f"Fetching detailed insights for user: {current_user.user_id}")
-    insights = InsightsGenerator(db, str(current_user.user_id))
+    payload_type = (
+        f"detailed:{granularity}:{periods}:{weight_by_plays}"
+        f":{popularity_bucket_width}"
+    )
+    etag = await _insights_etag(db, current_user, payload_type)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return _not_modified(etag)
+
+    # Sections run concurrently, each on its own session of the same engine
+    insights = AsyncInsightsGenerator(
+        db,
+        str(current_user.user_id),
+        single_query=True,
+        weight_features_by_plays=weight_by_plays,
+        session_factory=async_sessionmaker(db.bind, expire_on_commit=False),
+        generator_class=insights_generator_class(),
+    )
+    popularity_brackets = (
+        InsightsGenerator.make_popularity_brackets(popularity_bucket_width)
+        if popularity_bucket_width
+        else None
+    )
     # Consider adding try-except block for insight generation
     try:
-        return insights.get_detailed_insights()
+        content = await get_cached_insights_json_async(
+            db,
+            current_user,
+            payload_type,
+            lambda: insights.get_detailed_insights(
+                granularity, periods, popularity_brackets
+            ),
+        )
+        return Response(
+            content=content,
+            media_type="application/json",
+            headers=_etag_headers(etag),
+        )
     except Exception as e:
         logger.error(
             f"Failed to generate detailed insights for user {current_user.user_id}: {e}"
@@ -181,7 +324,15 @@ async def get_detailed_insights(
 @app.get(f"{settings.API_V1_STR}/admin/status", summary="Get API status")
 async def get_api_status():
     """Get the status of the API (unauthenticated endpoint)"""
-    return {"status": "online", "api_version": "1.0.0", "api_name": settings.APP_NAME}
+    return {
+        "status": "online",
+        "api_version": "1.0.0",
+        "api_name": settings.APP_NAME,
+        # Throttle waits and retries of outgoing Spotify requests
+        "spotify_rate_limit": spotify_rate_limiter.metrics.snapshot(),
+        # Profile cache hits/misses and time spent fetching profiles from Spotify
+        "spotify_profile_cache": profile_cache.metrics.snapshot(),
+    }
 
 
 # --- Optional: Add Exception Handlers for better error responses ---
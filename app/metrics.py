@@ -0,0 +1,28 @@
+import threading
+from typing import Dict
+
+
+class Counters:
+    """
+    Thread-safe named counters, as reported by the admin status endpoint.
+    Names in defaults appear in every snapshot, starting at their default.
+    """
+
+    def __init__(self, defaults: Dict[str, float] | None = None):
+        self.defaults = dict(defaults or {})
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Current counter values
+        """
+        with self._lock:
+            return {
+                **self.defaults,
+                **{name: round(value, 3) for name, value in self._counters.items()},
+            }
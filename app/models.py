@@ -1,8 +1,20 @@
 import uuid
 
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 from app.database import Base
 
@@ -21,7 +33,19 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=True)
     access_token = Column(String)
     refresh_token = Column(String)
-    token_expires_at = Column(DateTime)
+    token_expires_at = Column(DateTime, index=True)
+    # Bumped whenever a sync writes new data; stamps cached insights
+    data_version = Column(Integer, default=0, nullable=False)
+    # Recently played backfill state (SpotifyAPI.backfill_recently_played):
+    # every play up to the watermark is stored. An unfinished backfill
+    # resumes at its 'before' cursor, and its newest play becomes the
+    # watermark once it reaches the old one.
+    history_watermark = Column(DateTime, nullable=True)
+    history_backfill_before = Column(BigInteger, nullable=True)
+    history_backfill_newest = Column(DateTime, nullable=True)
+    # Last Spotify /me response, served by /user/profile (app.profile_cache)
+    profile_json = Column(Text, nullable=True)
+    profile_fetched_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(
         DateTime,
@@ -41,6 +65,8 @@ class ListeningHistory(Base):
     """
 
     __tablename__ = "listening_history"
+    # A play is identified by when the user played which track
+    __table_args__ = (UniqueConstraint("user_id", "track_id", "played_at"),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(String, ForeignKey("users.user_id"))
@@ -64,6 +90,7 @@ class TopArtist(Base):
     """
 
     __tablename__ = "top_artists"
+    __table_args__ = (UniqueConstraint("user_id", "term", "rank"),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(String, ForeignKey("users.user_id"))
@@ -85,6 +112,7 @@ class TopTrack(Base):
     """
 
     __tablename__ = "top_tracks"
+    __table_args__ = (UniqueConstraint("user_id", "term", "rank"),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(String, ForeignKey("users.user_id"))
@@ -103,6 +131,21 @@ class TopTrack(Base):
     user = relationship("User", back_populates="top_tracks")
 
 
+class TopItemsDigest(Base):
+    """
+    Model for storing a hash of the top items last stored per user, kind
+    (artists or tracks) and term, so unchanged rankings are not rewritten
+    """
+
+    __tablename__ = "top_items_digests"
+
+    user_id = Column(String, ForeignKey("users.user_id"), primary_key=True)
+    kind = Column(String, primary_key=True)  # artists, tracks
+    term = Column(String, primary_key=True)  # short_term, medium_term, long_term
+    digest = Column(String, nullable=False)
+    updated_at = Column(DateTime)
+
+
 class AudioFeatures(Base):
     """
     Model for storing audio features of tracks
@@ -130,3 +173,148 @@ class AudioFeatures(Base):
         default=func.now(),
         onupdate=func.now(),
     )
+
+
+class AudioFeaturesMiss(Base):
+    """
+    Tracks Spotify returned no audio features for, so they are not
+    re-requested on every sync until the retry TTL has passed
+    """
+
+    __tablename__ = "audio_features_misses"
+
+    track_id = Column(String, primary_key=True)
+    checked_at = Column(DateTime, nullable=False)
+    attempts = Column(Integer, default=1, nullable=False)
+
+
+class RateLimitBucket(Base):
+    """
+    Token bucket state shared by processes rate limiting the same API
+    """
+
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Epoch seconds, comparable across processes
+    updated_at = Column(Float, nullable=False)  # type: ignore
+    blocked_until = Column(Float, default=0, nullable=False)  # type: ignore
+
+
+class InsightsCache(Base):
+    """
+    Model for storing serialized insights payloads per user and payload type
+    """
+
+    __tablename__ = "insights_cache"
+    __table_args__ = (UniqueConstraint("user_id", "payload_type"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey("users.user_id"), index=True)
+    payload_type = Column(String)  # e.g. "basic", "detailed"
+    data_version = Column(Integer)  # User.data_version the payload was built from
+    payload = Column(Text)  # Serialized JSON response body
+    computed_at = Column(DateTime)
+
+
+class DailyListeningRollup(Base):
+    """
+    Model for storing per-user daily play counts and listening time
+    """
+
+    __tablename__ = "listening_rollup_daily"
+    __table_args__ = (UniqueConstraint("user_id", "day"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey("users.user_id"), index=True)
+    day = Column(Date, index=True)
+    play_count = Column(Integer, default=0)
+    total_duration_ms = Column(BigInteger, default=0)
+    first_played_at = Column(DateTime)
+    last_played_at = Column(DateTime)
+
+
+class DailyArtistRollup(Base):
+    """
+    Model for storing per-user daily play counts by artist
+    """
+
+    __tablename__ = "listening_rollup_daily_artist"
+    __table_args__ = (UniqueConstraint("user_id", "day", "artist_id", "artist_name"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey("users.user_id"), index=True)
+    day = Column(Date, index=True)
+    artist_id = Column(String)
+    artist_name = Column(String)
+    play_count = Column(Integer, default=0)
+    total_duration_ms = Column(BigInteger, default=0)
+
+
+class DailyTrackRollup(Base):
+    """
+    Model for storing per-user daily play counts by track
+    """
+
+    __tablename__ = "listening_rollup_daily_track"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "track_id", "track_name", "artist_name"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey("users.user_id"), index=True)
+    day = Column(Date, index=True)
+    track_id = Column(String)
+    track_name = Column(String)
+    artist_name = Column(String)
+    play_count = Column(Integer, default=0)
+    total_duration_ms = Column(BigInteger, default=0)
+
+
+class SyncJob(Base):
+    """
+    Model for queued Spotify data syncs, claimed and run by worker processes
+    """
+
+    __tablename__ = "sync_jobs"
+    __table_args__ = (
+        # At most one pending job per user: new sync requests coalesce into it
+        Index(
+            "uq_sync_jobs_pending_user",
+            "user_id",
+            unique=True,
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+        Index("ix_sync_jobs_status_created_at", "status", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey("users.user_id"), index=True)
+    status = Column(String, default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    worker_id = Column(String, nullable=True)
+    progress = Column(Text, nullable=True)  # JSON, updated while running
+    result = Column(Text, nullable=True)  # JSON results of the sync steps
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Heartbeat: bumped on every progress update while running
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class SyncSchedule(Base):
+    """
+    Model for each user's scheduled sync cadence, maintained by the scheduler
+    """
+
+    __tablename__ = "sync_schedules"
+
+    user_id = Column(String, ForeignKey("users.user_id"), primary_key=True)
+    # Observed listening rate the interval was derived from
+    plays_per_hour = Column(Float, default=0, nullable=False)  # type: ignore
+    interval_seconds = Column(Integer, nullable=False)
+    next_run_at = Column(DateTime, index=True, nullable=False)
+    last_enqueued_at = Column(DateTime, nullable=True)
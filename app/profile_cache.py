@@ -0,0 +1,139 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import get_async_session_factory
+from app.metrics import Counters
+from app.models import User
+from app.spotify_client import AsyncSpotifyClient, spotify_client
+
+logger = logging.getLogger(__name__)
+
+
+# Counters reported in ProfileCache.metrics snapshots even before they move
+PROFILE_CACHE_COUNTERS: Dict[str, float] = {
+    "hits": 0,
+    "stale_hits": 0,
+    "misses": 0,
+    "spotify_fetches": 0,
+    "spotify_fetch_seconds": 0.0,
+    "spotify_fetch_errors": 0,
+}
+
+
+class ProfileCache:
+    """
+    Spotify /me responses stored on the User row. Profiles younger than the
+    TTL are served without calling Spotify; stale ones (up to max_stale) are
+    served immediately and refreshed in the background, one refresh per
+    user at a time. Older or missing profiles are fetched inline.
+    """
+
+    def __init__(
+        self,
+        ttl: timedelta,
+        max_stale: timedelta,
+        client: AsyncSpotifyClient | None = None,
+        session_factory: Callable[[], AsyncSession] | None = None,
+    ):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.client = client or spotify_client
+        # Background refreshes open their own session; the request's is closed
+        # by the time they run. Defaults to the app's async session factory.
+        self.session_factory = session_factory
+        self.metrics = Counters(PROFILE_CACHE_COUNTERS)
+        self._refreshing: Set[str] = set()
+        self._refreshing_lock = threading.Lock()
+
+    async def get(self, db: AsyncSession, user: User) -> Tuple[Dict[str, Any], bool]:
+        """
+        The user's profile, and whether the caller should schedule
+        revalidate() for it after responding
+        """
+        profile_json, fetched_at = await db.run_sync(
+            lambda _: (user.profile_json, user.profile_fetched_at)
+        )
+        age = datetime.now() - fetched_at if fetched_at is not None else None
+
+        if profile_json is not None and age is not None and age < self.ttl:
+            self.metrics.increment("hits")
+            return json.loads(str(profile_json)), False
+
+        if profile_json is not None and age is not None and age < self.max_stale:
+            self.metrics.increment("stale_hits")
+            return json.loads(str(profile_json)), self._claim(str(user.user_id))
+
+        self.metrics.increment("misses")
+        try:
+            return (
+                await self._fetch_and_store(
+                    db, str(user.user_id), str(user.access_token)
+                ),
+                False,
+            )
+        except Exception:
+            if profile_json is None:
+                raise
+            # Spotify is unavailable; an old profile beats an error
+            logger.warning(f"Serving expired profile for user {user.user_id}")
+            return json.loads(str(profile_json)), False
+
+    def _claim(self, user_id: str) -> bool:
+        with self._refreshing_lock:
+            if user_id in self._refreshing:
+                return False
+            self._refreshing.add(user_id)
+            return True
+
+    async def revalidate(self, user_id: str, access_token: str) -> None:
+        """
+        Refresh a stale profile in the background, on a new session
+        """
+        session_factory = self.session_factory or get_async_session_factory()
+        try:
+            async with session_factory() as db:
+                await self._fetch_and_store(db, user_id, access_token)
+        except Exception as e:
+            logger.warning(f"Background profile refresh failed for {user_id}: {e}")
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(user_id)
+
+    async def _fetch_and_store(
+        self, db: AsyncSession, user_id: str, access_token: str
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            profile = await self.client.get_user_profile(access_token)
+        except Exception:
+            self.metrics.increment("spotify_fetch_errors")
+            raise
+        finally:
+            self.metrics.increment("spotify_fetches")
+            self.metrics.increment(
+                "spotify_fetch_seconds", time.perf_counter() - started
+            )
+
+        user = await db.scalar(select(User).where(User.user_id == user_id))
+        if user is not None:
+            setattr(user, "profile_json", json.dumps(profile))
+            setattr(user, "profile_fetched_at", datetime.now())
+            setattr(user, "spotify_display_name", profile.get("display_name"))
+            setattr(user, "email", profile.get("email"))
+            await db.commit()
+        return profile
+
+
+# Process-wide profile cache used by /user/profile
+profile_cache = ProfileCache(
+    timedelta(seconds=settings.PROFILE_CACHE_TTL_SECONDS),
+    timedelta(seconds=settings.PROFILE_CACHE_MAX_STALE_SECONDS),
+)
@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Mapping, TypeVar
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.metrics import Counters
+from app.models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status Spotify answers with when the rate limit is exceeded
+RETRY_AFTER_STATUS = 429
+
+
+# Counters reported in RateLimiter.metrics snapshots even before they move
+RATE_LIMIT_COUNTERS: Dict[str, float] = {
+    "throttle_waits": 0,
+    "throttle_wait_seconds": 0.0,
+    "retries_rate_limited": 0,
+    "retries_server_error": 0,
+    "retries_exhausted": 0,
+}
+
+
+class LocalTokenBucket:
+    """
+    Token bucket shared by all threads (and event loops) in this process
+    """
+
+    # Calls only take an in-process lock, so event loops may call them directly
+    blocking = False
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available; otherwise return seconds to wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def block_for(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for a while, e.g. after a Retry-After
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+class DatabaseTokenBucket:
+    """
+    Token bucket stored in the rate_limit_buckets table, shared by every
+    process using the same database. Each acquire locks the bucket row.
+    """
+
+    # Calls wait on the database (and the row lock), so async callers run
+    # them in a worker thread
+    blocking = True
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        name: str,
+        rate: float,
+        capacity: int,
+    ):
+        self.session_factory = session_factory
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def _locked_bucket(self, db: Session, now: float) -> RateLimitBucket:
+        bucket = (
+            db.query(RateLimitBucket)
+            .filter(RateLimitBucket.name == self.name)
+            .with_for_update()
+            .first()
+        )
+        if bucket is not None:
+            return bucket
+
+        db.add(
+            RateLimitBucket(
+                name=self.name, tokens=self.capacity, updated_at=now, blocked_until=0
+            )
+        )
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another process created the bucket first
+            db.rollback()
+        return (
+            db.query(RateLimitBucket)
+            .filter(RateLimitBucket.name == self.name)
+            .with_for_update()
+            .one()
+        )
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available; otherwise return seconds to wait
+        """
+        db = self.session_factory()
+        try:
+            now = time.time()
+            bucket = self._locked_bucket(db, now)
+            blocked_until = float(getattr(bucket, "blocked_until", 0) or 0)
+            if now < blocked_until:
+                db.commit()
+                return blocked_until - now
+
+            elapsed = max(0.0, now - float(getattr(bucket, "updated_at")))
+            tokens = min(
+                self.capacity, float(getattr(bucket, "tokens")) + elapsed * self.rate
+            )
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            setattr(bucket, "tokens", tokens)
+            setattr(bucket, "updated_at", now)
+            db.commit()
+            return wait
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def block_for(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for a while in every process
+        """
+        db = self.session_factory()
+        try:
+            now = time.time()
+            bucket = self._locked_bucket(db, now)
+            blocked_until = float(getattr(bucket, "blocked_until", 0) or 0)
+            setattr(bucket, "blocked_until", max(blocked_until, now + seconds))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter for outgoing requests, with the retry delays
+    for 429 (Retry-After) and 5xx responses
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        metrics: Counters | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = metrics or Counters(RATE_LIMIT_COUNTERS)
+        self.sleep = sleep
+
+    def _record_wait(self, waited: float) -> None:
+        if waited > 0:
+            self.metrics.increment("throttle_waits")
+            self.metrics.increment("throttle_wait_seconds", waited)
+
+    def acquire(self) -> float:
+        """
+        Block until a request may be sent; returns the seconds waited
+        """
+        waited = 0.0
+        while (wait := self.backend.try_acquire()) > 0:
+            self.sleep(wait)
+            waited += wait
+        self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self) -> float:
+        """
+        Wait without blocking the event loop until a request may be sent
+        """
+        waited = 0.0
+        while (wait := await self._run_backend(self.backend.try_acquire)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        self._record_wait(waited)
+        return waited
+
+    async def retry_delay_async(
+        self, status_code: int | None, headers: Mapping[str, str], attempt: int
+    ) -> float | None:
+        """
+        retry_delay for async callers; pausing a blocking backend after a
+        429 does not hold up the event loop
+        """
+        return await self._run_backend(
+            lambda: self.retry_delay(status_code, headers, attempt)
+        )
+
+    async def _run_backend(self, call: Callable[[], T]) -> T:
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(call)
+        return call()
+
+    def retry_delay(
+        self, status_code: int | None, headers: Mapping[str, str], attempt: int
+    ) -> float | None:
+        """
+        Seconds to wait before retrying a failed response, or None if it
+        should not be retried. A 429 also pauses the shared bucket, so other
+        users' requests back off too.
+        """
+        if status_code is None or attempt >= self.max_retries:
+            if status_code == RETRY_AFTER_STATUS or (status_code or 0) >= 500:
+                self.metrics.increment("retries_exhausted")
+            return None
+
+        if status_code == RETRY_AFTER_STATUS:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if retry_after is None:
+                retry_after = self._backoff(attempt)
+            # Jitter so throttled workers do not all retry at the same instant
+            delay = retry_after + random.uniform(0, min(1.0, retry_after / 2 + 0.1))
+            self.backend.block_for(delay)
+            self.metrics.increment("retries_rate_limited")
+            logger.warning(f"Rate limited by Spotify, retrying in {delay:.1f}s")
+            return delay
+
+        if status_code >= 500:
+            delay = self._backoff(attempt)
+            self.metrics.increment("retries_server_error")
+            logger.warning(f"Spotify returned {status_code}, retrying in {delay:.1f}s")
+            return delay
+
+        return None
+
+    def _backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _make_backend() -> Any:
+    if settings.SPOTIFY_RATE_LIMIT_BACKEND == "database":
+        return DatabaseTokenBucket(
+            SessionLocal,
+            "spotify",
+            settings.SPOTIFY_RATE_LIMIT_PER_SECOND,
+            settings.SPOTIFY_RATE_LIMIT_BURST,
+        )
+    return LocalTokenBucket(
+        settings.SPOTIFY_RATE_LIMIT_PER_SECOND, settings.SPOTIFY_RATE_LIMIT_BURST
+    )
+
+
+# Shared by every Spotify request made in this process
+spotify_rate_limiter = RateLimiter(
+    _make_backend(),
+    max_retries=settings.SPOTIFY_MAX_RETRIES,
+    backoff_base=settings.SPOTIFY_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.SPOTIFY_BACKOFF_MAX_SECONDS,
+)
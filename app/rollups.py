@@ -0,0 +1,275 @@
+import argparse
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, dialect_insert
+from app.insights_cache import bump_data_version
+from app.models import (
+    DailyArtistRollup,
+    DailyListeningRollup,
+    DailyTrackRollup,
+    ListeningHistory,
+)
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_MODELS = [DailyListeningRollup, DailyArtistRollup, DailyTrackRollup]
+
+# Rows per multi-row upsert statement
+UPSERT_BATCH_SIZE = 500
+
+
+def _new_bucket() -> Dict[str, Any]:
+    return {"play_count": 0, "total_duration_ms": 0}
+
+
+def apply_plays_to_rollups(db: Session, plays: Iterable[ListeningHistory]) -> None:
+    """
+    Add newly inserted plays to the daily rollup tables.
+    Does not commit: call it inside the transaction that inserts the plays,
+    and only with plays that were actually inserted.
+    """
+    days: Dict[Tuple[str, date], Dict[str, Any]] = {}
+    artists: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    tracks: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+
+    for play in plays:
+        played_at: datetime | None = getattr(play, "played_at", None)
+        if played_at is None:
+            continue
+        user_id = str(play.user_id)
+        day = played_at.date()
+        duration = int(getattr(play, "duration_ms", 0) or 0)
+
+        day_bucket = days.setdefault((user_id, day), _new_bucket())
+        day_bucket["play_count"] += 1
+        day_bucket["total_duration_ms"] += duration
+        day_bucket["first_played_at"] = min(
+            day_bucket.get("first_played_at", played_at), played_at
+        )
+        day_bucket["last_played_at"] = max(
+            day_bucket.get("last_played_at", played_at), played_at
+        )
+
+        artist_key = (user_id, day, play.artist_id, play.artist_name)
+        artist_bucket = artists.setdefault(artist_key, _new_bucket())
+        artist_bucket["play_count"] += 1
+        artist_bucket["total_duration_ms"] += duration
+
+        track_key = (user_id, day, play.track_id, play.track_name, play.artist_name)
+        track_bucket = tracks.setdefault(track_key, _new_bucket())
+        track_bucket["play_count"] += 1
+        track_bucket["total_duration_ms"] += duration
+
+    _upsert_rollup_rows(
+        db,
+        DailyListeningRollup,
+        ["user_id", "day"],
+        [
+            {"user_id": user_id, "day": day, **bucket}
+            for (user_id, day), bucket in days.items()
+        ],
+    )
+    _upsert_rollup_rows(
+        db,
+        DailyArtistRollup,
+        ["user_id", "day", "artist_id", "artist_name"],
+        [
+            {
+                "user_id": user_id,
+                "day": day,
+                "artist_id": artist_id,
+                "artist_name": artist_name,
+                **bucket,
+            }
+            for (user_id, day, artist_id, artist_name), bucket in artists.items()
+        ],
+    )
+    _upsert_rollup_rows(
+        db,
+        DailyTrackRollup,
+        ["user_id", "day", "track_id", "track_name", "artist_name"],
+        [
+            {
+                "user_id": user_id,
+                "day": day,
+                "track_id": track_id,
+                "track_name": track_name,
+                "artist_name": artist_name,
+                **bucket,
+            }
+            for (
+                user_id,
+                day,
+                track_id,
+                track_name,
+                artist_name,
+            ), bucket in tracks.items()
+        ],
+    )
+
+
+def _upsert_rollup_rows(
+    db: Session, model: Any, key_columns: List[str], rows: List[Dict[str, Any]]
+) -> None:
+    """
+    Insert rollup rows, adding counts onto rows that already exist for the key
+    """
+    for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = dialect_insert(db, model).values(rows[i : i + UPSERT_BATCH_SIZE])
+        set_: Dict[str, Any] = {
+            "play_count": model.play_count + stmt.excluded.play_count,
+            "total_duration_ms": model.total_duration_ms
+            + stmt.excluded.total_duration_ms,
+        }
+        if model is DailyListeningRollup:
+            set_["first_played_at"] = case(
+                (
+                    stmt.excluded.first_played_at < model.first_played_at,
+                    stmt.excluded.first_played_at,
+                ),
+                else_=model.first_played_at,
+            )
+            set_["last_played_at"] = case(
+                (
+                    stmt.excluded.last_played_at > model.last_played_at,
+                    stmt.excluded.last_played_at,
+                ),
+                else_=model.last_played_at,
+            )
+        db.execute(stmt.on_conflict_do_update(index_elements=key_columns, set_=set_))
+
+
+def rebuild_rollups(db: Session, user_id: str | None = None) -> None:
+    """
+    Rebuild the rollup tables from listening_history, for one user or all
+    users, and bump their data_version so insights built from the old
+    rollups are not served again. Does not commit.
+    """
+    for model in ROLLUP_MODELS:
+        query = db.query(model)
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        query.delete(synchronize_session=False)
+
+    history_filters: List[Any] = [ListeningHistory.played_at.isnot(None)]
+    if user_id is not None:
+        history_filters.append(ListeningHistory.user_id == user_id)
+
+    day = func.date(ListeningHistory.played_at)
+    play_count = func.count(ListeningHistory.id)
+    total_duration = func.coalesce(func.sum(ListeningHistory.duration_ms), 0)
+
+    db.execute(
+        insert(DailyListeningRollup).from_select(
+            [
+                "user_id",
+                "day",
+                "play_count",
+                "total_duration_ms",
+                "first_played_at",
+                "last_played_at",
+            ],
+            select(
+                ListeningHistory.user_id,
+                day,
+                play_count,
+                total_duration,
+                func.min(ListeningHistory.played_at),
+                func.max(ListeningHistory.played_at),
+            )
+            .where(*history_filters)
+            .group_by(ListeningHistory.user_id, day),
+        )
+    )
+    db.execute(
+        insert(DailyArtistRollup).from_select(
+            [
+                "user_id",
+                "day",
+                "artist_id",
+                "artist_name",
+                "play_count",
+                "total_duration_ms",
+            ],
+            select(
+                ListeningHistory.user_id,
+                day,
+                ListeningHistory.artist_id,
+                ListeningHistory.artist_name,
+                play_count,
+                total_duration,
+            )
+            .where(*history_filters)
+            .group_by(
+                ListeningHistory.user_id,
+                day,
+                ListeningHistory.artist_id,
+                ListeningHistory.artist_name,
+            ),
+        )
+    )
+    db.execute(
+        insert(DailyTrackRollup).from_select(
+            [
+                "user_id",
+                "day",
+                "track_id",
+                "track_name",
+                "artist_name",
+                "play_count",
+                "total_duration_ms",
+            ],
+            select(
+                ListeningHistory.user_id,
+                day,
+                ListeningHistory.track_id,
+                ListeningHistory.track_name,
+                ListeningHistory.artist_name,
+                play_count,
+                total_duration,
+            )
+            .where(*history_filters)
+            .group_by(
+                ListeningHistory.user_id,
+                day,
+                ListeningHistory.track_id,
+                ListeningHistory.track_name,
+                ListeningHistory.artist_name,
+            ),
+        )
+    )
+    bump_data_version(db, user_id)
+
+
+def main() -> None:
+    """
+    Backfill command: python -m app.rollups [--user-id USER_ID]
+    """
+    parser = argparse.ArgumentParser(
+        description="Rebuild listening history rollup tables from listening_history"
+    )
+    parser.add_argument(
+        "--user-id", help="Only rebuild rollups for this user (default: all users)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db, args.user_id)
+        db.commit()
+        logger.info(f"Rebuilt listening rollups for {args.user_id or 'all users'}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
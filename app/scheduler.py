@@ -0,0 +1,210 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.jobs import enqueue_sync_job
+from app.models import DailyListeningRollup, SyncSchedule, User
+
+logger = logging.getLogger(__name__)
+
+# Spotify's recently played endpoint only returns this many plays
+RECENTLY_PLAYED_LIMIT = 50
+# Sync once this share of the recently played window has been used up,
+# leaving headroom for listening bursts
+RECENTLY_PLAYED_SAFETY = 0.5
+# Random spread applied to each next run so users do not fall into lockstep
+RESCHEDULE_JITTER = 0.1
+
+
+def compute_sync_interval(plays_per_hour: float) -> timedelta:
+    """
+    Sync interval for a listening rate: often enough that the recently
+    played window never overflows between syncs, rarely for idle users
+    """
+    minimum = timedelta(minutes=settings.SCHEDULER_MIN_INTERVAL_MINUTES)
+    maximum = timedelta(hours=settings.SCHEDULER_MAX_INTERVAL_HOURS)
+    if plays_per_hour <= 0:
+        return maximum
+    interval = timedelta(
+        hours=RECENTLY_PLAYED_LIMIT * RECENTLY_PLAYED_SAFETY / plays_per_hour
+    )
+    return max(minimum, min(maximum, interval))
+
+
+def observed_plays_per_hour(db: Session, window_days: int) -> Dict[str, float]:
+    """
+    Plays per hour of every user over the last window_days, from the daily
+    rollups in one grouped query
+    """
+    since = (datetime.now() - timedelta(days=window_days)).date()
+    rows = (
+        db.query(
+            DailyListeningRollup.user_id, func.sum(DailyListeningRollup.play_count)
+        )
+        .filter(DailyListeningRollup.day >= since)
+        .group_by(DailyListeningRollup.user_id)
+        .all()
+    )
+    hours = window_days * 24
+    return {str(user_id): float(plays or 0) / hours for user_id, plays in rows}
+
+
+def refresh_schedules(db: Session) -> int:
+    """
+    Create schedules for new users and re-derive every user's interval from
+    their observed plays per hour. New users start at a random point in
+    their first interval, spreading syncs evenly over time. Commits.
+    """
+    now = datetime.now()
+    rates = observed_plays_per_hour(db, settings.SCHEDULER_RATE_WINDOW_DAYS)
+    schedules = {
+        str(schedule.user_id): schedule for schedule in db.query(SyncSchedule).all()
+    }
+
+    for (user_id,) in db.query(User.user_id).all():
+        plays_per_hour = rates.get(str(user_id), 0.0)
+        interval = compute_sync_interval(plays_per_hour)
+        schedule = schedules.get(str(user_id))
+        if schedule is None:
+            db.add(
+                SyncSchedule(
+                    user_id=user_id,
+                    plays_per_hour=plays_per_hour,
+                    interval_seconds=int(interval.total_seconds()),
+                    next_run_at=now + interval * random.random(),
+                )
+            )
+            continue
+
+        setattr(schedule, "plays_per_hour", plays_per_hour)
+        setattr(schedule, "interval_seconds", int(interval.total_seconds()))
+        # Bring the next run forward when the user started listening more
+        if schedule.last_enqueued_at is not None:
+            earliest = schedule.last_enqueued_at + interval
+            if earliest < schedule.next_run_at:
+                setattr(schedule, "next_run_at", max(now, earliest))
+
+    db.commit()
+    return len(rates)
+
+
+def enqueue_due_syncs(db: Session, limit: int) -> int:
+    """
+    Queue sync jobs for up to limit users whose next run is due, most
+    overdue first, and schedule their next runs. Commits.
+    """
+    if limit <= 0:
+        return 0
+    now = datetime.now()
+    due = (
+        db.query(SyncSchedule)
+        .filter(SyncSchedule.next_run_at <= now)
+        .order_by(SyncSchedule.next_run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for schedule in due:
+        interval = timedelta(seconds=int(getattr(schedule, "interval_seconds")))
+        jitter = interval * random.uniform(-RESCHEDULE_JITTER, RESCHEDULE_JITTER)
+        setattr(schedule, "last_enqueued_at", now)
+        setattr(schedule, "next_run_at", now + interval + jitter)
+    db.commit()
+
+    for schedule in due:
+        enqueue_sync_job(db, str(schedule.user_id))
+    return len(due)
+
+
+class SyncScheduler:
+    """
+    Periodically queues due syncs without exceeding the global Spotify
+    request budget: sync allowance accrues at
+    SCHEDULER_REQUESTS_PER_SECOND / SCHEDULER_REQUESTS_PER_SYNC per second
+    and unused allowance is capped at one tick's worth, so a backlog drains
+    at the budgeted rate instead of in a burst.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        requests_per_second: float | None = None,
+        requests_per_sync: int | None = None,
+        tick_seconds: float | None = None,
+    ):
+        self.session_factory = session_factory
+        self.requests_per_second = (
+            requests_per_second or settings.SCHEDULER_REQUESTS_PER_SECOND
+        )
+        self.requests_per_sync = (
+            requests_per_sync or settings.SCHEDULER_REQUESTS_PER_SYNC
+        )
+        self.tick_seconds = tick_seconds or settings.SCHEDULER_TICK_SECONDS
+        self.refresh_every = timedelta(minutes=settings.SCHEDULER_REFRESH_MINUTES)
+
+        self._allowance = 0.0
+        self._last_tick: float | None = None
+        self._last_refresh: datetime | None = None
+
+    @property
+    def syncs_per_second(self) -> float:
+        return self.requests_per_second / self.requests_per_sync
+
+    def _accrue(self, now: float) -> int:
+        elapsed = (
+            self.tick_seconds if self._last_tick is None else now - self._last_tick
+        )
+        self._last_tick = now
+        burst = max(1.0, self.syncs_per_second * self.tick_seconds)
+        self._allowance = min(burst, self._allowance + elapsed * self.syncs_per_second)
+        return int(self._allowance)
+
+    def tick(self) -> int:
+        """
+        Refresh schedules when due and queue the syncs the budget allows.
+        Returns the number of syncs queued.
+        """
+        db = self.session_factory()
+        try:
+            now = datetime.now()
+            if (
+                self._last_refresh is None
+                or now - self._last_refresh >= self.refresh_every
+            ):
+                users = refresh_schedules(db)
+                self._last_refresh = now
+                logger.info(f"Refreshed sync schedules ({users} active users)")
+
+            queued = enqueue_due_syncs(db, self._accrue(time.monotonic()))
+            self._allowance -= queued
+            if queued:
+                logger.info(f"Queued {queued} scheduled syncs")
+            return queued
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """
+        Tick until stop is set
+        """
+        stop = stop or threading.Event()
+        logger.info(
+            f"Sync scheduler started ({self.syncs_per_second:.2f} syncs/s budget)"
+        )
+        while not stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Sync scheduler tick failed: {e}")
+            stop.wait(self.tick_seconds)
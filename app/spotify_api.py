@@ -1,15 +1,114 @@
+import hashlib
+import json
 import logging
-from datetime import datetime, timedelta
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Set, Tuple
 
-import requests
+import httpx
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from app.audio_features_cache import audio_features_cache
 from app.auth import refresh_spotify_token
-from app.models import AudioFeatures, ListeningHistory, TopArtist, TopTrack, User
+from app.config import settings
+from app.database import dialect_insert
+from app.insights_cache import bump_data_version
+from app.models import (
+    AudioFeatures,
+    ListeningHistory,
+    TopArtist,
+    TopItemsDigest,
+    TopTrack,
+    User,
+)
+from app.rate_limit import spotify_rate_limiter
+from app.rollups import apply_plays_to_rollups
+from app.spotify_http import spotify_http
+from app.token_manager import token_manager
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on recently played pages fetched by one sync
+BACKFILL_MAX_PAGES = 200
+TOP_ITEMS_TIME_RANGES = ["short_term", "medium_term", "long_term"]
+# Columns of the listening_history unique constraint
+LISTENING_HISTORY_KEY = ["user_id", "track_id", "played_at"]
+# Columns of the top_artists / top_tracks unique constraints
+TOP_ITEMS_KEY = ["user_id", "term", "rank"]
+
+
+def insert_listening_history(db: Session, rows: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Insert listening history rows in one statement, skipping plays that are
+    already stored (same user, track and played_at).
+    Returns the inserted rows; does not commit.
+    """
+    if not rows:
+        return []
+    stmt = (
+        dialect_insert(db, ListeningHistory)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=LISTENING_HISTORY_KEY)
+        .returning(
+            ListeningHistory.user_id,
+            ListeningHistory.track_id,
+            ListeningHistory.track_name,
+            ListeningHistory.artist_id,
+            ListeningHistory.artist_name,
+            ListeningHistory.played_at,
+            ListeningHistory.duration_ms,
+        )
+    )
+    return list(db.execute(stmt).all())
+
+
+def top_artist_row(artist: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Stored columns of a top artist from the API response
+    """
+    return {
+        "artist_id": artist.get("id", ""),
+        "artist_name": artist.get("name", ""),
+        "genres": ",".join(artist.get("genres", [])),
+        "popularity": artist.get("popularity", 0),
+    }
+
+
+def top_track_row(track: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Stored columns of a top track from the API response
+    """
+    artist = track.get("artists", [{}])[0]  # Get the first artist
+    album = track.get("album", {})
+    return {
+        "track_id": track.get("id", ""),
+        "track_name": track.get("name", ""),
+        "artist_id": artist.get("id", ""),
+        "artist_name": artist.get("name", ""),
+        "album_id": album.get("id", ""),
+        "album_name": album.get("name", ""),
+        "popularity": track.get("popularity", 0),
+    }
+
+
+def top_items_digest(rows: List[Dict[str, Any]]) -> str:
+    """
+    Hash of a term's ranked rows; equal digests mean nothing to write
+    """
+    encoded = json.dumps(rows, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Stored timestamps may be naive (SQLite); Spotify's are UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _cursor_as_int(cursors: Dict[str, Any] | None, name: str) -> int | None:
+    value = (cursors or {}).get(name)
+    return int(value) if value is not None else None
+
 
 class SpotifyAPI:
     """
@@ -24,30 +123,15 @@ class SpotifyAPI:
         self.access_token = user.access_token
         self.headers = {"Authorization": f"Bearer {self.access_token}"}
 
-    def _check_token(self):
+    def _check_token(self, rejected_token: str | None = None):
         """
-        Check if the access token is expired and refresh if needed
+        Check if the access token is expired (or was rejected by Spotify)
+        and refresh if needed
         """
-        current_time = datetime.now()
-        token_expires = getattr(self.user, "token_expires_at", None)
-        if token_expires is None or current_time >= token_expires:
-            token_data = refresh_spotify_token(str(self.user.refresh_token))
-
-            # Update user with new tokens
-            setattr(self.user, "access_token", token_data.get("access_token"))
-            setattr(
-                self.user,
-                "token_expires_at",
-                current_time + timedelta(seconds=token_data.get("expires_in", 3600)),
-            )
-
-            # If a new refresh token is provided, update it
-            if "refresh_token" in token_data:
-                setattr(self.user, "refresh_token", token_data["refresh_token"])
-
-            self.db.commit()
-            self.db.refresh(self.user)
-
+        token_manager.ensure_fresh(
+            self.db, self.user, refresh_spotify_token, rejected_token=rejected_token
+        )
+        if self.access_token != self.user.access_token:
             # Update the access token and headers
             self.access_token = self.user.access_token
             self.headers = {"Authorization": f"Bearer {self.access_token}"}
@@ -58,39 +142,58 @@ class SpotifyAPI:
         method: str = "GET",
         params: Dict[str, Any] | None = None,
         data: Dict[str, Any] | None = None,
+        check_token: bool = True,
     ) -> Dict[str, Any]:
         """
-        Make a request to the Spotify API with automatic token refresh
+        Make a request to the Spotify API with automatic token refresh.
+        With check_token=False the session is not touched (no refresh,
+        including on a 401), so it can be called from worker threads.
         """
-        self._check_token()
+        if check_token:
+            self._check_token()
 
         url = f"{self.BASE_URL}{endpoint}"
-        response = None
 
         # Default to empty dict if params or data is None
         params = params or {}
         data = data or {}
 
+        if method not in ("GET", "POST", "PUT"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+
         try:
-            if method == "GET":
-                response = requests.get(url, headers=self.headers, params=params)
-            elif method == "POST":
-                response = requests.post(url, headers=self.headers, json=data)
-            elif method == "PUT":
-                response = requests.put(url, headers=self.headers, json=data)
-            else:
-                raise ValueError(f"Unsupported HTTP method: {method}")
-
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
+            for attempt in range(spotify_rate_limiter.max_retries + 1):
+                # Shared across all users, so bursts stay under Spotify's limit
+                spotify_rate_limiter.acquire()
+                response = spotify_http.request(
+                    method,
+                    url,
+                    headers=self.headers,
+                    params=params if method == "GET" else None,
+                    json=data if method != "GET" else None,
+                )
+
+                if response.is_error:
+                    delay = spotify_rate_limiter.retry_delay(
+                        response.status_code, response.headers, attempt
+                    )
+                    if delay is not None:
+                        spotify_rate_limiter.sleep(delay)
+                        continue
+                response.raise_for_status()
+                return response.json()
+            raise RuntimeError("Spotify request retries exhausted")
+        except httpx.HTTPStatusError as e:
             logger.error(f"HTTP Error: {e}")
             response = e.response
-            if response and response.status_code == 401:
-                # Token might be invalid, force refresh
-                setattr(self.user, "token_expires_at", None)  # Force token refresh
-                self._check_token()
-                return self._make_request(endpoint, method, params, data)
+            if check_token and response is not None and response.status_code == 401:
+                # Token might be invalid; refresh it unless another worker
+                # already has
+                self._check_token(rejected_token=str(self.access_token))
+                # Retry once; a second 401 is raised to the caller
+                return self._make_request(
+                    endpoint, method, params, data, check_token=False
+                )
             raise
         except Exception as e:
             logger.error(f"Error making request to Spotify API: {e}")
@@ -123,13 +226,7 @@ class SpotifyAPI:
         Get the user's top artists
         time_range: 'short_term' (4 weeks), 'medium_term' (6 months), or 'long_term' (years)
         """
-        params: Dict[str, Any] = {
-            "time_range": time_range,
-            "limit": limit,
-            "offset": offset,
-        }
-
-        return self._make_request("/me/top/artists", params=params)
+        return self._get_top_items("artists", time_range, limit, offset)
 
     def get_top_tracks(
         self, time_range: str = "medium_term", limit: int = 50, offset: int = 0
@@ -138,13 +235,25 @@ class SpotifyAPI:
         Get the user's top tracks
         time_range: 'short_term' (4 weeks), 'medium_term' (6 months), or 'long_term' (years)
         """
+        return self._get_top_items("tracks", time_range, limit, offset)
+
+    def _get_top_items(
+        self,
+        kind: str,
+        time_range: str,
+        limit: int = 50,
+        offset: int = 0,
+        check_token: bool = True,
+    ) -> Dict[str, Any]:
         params: Dict[str, Any] = {
             "time_range": time_range,
             "limit": limit,
             "offset": offset,
         }
 
-        return self._make_request("/me/top/tracks", params=params)
+        return self._make_request(
+            f"/me/top/{kind}", params=params, check_token=check_token
+        )
 
     def get_audio_features(self, track_ids: List[str]) -> List[Dict[str, Any]]:
         """
@@ -165,171 +274,282 @@ class SpotifyAPI:
         response = self._make_request("/audio-features", params=params)
         return response.get("audio_features", [])
 
-    def fetch_and_store_recently_played(self) -> Dict[str, str]:
+    def fetch_and_store_recently_played(self) -> Dict[str, Any]:
         """
-        Fetch and store the user's recently played tracks
+        Fetch and store the user's recently played tracks.
+        Pages back until the stored history is reached, so plays are not lost
+        when more than one page was played since the last sync.
         """
+        return self.backfill_recently_played()
+
+    def backfill_recently_played(
+        self,
+        max_pages: int = BACKFILL_MAX_PAGES,
+        progress: Callable[[Dict[str, int]], None] | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Follow the recently played 'before' cursors from the newest play back
+        to the watermark, or until Spotify has no more pages. Each page is
+        stored and committed with the cursor of the next one, so memory stays
+        bounded by the page size and an interrupted backfill (an error or the
+        page cap) resumes where it stopped. The watermark only advances once
+        a backfill is complete.
+        progress is called after every page with the pages and tracks so far.
+        """
+        counts = {"pages": 0, "stored": 0}
         try:
-            # Get the most recent timestamp in the database
-            latest_played = (
-                self.db.query(ListeningHistory)
-                .filter(ListeningHistory.user_id == self.user.user_id)
-                .order_by(ListeningHistory.played_at.desc())
-                .first()
-            )
+            while counts["pages"] < max_pages:
+                resumed = self.user.history_backfill_before is not None
+                complete = self._backfill_segment(max_pages, counts, progress)
+                # A resumed backfill is done; go on to the plays since it began
+                if not complete or not resumed:
+                    break
+
+            pages, stored = counts["pages"], counts["stored"]
+            if stored == 0:
+                return {
+                    "status": "success",
+                    "message": "No new tracks to fetch",
+                    "pages": pages,
+                    "stored": 0,
+                }
+            return {
+                "status": "success",
+                "message": f"Fetched and stored {stored} new tracks",
+                "pages": pages,
+                "stored": stored,
+            }
 
-            # If we have data, use 'after' parameter to get only new plays
-            after_param = None
-            if latest_played is not None:
-                played_at = getattr(latest_played, "played_at", None)
-                if played_at is not None:
-                    # Convert datetime to timestamp in milliseconds
-                    after_param = int(played_at.timestamp() * 1000)
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error fetching recently played: {e}")
+            # Pages committed before the error stay stored, and the next
+            # backfill resumes after them
+            return {
+                "status": "error",
+                "message": str(e),
+                **counts,
+            }
 
-            # Get recently played tracks from Spotify
-            data = self.get_recently_played(after=after_param)
+    def _backfill_segment(
+        self,
+        max_pages: int,
+        counts: Dict[str, int],
+        progress: Callable[[Dict[str, int]], None] | None,
+    ) -> bool:
+        """
+        Page back from the resume cursor (or the newest play) to the
+        watermark, adding to the running page and stored counts. Returns
+        whether the watermark or the end of Spotify's history was reached.
+        """
+        watermark = self._get_recently_played_watermark()
+        if watermark is not None and self.user.history_watermark is None:
+            # Pin the fallback, which moves as soon as the first page is stored
+            setattr(self.user, "history_watermark", watermark)
+        before = self.user.history_backfill_before
+        newest = self.user.history_backfill_newest
+        newest = _as_utc(newest) if newest is not None else None
+
+        while counts["pages"] < max_pages:
+            data = self.get_recently_played(before=before)
             items = data.get("items", [])
-
-            # If we didn't get any new tracks, return
+            counts["pages"] += 1
             if not items:
-                return {"status": "success", "message": "No new tracks to fetch"}
+                break
 
-            # Process and store each track
-            new_tracks: List[ListeningHistory] = []  # Add type hint
-            track_ids: List[str] = []  # Add type hint
+            # Items are newest first; keep the ones after the watermark
+            new_items: List[Dict[str, Any]] = []
+            reached_watermark = False
             for item in items:
-                # Extract necessary data
-                track = item.get("track", {})
-                track_id = track.get("id")
-
-                # Skip tracks without IDs
-                if not track_id:
+                played_at = self._parse_played_at(item)
+                if played_at is None:
+                    continue
+                if newest is None or played_at > newest:
+                    newest = played_at
+                if watermark is not None and played_at <= watermark:
+                    reached_watermark = True
                     continue
+                new_items.append(item)
+
+            # Stop at plays we already have, or the end of Spotify's history
+            before = _cursor_as_int(data.get("cursors"), "before")
+            done = reached_watermark or before is None or not data.get("next")
+            # Committed with the page, so a failure on a later page resumes
+            # after this one instead of skipping the gap below it
+            self._set_backfill_state(
+                None if done else before,
+                None if done else newest,
+                newest if done else None,
+            )
+            counts["stored"] += self._store_recently_played_items(new_items)
 
-                # Check if we already have this play
-                played_at = datetime.fromisoformat(
-                    item.get("played_at").replace("Z", "+00:00")
-                )
-                existing = (
-                    self.db.query(ListeningHistory)
-                    .filter(
-                        ListeningHistory.user_id == self.user.user_id,
-                        ListeningHistory.track_id == track_id,
-                        ListeningHistory.played_at == played_at,
-                    )
-                    .first()
-                )
+            logger.info(
+                f"Recently played sync for user {self.user.user_id}: "
+                f"page {counts['pages']}, {counts['stored']} new tracks stored"
+            )
+            if progress is not None:
+                progress(dict(counts))
+            if done:
+                return True
+        else:
+            return False
+
+        # Spotify returned an empty page: nothing older to fetch
+        self._set_backfill_state(None, None, newest)
+        self.db.commit()
+        return True
 
-                if existing:
-                    continue
+    def _set_backfill_state(
+        self,
+        before: int | None,
+        newest: datetime | None,
+        completed_at: datetime | None,
+    ) -> None:
+        """
+        Record the resume cursor and newest play of an unfinished backfill,
+        or advance the watermark to completed_at. Does not commit.
+        """
+        setattr(self.user, "history_backfill_before", before)
+        setattr(self.user, "history_backfill_newest", newest)
+        if completed_at is not None:
+            watermark = self._get_recently_played_watermark()
+            if watermark is None or completed_at > watermark:
+                setattr(self.user, "history_watermark", completed_at)
+
+    def _get_recently_played_watermark(self) -> datetime | None:
+        """
+        played_at up to which the user's history is complete. Users synced
+        before the watermark was recorded fall back to their latest stored
+        play.
+        """
+        watermark = self.user.history_watermark
+        # While a backfill is pending the latest stored play is above the gap
+        if watermark is None and self.user.history_backfill_before is None:
+            watermark = (
+                self.db.query(func.max(ListeningHistory.played_at))
+                .filter(ListeningHistory.user_id == self.user.user_id)
+                .scalar()
+            )
+        return _as_utc(watermark) if watermark is not None else None
 
-                # Create a new ListeningHistory record
-                artist = track.get("artists", [{}])[0]  # Get the first artist
-                album = track.get("album", {})
-
-                new_track = ListeningHistory(
-                    user_id=self.user.user_id,
-                    track_id=track_id,
-                    track_name=track.get("name", ""),
-                    artist_id=artist.get("id", ""),
-                    artist_name=artist.get("name", ""),
-                    album_id=album.get("id", ""),
-                    album_name=album.get("name", ""),
-                    played_at=played_at,
-                    duration_ms=track.get("duration_ms", 0),
-                )
+    @staticmethod
+    def _parse_played_at(item: Dict[str, Any]) -> datetime | None:
+        played_at = item.get("played_at")
+        if not played_at:
+            return None
+        return datetime.fromisoformat(played_at.replace("Z", "+00:00"))
 
-                new_tracks.append(new_track)
-                track_ids.append(track_id)
+    def _store_recently_played_items(self, items: List[Dict[str, Any]]) -> int:
+        """
+        Store one page of recently played items, with their rollups and audio
+        features, and commit. Returns the number of new plays stored.
+        """
+        rows: List[Dict[str, Any]] = []
+        seen: Set[Tuple[str, datetime]] = set()
+        for item in items:
+            # Extract necessary data
+            track = item.get("track", {})
+            track_id = track.get("id")
+            played_at = self._parse_played_at(item)
+
+            # Skip tracks without IDs, and repeats within the page
+            if not track_id or played_at is None or (track_id, played_at) in seen:
+                continue
+            seen.add((track_id, played_at))
+
+            artist = track.get("artists", [{}])[0]  # Get the first artist
+            album = track.get("album", {})
+            rows.append(
+                {
+                    "user_id": self.user.user_id,
+                    "track_id": track_id,
+                    "track_name": track.get("name", ""),
+                    "artist_id": artist.get("id", ""),
+                    "artist_name": artist.get("name", ""),
+                    "album_id": album.get("id", ""),
+                    "album_name": album.get("name", ""),
+                    "played_at": played_at,
+                    "duration_ms": track.get("duration_ms", 0),
+                }
+            )
 
-            # Bulk insert new listening history records
-            if new_tracks:
-                self.db.bulk_save_objects(new_tracks)
-                self.db.commit()
+        inserted = insert_listening_history(self.db, rows)
 
-            # Fetch and store audio features for new tracks
-            self._store_audio_features(track_ids)
+        # Roll up only the plays that were actually inserted, in the same
+        # transaction
+        if inserted:
+            apply_plays_to_rollups(self.db, inserted)
+            bump_data_version(self.db, str(self.user.user_id))
+        self.db.commit()
 
-            return {
-                "status": "success",
-                "message": f"Fetched and stored {len(new_tracks)} new tracks",
-            }
+        # Fetch and store audio features for new tracks
+        self._store_audio_features([str(play.track_id) for play in inserted])
 
-        except Exception as e:
-            self.db.rollback()
-            logger.error(f"Error fetching recently played: {e}")
-            return {"status": "error", "message": str(e)}
+        return len(inserted)
 
-    def fetch_and_store_top_items(self) -> Dict[str, str]:
+    def fetch_and_store_top_items(self) -> Dict[str, Any]:
         """
-        Fetch and store the user's top artists and tracks
+        Fetch and store the user's top artists and tracks.
+        The six top-items requests run concurrently (bounded per user), audio
+        features for all terms are looked up in one deduplicated batch, and
+        everything is written in a single transaction. Terms whose ranking is
+        unchanged are not written; others get a minimal diff.
         """
         try:
-            time_ranges = ["short_term", "medium_term", "long_term"]
-
-            for time_range in time_ranges:
-                # Fetch top artists
-                artists_data = self.get_top_artists(time_range=time_range)
-                artists = artists_data.get("items", [])
-
-                # Clear existing top artists for this user and time range
-                self.db.query(TopArtist).filter(
-                    TopArtist.user_id == self.user.user_id, TopArtist.term == time_range
-                ).delete()
-
-                # Store new top artists
-                for rank, artist in enumerate(artists, 1):
-                    top_artist = TopArtist(
-                        user_id=self.user.user_id,
-                        artist_id=artist.get("id", ""),
-                        artist_name=artist.get("name", ""),
-                        term=time_range,
-                        rank=rank,
-                        genres=",".join(artist.get("genres", [])),
-                        popularity=artist.get("popularity", 0),
-                    )
-                    self.db.add(top_artist)
-
-                # Fetch top tracks
-                tracks_data = self.get_top_tracks(time_range=time_range)
-                tracks = tracks_data.get("items", [])
-
-                # Clear existing top tracks for this user and time range
-                self.db.query(TopTrack).filter(
-                    TopTrack.user_id == self.user.user_id, TopTrack.term == time_range
-                ).delete()
-
-                # Track IDs for audio features
-                track_ids: List[str] = []  # Add type hint
-
-                # Store new top tracks
-                for rank, track in enumerate(tracks, 1):
-                    artist = track.get("artists", [{}])[0]  # Get the first artist
-                    album = track.get("album", {})
-
-                    top_track = TopTrack(
-                        user_id=self.user.user_id,
-                        track_id=track.get("id", ""),
-                        track_name=track.get("name", ""),
-                        artist_id=artist.get("id", ""),
-                        artist_name=artist.get("name", ""),
-                        album_id=album.get("id", ""),
-                        album_name=album.get("name", ""),
-                        term=time_range,
-                        rank=rank,
-                        popularity=track.get("popularity", 0),
+            # Refresh once up front; the workers only make HTTP requests and
+            # never touch the session, which is not thread-safe
+            self._check_token()
+            with ThreadPoolExecutor(
+                max_workers=settings.SPOTIFY_PER_USER_CONCURRENCY,
+                thread_name_prefix="spotify-top-items",
+            ) as executor:
+                futures = {
+                    (kind, time_range): executor.submit(
+                        self._get_top_items, kind, time_range, check_token=False
                     )
-                    self.db.add(top_track)
-                    track_ids.append(track.get("id"))
-
-                # Fetch and store audio features for top tracks
-                self._store_audio_features(track_ids)
-
+                    for time_range in TOP_ITEMS_TIME_RANGES
+                    for kind in ("artists", "tracks")
+                }
+                items = {
+                    key: future.result().get("items", [])
+                    for key, future in futures.items()
+                }
+
+            # Track IDs for audio features, across all terms
+            track_ids = list(
+                dict.fromkeys(
+                    track.get("id")
+                    for time_range in TOP_ITEMS_TIME_RANGES
+                    for track in items[("tracks", time_range)]
+                    if track.get("id")
+                )
+            )
+            audio_features = self._fetch_new_audio_features(track_ids)
+
+            changed_rows = 0
+            unchanged_terms = 0
+            for time_range in TOP_ITEMS_TIME_RANGES:
+                for kind, model, to_row in (
+                    ("artists", TopArtist, top_artist_row),
+                    ("tracks", TopTrack, top_track_row),
+                ):
+                    rows = [to_row(item) for item in items[(kind, time_range)]]
+                    changed = self._store_top_items(model, kind, time_range, rows)
+                    if changed is None:
+                        unchanged_terms += 1
+                    else:
+                        changed_rows += changed
+
+            stored_features = self._insert_audio_features(audio_features)
+            if changed_rows or stored_features:
+                bump_data_version(self.db, str(self.user.user_id))
             self.db.commit()
 
             return {
                 "status": "success",
                 "message": "Fetched and stored top artists and tracks",
+                "changed_rows": changed_rows,
+                "unchanged_terms": unchanged_terms,
             }
 
         except Exception as e:
@@ -337,54 +557,142 @@ class SpotifyAPI:
             logger.error(f"Error fetching top items: {e}")
             return {"status": "error", "message": str(e)}
 
-    def _store_audio_features(self, track_ids: List[str]):
+    def _store_top_items(
+        self, model: Any, kind: str, term: str, rows: List[Dict[str, Any]]
+    ) -> int | None:
         """
-        Fetch and store audio features for tracks
+        Bring the stored ranking for one kind and term in line with rows.
+        Returns None if the term's digest is unchanged (nothing is written),
+        otherwise the number of rows upserted or deleted. Does not commit.
         """
-        if not track_ids:
-            return
-
-        # Remove duplicates
-        track_ids = list(set(track_ids))
-
-        # Check which track_ids already have audio features
-        existing_track_ids = [
-            r[0]
-            for r in self.db.query(AudioFeatures.track_id)
-            .filter(AudioFeatures.track_id.in_(track_ids))
+        user_id = str(self.user.user_id)
+        digest = top_items_digest(rows)
+        stored_digest = self.db.get(TopItemsDigest, (user_id, kind, term))
+        if stored_digest is not None and stored_digest.digest == digest:
+            return None
+
+        # Only ranks whose stored columns differ are written
+        columns = list(rows[0]) if rows else []
+        stored = {
+            r.rank: {column: getattr(r, column) for column in columns}
+            for r in self.db.query(
+                model.rank, *(getattr(model, column) for column in columns)
+            )
+            .filter(model.user_id == user_id, model.term == term)
             .all()
+        }
+        upserts = [
+            {"user_id": user_id, "term": term, "rank": rank, **row}
+            for rank, row in enumerate(rows, 1)
+            if stored.get(rank) != row
         ]
+        if upserts:
+            stmt = dialect_insert(self.db, model).values(upserts)
+            self.db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=TOP_ITEMS_KEY,
+                    set_={
+                        **{column: stmt.excluded[column] for column in columns},
+                        "timestamp": func.now(),
+                    },
+                )
+            )
 
-        # Filter out track_ids that already have audio features
-        new_track_ids = [tid for tid in track_ids if tid not in existing_track_ids]
+        # Spotify returned fewer items than before
+        deleted = (
+            self.db.query(model)
+            .filter(
+                model.user_id == user_id,
+                model.term == term,
+                model.rank > len(rows),
+            )
+            .delete(synchronize_session=False)
+        )
+
+        digest_stmt = dialect_insert(self.db, TopItemsDigest).values(
+            user_id=user_id,
+            kind=kind,
+            term=term,
+            digest=digest,
+            updated_at=datetime.now(),
+        )
+        self.db.execute(
+            digest_stmt.on_conflict_do_update(
+                index_elements=["user_id", "kind", "term"],
+                set_={
+                    "digest": digest_stmt.excluded.digest,
+                    "updated_at": digest_stmt.excluded.updated_at,
+                },
+            )
+        )
+        return len(upserts) + deleted
 
+    def _fetch_new_audio_features(self, track_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetch audio features for tracks that do not have them stored yet.
+        Returns audio_features rows to insert; misses are added to the session.
+        """
+        # Skip tracks with stored features or a recent miss, mostly without
+        # touching the database
+        new_track_ids = audio_features_cache.unseen_track_ids(self.db, track_ids)
         if not new_track_ids:
-            return
+            return []
 
         # Fetch audio features for new tracks
-        audio_features = self.get_audio_features(new_track_ids)
+        audio_features = [
+            feature
+            for feature in self.get_audio_features(new_track_ids)
+            if feature and feature.get("id")
+        ]
 
-        # Store audio features
-        for feature in audio_features:
-            if not feature or not feature.get("id"):
-                continue
+        # Spotify returns null for tracks without features; remember them so
+        # they are not requested again until the retry TTL has passed
+        found = {feature["id"] for feature in audio_features}
+        audio_features_cache.record_misses(
+            self.db, [tid for tid in new_track_ids if tid not in found]
+        )
+
+        return [
+            {
+                "track_id": feature.get("id"),
+                "danceability": feature.get("danceability", 0),
+                "energy": feature.get("energy", 0),
+                "key": feature.get("key", 0),
+                "loudness": feature.get("loudness", 0),
+                "mode": feature.get("mode", 0),
+                "speechiness": feature.get("speechiness", 0),
+                "acousticness": feature.get("acousticness", 0),
+                "instrumentalness": feature.get("instrumentalness", 0),
+                "liveness": feature.get("liveness", 0),
+                "valence": feature.get("valence", 0),
+                "tempo": feature.get("tempo", 0),
+                "duration_ms": feature.get("duration_ms", 0),
+                "time_signature": feature.get("time_signature", 4),
+            }
+            for feature in audio_features
+        ]
 
-            audio_feature = AudioFeatures(
-                track_id=feature.get("id"),
-                danceability=feature.get("danceability", 0),
-                energy=feature.get("energy", 0),
-                key=feature.get("key", 0),
-                loudness=feature.get("loudness", 0),
-                mode=feature.get("mode", 0),
-                speechiness=feature.get("speechiness", 0),
-                acousticness=feature.get("acousticness", 0),
-                instrumentalness=feature.get("instrumentalness", 0),
-                liveness=feature.get("liveness", 0),
-                valence=feature.get("valence", 0),
-                tempo=feature.get("tempo", 0),
-                duration_ms=feature.get("duration_ms", 0),
-                time_signature=feature.get("time_signature", 4),
-            )
-            self.db.add(audio_feature)
+    def _insert_audio_features(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Insert audio features rows, skipping tracks another sync stored
+        meanwhile. Returns the number inserted; does not commit.
+        """
+        if not rows:
+            return 0
+        stmt = (
+            dialect_insert(self.db, AudioFeatures)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["track_id"])
+            .returning(AudioFeatures.track_id)
+        )
+        return len(self.db.execute(stmt).all())
 
+    def _store_audio_features(self, track_ids: List[str]):
+        """
+        Fetch and store audio features for tracks
+        """
+        audio_features = self._fetch_new_audio_features(track_ids)
+        if self._insert_audio_features(audio_features):
+            # New features change this user's audio feature averages
+            bump_data_version(self.db, str(self.user.user_id))
         self.db.commit()
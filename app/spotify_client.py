@@ -0,0 +1,263 @@
+import asyncio
+import logging
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.auth import (
+    SPOTIFY_API_BASE_URL,
+    SPOTIFY_TOKEN_URL,
+    spotify_token_headers,
+)
+from app.config import settings
+from app.rate_limit import RateLimiter, spotify_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+# Spotify API limits audio feature lookups to 100 IDs per request
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+
+class AsyncSpotifyClient:
+    """
+    Async Spotify Web API client sharing one keep-alive connection pool.
+    Requests are made with the access token passed to each call, so a single
+    client can sync many users concurrently from one worker. Token refresh
+    on expiry is left to the caller.
+    """
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        max_keepalive_connections: int | None = None,
+        max_per_host: int | None = None,
+        timeout: float | None = None,
+        connect_timeout: float | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or settings.SPOTIFY_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections
+            or settings.SPOTIFY_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        )
+        self.timeout = httpx.Timeout(
+            timeout or settings.SPOTIFY_HTTP_TIMEOUT_SECONDS,
+            connect=connect_timeout or settings.SPOTIFY_HTTP_CONNECT_TIMEOUT_SECONDS,
+        )
+        self.max_per_host = max_per_host or settings.SPOTIFY_HTTP_MAX_PER_HOST
+        self.transport = transport
+        self.rate_limiter = rate_limiter or spotify_rate_limiter
+
+        self._client: httpx.AsyncClient | None = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Get the pooled client, creating it for the running event loop.
+        Pools and semaphores are bound to a loop, so a new loop gets new ones.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._retire_client()
+            self._client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout, transport=self.transport
+            )
+            self._host_semaphores = {}
+            self._loop = loop
+        return self._client
+
+    def _retire_client(self) -> None:
+        """
+        Close the client of the previous event loop. Its connections can only
+        be closed on that loop, so this works while it runs in another
+        thread; a loop that has stopped should have called aclose() first.
+        """
+        client, loop = self._client, self._loop
+        self._client = None
+        if client is None or loop is None or client.is_closed:
+            return
+        if loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            logger.warning(
+                "Spotify client pool was not closed before its event loop "
+                "stopped; call aclose() when the loop shuts down"
+            )
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(
+                self.max_per_host
+            )
+        return semaphore
+
+    async def aclose(self) -> None:
+        """
+        Close the pooled connections
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str] | None = None,
+        params: Dict[str, Any] | None = None,
+        data: Dict[str, Any] | None = None,
+        json: Dict[str, Any] | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Make a rate limited request on the shared pool, raising
+        httpx.HTTPStatusError on 4xx/5xx responses that are not retried
+        """
+        client = self._get_client()
+        for attempt in range(self.rate_limiter.max_retries + 1):
+            await self.rate_limiter.acquire_async()
+            async with self._host_semaphore(url):
+                response = await client.request(
+                    method, url, headers=headers, params=params, data=data, json=json
+                )
+            if response.is_error:
+                # 429 (Retry-After) and 5xx responses are retried after a delay
+                delay = await self.rate_limiter.retry_delay_async(
+                    response.status_code, response.headers, attempt
+                )
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    continue
+            response.raise_for_status()
+            return response.json()
+        raise RuntimeError("Spotify request retries exhausted")
+
+    async def _api_get(
+        self, access_token: str, endpoint: str, params: Dict[str, Any] | None = None
+    ) -> Dict[str, Any]:
+        return await self.request(
+            "GET",
+            f"{SPOTIFY_API_BASE_URL}{endpoint}",
+            headers={"Authorization": f"Bearer {access_token}"},
+            params=params,
+        )
+
+    # --- Token endpoints ---
+
+    async def get_tokens(self, code: str) -> Dict[str, Any]:
+        """
+        Exchange the authorization code for access and refresh tokens
+        """
+        return await self.request(
+            "POST",
+            SPOTIFY_TOKEN_URL,
+            headers=spotify_token_headers(),
+            data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": settings.SPOTIFY_REDIRECT_URI,
+            },
+        )
+
+    async def refresh_token(self, refresh_token: str) -> Dict[str, Any]:
+        """
+        Refresh an access token using the refresh token
+        """
+        return await self.request(
+            "POST",
+            SPOTIFY_TOKEN_URL,
+            headers=spotify_token_headers(),
+            data={"grant_type": "refresh_token", "refresh_token": refresh_token},
+        )
+
+    # --- Web API endpoints (same surface as SpotifyAPI) ---
+
+    async def get_user_profile(self, access_token: str) -> Dict[str, Any]:
+        """
+        Get the user's Spotify profile
+        """
+        return await self._api_get(access_token, "/me")
+
+    async def get_recently_played(
+        self,
+        access_token: str,
+        limit: int = 50,
+        after: int | None = None,
+        before: int | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Get the user's recently played tracks
+        """
+        params: Dict[str, Any] = {"limit": limit}
+        if after is not None:
+            params["after"] = after
+        if before is not None:
+            params["before"] = before
+
+        return await self._api_get(
+            access_token, "/me/player/recently-played", params=params
+        )
+
+    async def get_top_artists(
+        self,
+        access_token: str,
+        time_range: str = "medium_term",
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Get the user's top artists
+        time_range: 'short_term' (4 weeks), 'medium_term' (6 months), or 'long_term' (years)
+        """
+        params = {"time_range": time_range, "limit": limit, "offset": offset}
+        return await self._api_get(access_token, "/me/top/artists", params=params)
+
+    async def get_top_tracks(
+        self,
+        access_token: str,
+        time_range: str = "medium_term",
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Get the user's top tracks
+        time_range: 'short_term' (4 weeks), 'medium_term' (6 months), or 'long_term' (years)
+        """
+        params = {"time_range": time_range, "limit": limit, "offset": offset}
+        return await self._api_get(access_token, "/me/top/tracks", params=params)
+
+    async def get_audio_features(
+        self, access_token: str, track_ids: List[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Get audio features for multiple tracks; batches of 100 IDs are
+        requested concurrently
+        """
+        if not track_ids:
+            return []
+
+        responses = await asyncio.gather(
+            *(
+                self._api_get(
+                    access_token,
+                    "/audio-features",
+                    params={
+                        "ids": ",".join(track_ids[i : i + AUDIO_FEATURES_BATCH_SIZE])
+                    },
+                )
+                for i in range(0, len(track_ids), AUDIO_FEATURES_BATCH_SIZE)
+            )
+        )
+        return [
+            feature
+            for response in responses
+            for feature in response.get("audio_features", [])
+        ]
+
+
+# Process-wide client; share it so requests reuse pooled connections
+spotify_client = AsyncSpotifyClient()
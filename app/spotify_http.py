@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Dict
+
+import httpx
+
+from app.config import settings
+
+
+def spotify_http_limits() -> httpx.Limits:
+    """
+    Connection pool limits for Spotify clients, from settings
+    """
+    return httpx.Limits(
+        max_connections=settings.SPOTIFY_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.SPOTIFY_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+
+def spotify_http_timeout() -> httpx.Timeout:
+    """
+    Request timeouts for Spotify clients, from settings
+    """
+    return httpx.Timeout(
+        settings.SPOTIFY_HTTP_TIMEOUT_SECONDS,
+        connect=settings.SPOTIFY_HTTP_CONNECT_TIMEOUT_SECONDS,
+    )
+
+
+class HostLimitedClient(httpx.Client):
+    """
+    Blocking httpx client allowing at most max_per_host requests in flight
+    per host, the same cap AsyncSpotifyClient applies; requests over it wait
+    for a slot instead of opening more connections
+    """
+
+    def __init__(self, max_per_host: int, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.max_per_host = max_per_host
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_semaphores_lock = threading.Lock()
+
+    def _host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._host_semaphores_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._host_semaphores[host] = threading.BoundedSemaphore(
+                    self.max_per_host
+                )
+            return semaphore
+
+    def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        # Non-streaming sends read the body before returning, so the slot is
+        # held for the whole exchange
+        with self._host_semaphore(request.url.host):
+            return super().send(request, **kwargs)
+
+
+# Process-wide keep-alive pool for blocking Spotify requests (SpotifyAPI
+# syncs, token refreshes, the OAuth callback). httpx.Client is thread-safe,
+# so worker threads share its connections.
+spotify_http = HostLimitedClient(
+    settings.SPOTIFY_HTTP_MAX_PER_HOST,
+    limits=spotify_http_limits(),
+    timeout=spotify_http_timeout(),
+)
@@ -0,0 +1,113 @@
+import logging
+import threading
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+
+from sqlalchemy.orm import Session
+
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+# Refresh Spotify access tokens this long before they expire
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+def _utcnow() -> datetime:
+    # token_expires_at is stored as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def token_needs_refresh(user: User, margin: timedelta = TOKEN_REFRESH_MARGIN) -> bool:
+    """
+    Whether the user's Spotify access token expires within the margin
+    """
+    expires_at = getattr(user, "token_expires_at", None)
+    return expires_at is None or expires_at < _utcnow() + margin
+
+
+class TokenManager:
+    """
+    Refreshes users' Spotify access tokens, one refresh per user at a time.
+    Threads in this process wait on a per-user lock and processes on the
+    user's row lock; whoever gets the lock second re-reads the row and finds
+    the token already refreshed, so Spotify sees a single refresh and a
+    rotated refresh token is never overwritten with a stale one.
+    """
+
+    def __init__(self, margin: timedelta = TOKEN_REFRESH_MARGIN):
+        self.margin = margin
+        # Held strongly only by callers waiting on or holding them, so a
+        # user's lock goes away once nobody is refreshing for them
+        self._locks: "weakref.WeakValueDictionary[str, threading.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, user_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(user_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._locks[user_id] = lock
+            return lock
+
+    def ensure_fresh(
+        self,
+        db: Session,
+        user: User,
+        refresh: Callable[[str], Dict[str, Any]],
+        margin: timedelta | None = None,
+        rejected_token: str | None = None,
+    ) -> User:
+        """
+        Refresh the user's access token with refresh(refresh_token) if it
+        expires within the margin (the manager's unless given), or, when
+        rejected_token is given, if the stored token is still the one Spotify
+        rejected. Commits when the row is locked, so call it before making
+        other changes in the session. Errors from refresh are raised after
+        rolling back.
+        """
+        margin = self.margin if margin is None else margin
+
+        def needs_refresh() -> bool:
+            if rejected_token is not None:
+                # Another worker may already have replaced the rejected token
+                return user.access_token == rejected_token
+            return token_needs_refresh(user, margin)
+
+        if not needs_refresh():
+            return user
+
+        with self._lock_for(str(user.user_id)):
+            # SELECT ... FOR UPDATE: other processes refreshing this user
+            # block here until we commit
+            db.refresh(user, with_for_update=True)
+            if not needs_refresh():
+                db.commit()
+                return user
+
+            try:
+                logger.info(f"Refreshing Spotify token for user {user.user_id}")
+                token_data = refresh(str(user.refresh_token))
+            except Exception:
+                db.rollback()
+                raise
+
+            setattr(user, "access_token", token_data.get("access_token"))
+            setattr(
+                user,
+                "token_expires_at",
+                _utcnow() + timedelta(seconds=token_data.get("expires_in", 3600)),
+            )
+            # Spotify might issue a new refresh token
+            if "refresh_token" in token_data:
+                setattr(user, "refresh_token", token_data["refresh_token"])
+            db.commit()
+            db.refresh(user)
+        return user
+
+
+# Process-wide manager; all token refreshes go through it
+token_manager = TokenManager()
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Collection, Dict, List
+
+import httpx
+from sqlalchemy.orm import Session
+
+from app.auth import refresh_spotify_token
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User
+from app.rate_limit import RateLimiter, spotify_rate_limiter
+from app.token_manager import token_manager
+
+logger = logging.getLogger(__name__)
+
+
+def users_due_for_refresh(
+    db: Session, lead: timedelta, limit: int, exclude: Collection[str] = ()
+) -> List[str]:
+    """
+    IDs of users whose Spotify token expires within the lead time, soonest
+    first, other than the excluded ones
+    """
+    # token_expires_at is stored as naive UTC
+    expires_before = datetime.now(timezone.utc).replace(tzinfo=None) + lead
+    query = db.query(User.user_id).filter(
+        User.refresh_token.isnot(None),
+        User.token_expires_at < expires_before,
+    )
+    if exclude:
+        query = query.filter(User.user_id.notin_(exclude))
+    rows = query.order_by(User.token_expires_at).limit(limit).all()
+    return [str(user_id) for (user_id,) in rows]
+
+
+class TokenRefresher:
+    """
+    Background thread that refreshes Spotify tokens shortly before they
+    expire, so requests find a valid token instead of refreshing inline.
+    Refreshes run on a bounded pool through the token manager (coalescing
+    with any request refreshing the same user) and the shared rate limiter.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        refresh: Callable[[str], Dict[str, Any]] = refresh_spotify_token,
+        rate_limiter: RateLimiter | None = None,
+        lead: timedelta | None = None,
+        interval: float | None = None,
+        concurrency: int | None = None,
+        batch_size: int | None = None,
+        retry_after: timedelta | None = None,
+    ):
+        self.session_factory = session_factory
+        self.refresh = refresh
+        self.rate_limiter = rate_limiter or spotify_rate_limiter
+        self.lead = lead or timedelta(minutes=settings.TOKEN_REFRESHER_LEAD_MINUTES)
+        self.interval = interval or settings.TOKEN_REFRESHER_INTERVAL_SECONDS
+        self.concurrency = concurrency or settings.TOKEN_REFRESHER_CONCURRENCY
+        self.batch_size = batch_size or settings.TOKEN_REFRESHER_BATCH_SIZE
+        self.retry_after = retry_after or timedelta(
+            minutes=settings.TOKEN_REFRESHER_RETRY_MINUTES
+        )
+
+        # user_id -> monotonic time before which a failed refresh is not retried
+        self._failed_until: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _rate_limited_refresh(self, refresh_token: str) -> Dict[str, Any]:
+        self.rate_limiter.acquire()
+        try:
+            return self.refresh(refresh_token)
+        except httpx.HTTPStatusError as e:
+            # A 429 pauses the shared bucket; the user is retried later
+            self.rate_limiter.retry_delay(
+                e.response.status_code, e.response.headers, attempt=0
+            )
+            raise
+
+    def _refresh_user(self, user_id: str) -> bool:
+        db = self.session_factory()
+        try:
+            user = db.query(User).filter(User.user_id == user_id).first()
+            if user is None:
+                return False
+            token_manager.ensure_fresh(
+                db, user, self._rate_limited_refresh, margin=self.lead
+            )
+            self._failed_until.pop(user_id, None)
+            return True
+        except Exception as e:
+            logger.warning(f"Background token refresh failed for user {user_id}: {e}")
+            self._failed_until[user_id] = (
+                time.monotonic() + self.retry_after.total_seconds()
+            )
+            return False
+        finally:
+            db.close()
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Refresh every token due within the lead time, up to one batch.
+        Returns the number of users refreshed and failed.
+        """
+        # Users in backoff are excluded in the query, so they cannot fill
+        # every batch and starve the rest
+        now = time.monotonic()
+        self._failed_until = {
+            user_id: until
+            for user_id, until in self._failed_until.items()
+            if until > now
+        }
+        db = self.session_factory()
+        try:
+            due = users_due_for_refresh(
+                db, self.lead, self.batch_size, exclude=list(self._failed_until)
+            )
+        finally:
+            db.close()
+
+        if not due:
+            return {"refreshed": 0, "failed": 0}
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="token-refresher"
+        ) as executor:
+            results = list(executor.map(self._refresh_user, due))
+
+        refreshed = sum(results)
+        logger.info(f"Refreshed {refreshed} of {len(due)} expiring Spotify tokens")
+        return {"refreshed": refreshed, "failed": len(results) - refreshed}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Token refresher scan failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """
+        Start scanning in a daemon thread
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="token-refresher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop scanning and wait for the current scan to finish
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+# Started with the API (see app.main)
+token_refresher = TokenRefresher()
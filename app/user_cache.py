@@ -0,0 +1,167 @@
+import importlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+
+from app.config import settings
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+# Columns needed to authenticate a request. Other columns are loaded from the
+# database on first access, e.g. data_version for ETags, which sync workers
+# bump from other processes.
+CACHED_USER_FIELDS = [
+    "id",
+    "user_id",
+    "spotify_user_id",
+    "spotify_display_name",
+    "email",
+    "access_token",
+    "refresh_token",
+    "token_expires_at",
+]
+# Session.info key collecting users changed in the current transaction
+_PENDING_INVALIDATIONS = "user_cache_invalidations"
+
+
+class LocalUserCacheBackend:
+    """
+    In-process LRU with per-entry expiry
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # user_id -> (monotonic expiry, fields)
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, fields = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return fields
+
+    def set(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class UserCache:
+    """
+    Cache of users' auth fields keyed by user_id, so authenticated requests
+    can skip the user lookup. Entries expire after the TTL and are dropped
+    whenever a User row is updated or deleted through the ORM.
+
+    The backend is any object with get(key), set(key, value, ttl) and
+    delete(key); values are dicts of column values. A shared backend makes
+    invalidations reach every process.
+    """
+
+    def __init__(self, backend: Any, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    def get(
+        self, db: Session, user_id: str, token_valid_until: datetime | None = None
+    ) -> User | None:
+        """
+        The cached user attached to db without a query, or None on a miss.
+        Entries whose Spotify token expires before token_valid_until are
+        treated as misses, so token refreshes always start from the database.
+        """
+        if self.ttl_seconds <= 0:
+            return None
+        try:
+            fields = self.backend.get(user_id)
+        except Exception as e:
+            logger.warning(f"User cache lookup failed: {e}")
+            return None
+        if fields is None:
+            return None
+
+        expires_at = fields.get("token_expires_at")
+        if token_valid_until is not None and (
+            expires_at is None or expires_at < token_valid_until
+        ):
+            return None
+
+        user = User(**fields)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, user: User) -> None:
+        """
+        Cache the user's auth fields
+        """
+        if self.ttl_seconds <= 0:
+            return
+        fields = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+        try:
+            self.backend.set(str(user.user_id), fields, self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"User cache update failed: {e}")
+
+    def invalidate(self, user_id: str) -> None:
+        try:
+            self.backend.delete(user_id)
+        except Exception as e:
+            logger.warning(f"User cache invalidation failed: {e}")
+
+
+def _make_backend() -> Any:
+    if settings.USER_CACHE_BACKEND:
+        module_name, _, attribute = settings.USER_CACHE_BACKEND.partition(":")
+        backend = getattr(importlib.import_module(module_name), attribute)
+        return backend() if isinstance(backend, type) else backend
+    return LocalUserCacheBackend(settings.USER_CACHE_MAX_SIZE)
+
+
+# Process-wide cache used by get_current_user
+user_cache = UserCache(_make_backend(), settings.USER_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper: Any, connection: Any, target: User) -> None:
+    # Drop the entry at flush, and again after commit so a request that read
+    # the old row in the meantime cannot leave it cached
+    user_id = str(target.user_id)
+    user_cache.invalidate(user_id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session) -> None:
+    for user_id in session.info.pop(_PENDING_INVALIDATIONS, ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_users(session: Session) -> None:
+    session.info.pop(_PENDING_INVALIDATIONS, None)
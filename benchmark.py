@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import httpx
+
+# Add the project root to the Python path
+project_root = Path(__file__).parent
+sys.path.append(str(project_root))
+
+# Measure concurrent request throughput of one running API worker, e.g.
+#   uvicorn app.main:app --workers 1
+#   python benchmark.py --user-id <user_id> --concurrency 50 --requests 1000
+# Run it against the same worker before and after a change to compare.
+
+
+async def _run(
+    url: str, cookie: str, concurrency: int, total: int, timeout: float
+) -> None:
+    from app.auth import ACCESS_TOKEN_COOKIE
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(
+        cookies={ACCESS_TOKEN_COOKIE: cookie},
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+
+        async def worker() -> None:
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{url}: {total} requests, concurrency {concurrency}")
+    print(f"  throughput: {total / elapsed:.1f} req/s ({errors} errors)")
+    print(
+        f"  latency ms: p50 {statistics.median(latencies) * 1000:.1f}"
+        f"  p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}"
+        f"  max {latencies[-1] * 1000:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Concurrent request throughput of a running API worker"
+    )
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/api/v1/insights/basic")
+    parser.add_argument(
+        "--user-id", required=True, help="User to sign the JWT cookie for"
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    from app.auth import create_access_token
+
+    asyncio.run(
+        _run(
+            f"{args.base_url.rstrip('/')}{args.endpoint}",
+            create_access_token({"sub": args.user_id}),
+            args.concurrency,
+            args.requests,
+            args.timeout,
+        )
+    )
@@ -0,0 +1,23 @@
+import logging
+import signal
+import sys
+import threading
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = Path(__file__).parent
+sys.path.append(str(project_root))
+
+# Run the sync scheduler: python scheduler.py
+# Queues scheduled syncs for worker.py to run; run a single scheduler process
+if __name__ == "__main__":
+    from app.scheduler import SyncScheduler
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    SyncScheduler().run(stop)
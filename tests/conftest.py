@@ -8,7 +8,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
+from app.audio_features_cache import audio_features_cache
 from app.database import Base
+from app.user_cache import user_cache
 
 
 @pytest.fixture(scope="session")
@@ -30,3 +32,17 @@ def db_session(engine: Engine) -> Generator[Session, None, None]:
     session.close()
     transaction.rollback()
     connection.close()
+
+
+@pytest.fixture(autouse=True)
+def clear_audio_features_cache() -> Generator[None, None, None]:
+    """Forget process-wide audio features cache entries between tests."""
+    yield
+    audio_features_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache() -> Generator[None, None, None]:
+    """Forget process-wide cached users between tests."""
+    yield
+    user_cache.backend.clear()
@@ -0,0 +1,91 @@
+"""
+Tests for app.audio_features_cache module.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, Mock, patch
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.audio_features_cache import AudioFeaturesCache
+from app.models import AudioFeatures, AudioFeaturesMiss, User
+from app.spotify_api import SpotifyAPI
+
+
+@pytest.fixture
+def spotify_api(db_session: Session) -> SpotifyAPI:
+    """Create a SpotifyAPI instance for a test user."""
+    user = User(
+        user_id="features_user_123",
+        spotify_user_id="spotify_features_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.now() + timedelta(hours=1),
+    )
+    db_session.add(user)
+    db_session.commit()
+    return SpotifyAPI(user=user, db=db_session)
+
+
+@patch.object(SpotifyAPI, "get_audio_features")
+def test_missing_features_are_not_requested_again(
+    mock_features: MagicMock, spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test tracks Spotify has no features for are negatively cached."""
+    mock_features.return_value = [{"id": "track_found", "energy": 0.8}, None]
+
+    spotify_api._store_audio_features(["track_found", "track_missing"])  # type: ignore
+    spotify_api._store_audio_features(["track_found", "track_missing"])  # type: ignore
+
+    mock_features.assert_called_once()
+    assert db_session.query(AudioFeatures).count() == 1
+    miss = db_session.query(AudioFeaturesMiss).one()
+    assert miss.track_id == "track_missing"  # type: ignore
+
+
+@patch.object(SpotifyAPI, "get_audio_features", return_value=[None])
+def test_missing_features_are_retried_after_ttl(
+    mock_features: MagicMock, spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test a miss older than the retry TTL is requested again."""
+    db_session.add(
+        AudioFeaturesMiss(
+            track_id="track_missing",
+            checked_at=datetime.now() - timedelta(days=30),
+            attempts=1,
+        )
+    )
+    db_session.commit()
+
+    spotify_api._store_audio_features(["track_missing"])  # type: ignore
+
+    mock_features.assert_called_once_with(["track_missing"])
+    miss = db_session.query(AudioFeaturesMiss).one()
+    db_session.refresh(miss)
+    assert miss.attempts == 2  # type: ignore
+    assert miss.checked_at > datetime.now() - timedelta(minutes=1)  # type: ignore
+
+
+def test_known_tracks_skip_the_database(db_session: Session):
+    """Test tracks learned from the database are then answered in-process."""
+    db_session.add(AudioFeatures(track_id="track_1"))
+    db_session.commit()
+    cache = AudioFeaturesCache(max_size=10, miss_retry=timedelta(days=7))
+
+    assert cache.unseen_track_ids(db_session, ["track_1", "track_2"]) == ["track_2"]
+
+    db = Mock()
+    assert cache.unseen_track_ids(db, ["track_1"]) == []
+    db.query.assert_not_called()
+
+
+def test_cache_is_bounded(db_session: Session):
+    """Test the least recently used track IDs are evicted past max_size."""
+    db_session.add_all([AudioFeatures(track_id=f"track_{i}") for i in range(5)])
+    db_session.commit()
+    cache = AudioFeaturesCache(max_size=3, miss_retry=timedelta(days=7))
+
+    cache.unseen_track_ids(db_session, [f"track_{i}" for i in range(5)])
+
+    assert len(cache._known) == 3  # type: ignore
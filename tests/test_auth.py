@@ -35,7 +35,7 @@ def test_create_access_token_with_expires_delta() -> None:
     assert len(token) > 0
 
 
-@patch("app.auth.requests.post")
+@patch("app.auth.spotify_http.post")
 def test_get_spotify_tokens_success(mock_post: MagicMock) -> None:
     """Test successful Spotify token exchange."""
     mock_response = Mock()
@@ -53,7 +53,7 @@ def test_get_spotify_tokens_success(mock_post: MagicMock) -> None:
     assert result["expires_in"] == 3600
 
 
-@patch("app.auth.requests.post")
+@patch("app.auth.spotify_http.post")
 def test_refresh_spotify_token_success(mock_post: MagicMock) -> None:
     """Test successful Spotify token refresh."""
     mock_response = Mock()
@@ -69,7 +69,7 @@ def test_refresh_spotify_token_success(mock_post: MagicMock) -> None:
     assert result["expires_in"] == 3600
 
 
-@patch("app.auth.requests.get")
+@patch("app.auth.spotify_http.get")
 def test_get_spotify_user_info_success(mock_get: MagicMock) -> None:
     """Test successful Spotify user info retrieval."""
     mock_response = Mock()
@@ -87,7 +87,7 @@ def test_get_spotify_user_info_success(mock_get: MagicMock) -> None:
     assert result["email"] == "test@example.com"
 
 
-@patch("app.auth.requests.post")
+@patch("app.auth.spotify_http.post")
 def test_get_spotify_tokens_failure(mock_post: MagicMock) -> None:
     """Test Spotify token exchange failure."""
     mock_response = Mock()
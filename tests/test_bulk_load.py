@@ -0,0 +1,89 @@
+"""
+Tests for app.bulk_load module.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.bulk_load import load
+from app.models import DailyListeningRollup, ListeningHistory, User
+
+
+@pytest.fixture
+def test_user(db_session: Session) -> User:
+    """Create a test user for bulk loading."""
+    user = User(user_id="bulk_user_123", spotify_user_id="spotify_bulk_123")
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _records(user: User, count: int) -> Iterator[Dict[str, Any]]:
+    """Generate dump-style records, one play per hour."""
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        yield {
+            "user_id": user.user_id,
+            "track_id": f"track_{i % 10}",
+            "track_name": f"Track {i % 10}",
+            "artist_id": f"artist_{i % 3}",
+            "artist_name": f"Artist {i % 3}",
+            "played_at": (start + timedelta(hours=i)).isoformat() + "Z",
+            "duration_ms": 200000,
+        }
+
+
+def test_load_streams_batches_and_reports_stats(db_session: Session, test_user: User):
+    """Test a generator is loaded in batches with rollups and stats."""
+    stats = load(_records(test_user, 250), batch_size=100, db=db_session)
+
+    assert stats["read"] == 250
+    assert stats["inserted"] == 250
+    assert stats["skipped"] == 0
+    assert stats["batches"] == 3
+    assert stats["rows_per_second"] > 0
+    assert db_session.query(ListeningHistory).count() == 250
+    rollup_plays = sum(r.play_count for r in db_session.query(DailyListeningRollup))
+    assert rollup_plays == 250
+    db_session.refresh(test_user)
+    assert test_user.data_version == 3  # type: ignore
+
+
+def test_load_skips_duplicates(db_session: Session, test_user: User):
+    """Test reloading and in-batch repeats do not insert duplicate plays."""
+    load(_records(test_user, 50), batch_size=20, db=db_session)
+    records = list(_records(test_user, 60))
+
+    stats = load(records + records[-5:], batch_size=20, db=db_session)
+
+    assert stats["read"] == 65
+    assert stats["inserted"] == 10
+    assert stats["skipped"] == 55
+    assert db_session.query(ListeningHistory).count() == 60
+
+
+def test_load_accepts_model_objects(db_session: Session, test_user: User):
+    """Test ListeningHistory objects can be loaded like mappings."""
+    plays = [
+        ListeningHistory(
+            user_id=test_user.user_id,
+            track_id="track_obj",
+            played_at=datetime(2024, 2, 1, 12, 0),
+            duration_ms=1000,
+        )
+    ]
+
+    stats = load(plays, db=db_session)
+
+    assert stats["inserted"] == 1
+    stored = db_session.query(ListeningHistory).one()
+    assert stored.played_at == datetime(2024, 2, 1, 12, 0)
+
+
+def test_load_rejects_invalid_batch_size(db_session: Session):
+    """Test batch_size must be positive."""
+    with pytest.raises(ValueError):
+        load([], batch_size=0, db=db_session)
@@ -0,0 +1,175 @@
+"""
+Tests for app.columnar module.
+"""
+
+from datetime import datetime, timedelta
+from typing import List
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.orm import Session
+
+pytest.importorskip("numpy")
+
+from app.columnar import (
+    ColumnarInsightsGenerator,
+    SnapshotCache,
+    insights_generator_class,
+)
+from app.config import settings
+from app.insights import InsightsGenerator
+from app.insights_cache import bump_data_version
+from app.models import AudioFeatures, ListeningHistory, User
+from app.rollups import apply_plays_to_rollups
+
+
+@pytest.fixture
+def test_user(db_session: Session) -> User:
+    """Create a test user for columnar engine testing."""
+    user = User(
+        user_id="columnar_user_123",
+        spotify_user_id="spotify_columnar_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.now() + timedelta(hours=1),
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _add_plays(
+    db_session: Session, user: User, count: int, offset: int = 0
+) -> List[ListeningHistory]:
+    """Insert plays and keep the rollups in step, like the sync path."""
+    base_time = datetime.now().replace(microsecond=0)
+    plays = [
+        ListeningHistory(
+            user_id=user.user_id,
+            track_id=f"track_{i % 9}",
+            track_name=f"Track {i % 9}",
+            artist_id=f"artist_{i % 4}",
+            artist_name=f"Artist {i % 4}",
+            played_at=base_time - timedelta(days=i * 2, hours=i * 3, minutes=i),
+            duration_ms=120000 + i * 500,
+        )
+        for i in range(offset, offset + count)
+    ]
+    db_session.add_all(plays)
+    db_session.flush()
+    apply_plays_to_rollups(db_session, plays)
+    bump_data_version(db_session, str(user.user_id))
+    db_session.commit()
+    return plays
+
+
+def test_columnar_matches_sql_sections(db_session: Session, test_user: User):
+    """Test the vectorized sections return the same payload as SQL."""
+    _add_plays(db_session, test_user, 80)
+    db_session.add(AudioFeatures(track_id="track_2", danceability=0.4, energy=0.9))
+    db_session.commit()
+
+    sql = InsightsGenerator(db=db_session, user_id=str(test_user.user_id))  # type: ignore
+    columnar = ColumnarInsightsGenerator(
+        db=db_session,
+        user_id=str(test_user.user_id),  # type: ignore
+        cache=SnapshotCache(budget_bytes=10 * 1024 * 1024),
+    )
+
+    assert columnar.get_detailed_insights() == sql.get_detailed_insights()
+    assert columnar._get_listening_trends("week", 12) == sql._get_listening_trends(  # type: ignore
+        "week", 12
+    )
+
+
+def test_snapshot_resolved_once_per_generator(db_session: Session, test_user: User):
+    """Test a whole payload looks its snapshot up (and data_version) once."""
+    _add_plays(db_session, test_user, 20)
+    cache = SnapshotCache(budget_bytes=10 * 1024 * 1024)
+    columnar = ColumnarInsightsGenerator(
+        db=db_session, user_id=str(test_user.user_id), cache=cache  # type: ignore
+    )
+
+    with patch.object(cache, "get", wraps=cache.get) as get:
+        columnar.get_detailed_insights()
+
+    get.assert_called_once()
+
+
+def test_insights_engine_setting():
+    """Test INSIGHTS_ENGINE selects the generator class the endpoints use."""
+    assert insights_generator_class() is InsightsGenerator
+    with patch.object(settings, "INSIGHTS_ENGINE", "columnar"):
+        assert insights_generator_class() is ColumnarInsightsGenerator
+
+
+def test_snapshot_refreshes_incrementally(db_session: Session, test_user: User):
+    """Test new plays are appended to a cached snapshot."""
+    cache = SnapshotCache(budget_bytes=10 * 1024 * 1024)
+    _add_plays(db_session, test_user, 10)
+    snapshot = cache.get(db_session, str(test_user.user_id))
+    assert len(snapshot.played_at) == 10
+
+    _add_plays(db_session, test_user, 5, offset=10)
+    refreshed = cache.get(db_session, str(test_user.user_id))
+
+    assert len(refreshed.played_at) == 15
+    assert refreshed.track_codes.dtype.name == "int32"
+    # The snapshot handed out earlier is not changed under its readers
+    assert len(snapshot.played_at) == 10
+    assert cache.get(db_session, str(test_user.user_id)) is refreshed
+
+
+def test_snapshot_picks_up_plays_committed_out_of_id_order(
+    db_session: Session, test_user: User
+):
+    """Test a play with an id below the loaded ones still reaches the snapshot."""
+    cache = SnapshotCache(budget_bytes=10 * 1024 * 1024)
+    db_session.add(
+        ListeningHistory(
+            id=100,
+            user_id=test_user.user_id,
+            track_id="track_late",
+            played_at=datetime.now(),
+        )
+    )
+    db_session.commit()
+    assert len(cache.get(db_session, str(test_user.user_id)).played_at) == 1
+
+    # A concurrent sync took id 50 earlier but committed after the load
+    db_session.add(
+        ListeningHistory(
+            id=50,
+            user_id=test_user.user_id,
+            track_id="track_early",
+            played_at=datetime.now() - timedelta(hours=1),
+        )
+    )
+    bump_data_version(db_session, str(test_user.user_id))
+    db_session.commit()
+
+    snapshot = cache.get(db_session, str(test_user.user_id))
+    assert len(snapshot.played_at) == 2
+    assert {key[0] for key in snapshot.track_keys} == {"track_late", "track_early"}
+
+
+def test_snapshot_cache_evicts_least_recently_used(db_session: Session):
+    """Test snapshots beyond the memory budget are evicted LRU-first."""
+    users = []
+    for i in range(3):
+        user = User(user_id=f"lru_user_{i}", spotify_user_id=f"spotify_lru_{i}")
+        db_session.add(user)
+        db_session.commit()
+        _add_plays(db_session, user, 20)
+        users.append(user)
+
+    cache = SnapshotCache(budget_bytes=0)
+    one_snapshot = cache.get(db_session, "lru_user_0").nbytes
+    cache.budget_bytes = one_snapshot * 2
+    cache.get(db_session, "lru_user_1")
+    cache.get(db_session, "lru_user_0")  # Most recently used again
+    cache.get(db_session, "lru_user_2")
+
+    assert "lru_user_1" not in cache._snapshots  # type: ignore
+    assert "lru_user_0" in cache._snapshots  # type: ignore
+    assert "lru_user_2" in cache._snapshots  # type: ignore
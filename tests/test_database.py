@@ -6,6 +6,7 @@ import pytest
 from datetime import datetime, timedelta
 from app.models import User, ListeningHistory, AudioFeatures
 from app.insights import InsightsGenerator
+from app.rollups import rebuild_rollups
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
@@ -56,6 +57,8 @@ def test_insights_with_large_dataset(db_session: Session):
 
     db_session.add_all(listening_records)  # type: ignore
     db_session.commit()
+    rebuild_rollups(db_session, str(user.user_id))
+    db_session.commit()
 
     # Test insights generation
     insights_gen = InsightsGenerator(db=db_session, user_id=str(user.user_id))  # type: ignore
@@ -64,6 +67,7 @@ def test_insights_with_large_dataset(db_session: Session):
     assert insights["total_tracks_listened"] == 100
     assert len(insights["top_artists"]) <= 5  # Should return top 5 or fewer
     assert len(insights["top_tracks"]) <= 5  # Should return top 5 or fewer
+    assert insights["top_artists"][0]["listen_count"] == 10
 
 
 def test_insights_with_time_ranges(db_session: Session):
@@ -96,6 +100,8 @@ def test_insights_with_time_ranges(db_session: Session):
         db_session.add(record)
 
     db_session.commit()
+    rebuild_rollups(db_session, str(user.user_id))
+    db_session.commit()
 
     insights_gen = InsightsGenerator(db=db_session, user_id=str(user.user_id))  # type: ignore
     insights = insights_gen.get_basic_insights()
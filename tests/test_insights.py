@@ -2,11 +2,17 @@
 Tests for app.insights module.
 """
 
+import asyncio
+
 import pytest
-from app.insights import InsightsGenerator
-from app.models import ListeningHistory, User, AudioFeatures
-from sqlalchemy.orm import Session
+from app.insights import AsyncInsightsGenerator, InsightsGenerator
+from app.rollups import rebuild_rollups
+from app.models import ListeningHistory, User, AudioFeatures, TopTrack
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from datetime import datetime, timedelta
+from app.database import Base
 
 
 @pytest.fixture
@@ -87,6 +93,8 @@ def sample_listening_data(db_session: Session, test_user: User):
         db_session.add(feature)
 
     db_session.commit()
+    rebuild_rollups(db_session, str(test_user.user_id))
+    db_session.commit()
 
 
 def test_get_basic_insights_empty(insights_generator: InsightsGenerator):
@@ -124,6 +132,8 @@ def test_get_basic_insights_with_data(
     assert "top_tracks" in result
     assert "listening_time_stats" in result
     assert "audio_features_averages" in result
+    assert [a["listen_count"] for a in result["top_artists"]] == [1, 1]
+    assert result["listening_time_stats"]["total_listening_hours"] == 0.11
 
 
 def test_total_tracks_listened(
@@ -160,3 +170,339 @@ def test_get_detailed_insights_with_data(
     assert "listening_trends_by_month" in result
     assert "popular_vs_obscure" in result
     assert "mood_analysis" in result
+
+
+@pytest.fixture
+def varied_listening_data(db_session: Session, test_user: User):
+    """Add listening history with ties, old plays and missing audio features."""
+    base_time = datetime.now().replace(minute=30, second=0, microsecond=0)
+    records = []
+    for i in range(40):
+        records.append(
+            ListeningHistory(
+                user_id=test_user.user_id,
+                track_id=f"track_{i % 7}",
+                track_name=f"Track {i % 7}",
+                artist_id=f"artist_{i % 3}",
+                artist_name=f"Artist {i % 3}",
+                played_at=base_time - timedelta(days=i * 3, hours=i * 5),
+                duration_ms=150000 + i * 1000,
+            )
+        )
+    db_session.add_all(records)
+    db_session.add_all(
+        [
+            AudioFeatures(
+                track_id="track_0", danceability=0.9, energy=0.1, valence=0.3
+            ),
+            AudioFeatures(
+                track_id="track_3", danceability=0.2, energy=0.7, valence=0.8
+            ),
+        ]
+    )
+    db_session.commit()
+    rebuild_rollups(db_session, str(test_user.user_id))
+    db_session.commit()
+
+
+def test_single_query_basic_insights_matches_per_section(
+    db_session: Session,
+    test_user: User,
+    varied_listening_data,  # type: ignore
+):
+    """Test the single-query path returns exactly the per-section payload."""
+    per_section = InsightsGenerator(db=db_session, user_id=str(test_user.user_id))  # type: ignore
+    single_query = InsightsGenerator(
+        db=db_session, user_id=str(test_user.user_id), single_query=True  # type: ignore
+    )
+    assert single_query.get_basic_insights() == per_section.get_basic_insights()
+
+
+def test_single_query_basic_insights_empty(db_session: Session, test_user: User):
+    """Test the single-query path matches the per-section path with no data."""
+    per_section = InsightsGenerator(db=db_session, user_id=str(test_user.user_id))  # type: ignore
+    single_query = InsightsGenerator(
+        db=db_session, user_id=str(test_user.user_id), single_query=True  # type: ignore
+    )
+    assert single_query.get_basic_insights() == per_section.get_basic_insights()
+
+
+def test_listening_time_distribution(
+    db_session: Session, test_user: User, insights_generator: InsightsGenerator
+):
+    """Test hour histogram, heatmap and time-of-day buckets from SQL grouping."""
+    monday_morning = datetime(2025, 3, 10, 8, 15)  # A Monday
+    sunday_night = datetime(2025, 3, 16, 23, 45)  # A Sunday
+    for played_at in [
+        monday_morning,
+        monday_morning + timedelta(minutes=5),
+        sunday_night,
+    ]:
+        db_session.add(
+            ListeningHistory(
+                user_id=test_user.user_id,
+                track_id="track_1",
+                played_at=played_at,
+                duration_ms=180000,
+            )
+        )
+    db_session.commit()
+
+    result = insights_generator._get_listening_time_distribution()  # type: ignore
+
+    assert len(result["listening_by_hour"]) == 24
+    assert result["listening_by_hour"][8] == 2
+    assert result["listening_by_hour"][23] == 1
+    assert result["listening_heatmap"]["monday"][8] == 2
+    assert result["listening_heatmap"]["sunday"][23] == 1
+    assert sum(map(sum, result["listening_heatmap"].values())) == 3
+    assert result["listening_by_time_of_day"] == {
+        "morning": 2,
+        "afternoon": 0,
+        "evening": 1,
+        "night": 0,
+    }
+
+
+def test_listening_trends_granularities(
+    db_session: Session, test_user: User, insights_generator: InsightsGenerator
+):
+    """Test day, week and month trends are bucketed and gap-filled."""
+    today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    plays = [
+        today,
+        today + timedelta(minutes=5),
+        today - timedelta(days=1),
+        today - timedelta(days=8),
+    ]
+    for played_at in plays:
+        db_session.add(
+            ListeningHistory(
+                user_id=test_user.user_id,
+                track_id="track_1",
+                played_at=played_at,
+                duration_ms=180000,
+            )
+        )
+    db_session.commit()
+    rebuild_rollups(db_session, str(test_user.user_id))
+    db_session.commit()
+
+    daily = insights_generator._get_listening_trends("day", 10)  # type: ignore
+    assert len(daily) == 10
+    assert daily[today.strftime("%Y-%m-%d")] == 2
+    assert daily[(today - timedelta(days=1)).strftime("%Y-%m-%d")] == 1
+    assert sum(daily.values()) == 4
+
+    weekly = insights_generator._get_listening_trends("week", 3)  # type: ignore
+    this_week = today - timedelta(days=today.weekday())
+    assert list(weekly)[-1] == this_week.strftime("%Y-%m-%d")
+    assert sum(weekly.values()) == 4
+
+    monthly = insights_generator._get_listening_trends_by_month(3)  # type: ignore
+    assert list(monthly)[-1] == today.strftime("%Y-%m")
+    assert sum(monthly.values()) == 4
+
+
+def test_listening_trends_invalid_granularity(insights_generator: InsightsGenerator):
+    """Test unsupported trend granularities are rejected."""
+    with pytest.raises(ValueError):
+        insights_generator._get_listening_trends("year", 2)  # type: ignore
+
+
+def test_audio_features_weighted_by_plays(db_session: Session, test_user: User):
+    """Test audio feature and mood averages can be weighted by play count."""
+    for i, track_id in enumerate(["track_a", "track_a", "track_a", "track_b"]):
+        db_session.add(
+            ListeningHistory(
+                user_id=test_user.user_id,
+                track_id=track_id,
+                played_at=datetime.now() - timedelta(hours=i),
+                duration_ms=180000,
+            )
+        )
+    db_session.add_all(
+        [
+            AudioFeatures(
+                track_id="track_a", danceability=0.9, energy=0.8, valence=0.2
+            ),
+            AudioFeatures(
+                track_id="track_b", danceability=0.1, energy=0.4, valence=0.6
+            ),
+        ]
+    )
+    db_session.commit()
+
+    per_track = InsightsGenerator(db=db_session, user_id=str(test_user.user_id))  # type: ignore
+    per_play = InsightsGenerator(
+        db=db_session, user_id=str(test_user.user_id), weight_features_by_plays=True  # type: ignore
+    )
+
+    assert per_track._get_audio_features_averages()["danceability"] == 0.5  # type: ignore
+    assert per_play._get_audio_features_averages()["danceability"] == 0.7  # type: ignore
+    assert per_track._analyze_mood_based_on_features()["mood_quadrant_values"] == {  # type: ignore
+        "valence": 0.4,
+        "energy": 0.6,
+    }
+    assert per_play._analyze_mood_based_on_features()["mood_quadrant_values"] == {  # type: ignore
+        "valence": 0.3,
+        "energy": 0.7,
+    }
+
+
+def test_single_query_weighted_matches_per_section(
+    db_session: Session,
+    test_user: User,
+    varied_listening_data,  # type: ignore
+):
+    """Test the single-query path honours play-count weighting."""
+    per_section = InsightsGenerator(
+        db=db_session, user_id=str(test_user.user_id), weight_features_by_plays=True  # type: ignore
+    )
+    single_query = InsightsGenerator(
+        db=db_session,
+        user_id=str(test_user.user_id),  # type: ignore
+        single_query=True,
+        weight_features_by_plays=True,
+    )
+    assert single_query.get_basic_insights() == per_section.get_basic_insights()
+
+
+def test_popular_vs_obscure_brackets(
+    db_session: Session, test_user: User, insights_generator: InsightsGenerator
+):
+    """Test default and decile popularity brackets from one aggregate."""
+    for rank, popularity in enumerate([100, 85, 61, 45, 5], 1):
+        db_session.add(
+            TopTrack(
+                user_id=test_user.user_id,
+                track_id=f"track_{rank}",
+                term="short_term",
+                rank=rank,
+                popularity=popularity,
+            )
+        )
+    db_session.commit()
+
+    default = insights_generator._get_popular_vs_obscure_ratio()  # type: ignore
+    assert default["average_popularity"] == 59.2
+    assert default["popularity_distribution"] == {
+        "mainstream": 2,
+        "popular": 1,
+        "mixed": 1,
+        "niche": 0,
+        "obscure": 1,
+    }
+
+    deciles = insights_generator._get_popular_vs_obscure_ratio(  # type: ignore
+        InsightsGenerator.make_popularity_brackets(10)
+    )
+    distribution = deciles["popularity_distribution"]
+    assert len(distribution) == 10
+    assert distribution["90-100"] == 1
+    assert distribution["80-89"] == 1
+    assert distribution["0-9"] == 1
+    assert sum(distribution.values()) == 5
+
+
+def test_parallel_detailed_insights_match_serial(tmp_path):  # type: ignore
+    """Test sections evaluated on their own sessions merge into the same payload."""
+    # Sections run on separate connections, so use a shared file database
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'insights.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(file_engine)
+    session_factory = sessionmaker(bind=file_engine)
+
+    db = session_factory()
+    user = User(user_id="parallel_user", spotify_user_id="spotify_parallel")
+    db.add(user)
+    for i in range(30):
+        db.add(
+            ListeningHistory(
+                user_id="parallel_user",
+                track_id=f"track_{i % 6}",
+                track_name=f"Track {i % 6}",
+                artist_id=f"artist_{i % 4}",
+                artist_name=f"Artist {i % 4}",
+                played_at=datetime.now() - timedelta(days=i * 2, hours=i),
+                duration_ms=200000,
+            )
+        )
+    db.add(AudioFeatures(track_id="track_1", danceability=0.6, energy=0.7, valence=0.2))
+    db.add(TopTrack(user_id="parallel_user", term="short_term", rank=1, popularity=70))
+    db.commit()
+    rebuild_rollups(db, "parallel_user")
+    db.commit()
+
+    try:
+        serial = InsightsGenerator(db, "parallel_user").get_detailed_insights()
+        parallel = InsightsGenerator(
+            db, "parallel_user", session_factory=session_factory
+        ).get_detailed_insights()
+    finally:
+        db.close()
+        file_engine.dispose()
+
+    # Timings are only reported in debug mode and differ between runs
+    parallel.pop("section_timings_ms", None)
+    serial.pop("section_timings_ms", None)
+    assert parallel == serial
+    assert list(parallel) == list(serial)
+    assert parallel["total_tracks_listened"] == 30
+
+
+def test_async_insights_match_sync(tmp_path):  # type: ignore
+    """Test the async generator builds the same payloads, serially or concurrently."""
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'async.db'}")
+    Base.metadata.create_all(file_engine)
+    db = sessionmaker(bind=file_engine)()
+    db.add(User(user_id="async_user", spotify_user_id="spotify_async"))
+    for i in range(10):
+        db.add(
+            ListeningHistory(
+                user_id="async_user",
+                track_id=f"track_{i % 3}",
+                track_name=f"Track {i % 3}",
+                artist_id=f"artist_{i % 2}",
+                artist_name=f"Artist {i % 2}",
+                played_at=datetime.now() - timedelta(days=i, hours=i),
+                duration_ms=180000,
+            )
+        )
+    db.commit()
+    rebuild_rollups(db, "async_user")
+    db.commit()
+    expected_basic = InsightsGenerator(db, "async_user").get_basic_insights()
+    expected_detailed = InsightsGenerator(db, "async_user").get_detailed_insights()
+    db.close()
+    file_engine.dispose()
+
+    async def build() -> tuple:
+        async_engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'async.db'}"
+        )
+        try:
+            session_factory = async_sessionmaker(async_engine)
+            async with session_factory() as session:
+                generator = AsyncInsightsGenerator(session, "async_user")
+                parallel = AsyncInsightsGenerator(
+                    session, "async_user", session_factory=session_factory
+                )
+                return (
+                    await generator.get_basic_insights(),
+                    await generator.get_detailed_insights(),
+                    await parallel.get_detailed_insights(),
+                )
+        finally:
+            await async_engine.dispose()
+
+    basic, detailed, parallel = asyncio.run(build())
+    detailed.pop("section_timings_ms", None)
+    parallel.pop("section_timings_ms", None)
+    expected_detailed.pop("section_timings_ms", None)
+    assert basic == expected_basic
+    assert detailed == expected_detailed
+    assert parallel == expected_detailed
+    assert list(parallel) == list(expected_detailed)
@@ -0,0 +1,130 @@
+"""
+Tests for app.insights_cache module.
+"""
+
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.insights_cache import (
+    bump_data_version,
+    etag_matches,
+    get_cached_insights_json,
+    insights_etag,
+)
+from app.models import InsightsCache, User
+
+
+@pytest.fixture
+def test_user(db_session: Session) -> User:
+    """Create a test user for cache testing."""
+    user = User(
+        user_id="cache_user_123",
+        spotify_user_id="spotify_cache_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.now() + timedelta(hours=1),
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_cache_miss_computes_and_stores(db_session: Session, test_user: User):
+    """Test the first read computes the payload and persists it."""
+    compute = Mock(return_value={"total_tracks_listened": 3})
+
+    result = get_cached_insights_json(db_session, test_user, "basic", compute)
+
+    assert json.loads(result) == {"total_tracks_listened": 3}
+    compute.assert_called_once()
+    entry = db_session.query(InsightsCache).filter_by(user_id=test_user.user_id).one()
+    assert entry.payload_type == "basic"  # type: ignore
+    assert entry.data_version == 0  # type: ignore
+
+
+def test_cache_hit_skips_compute(db_session: Session, test_user: User):
+    """Test repeated reads are served from the cache."""
+    compute = Mock(return_value={"total_tracks_listened": 3})
+
+    first = get_cached_insights_json(db_session, test_user, "basic", compute)
+    second = get_cached_insights_json(db_session, test_user, "basic", compute)
+
+    assert first == second
+    compute.assert_called_once()
+
+
+def test_bump_data_version_invalidates(db_session: Session, test_user: User):
+    """Test a sync bump forces the payload to be recomputed."""
+    payloads: Dict[str, Any] = {"total_tracks_listened": 3}
+    compute = Mock(side_effect=lambda: dict(payloads))
+    get_cached_insights_json(db_session, test_user, "basic", compute)
+
+    payloads["total_tracks_listened"] = 5
+    bump_data_version(db_session, str(test_user.user_id))
+    db_session.commit()
+    db_session.refresh(test_user)
+
+    result = get_cached_insights_json(db_session, test_user, "basic", compute)
+    assert json.loads(result) == {"total_tracks_listened": 5}
+    assert compute.call_count == 2
+    assert test_user.data_version == 1  # type: ignore
+
+
+def test_payload_types_cached_separately(db_session: Session, test_user: User):
+    """Test basic and detailed payloads do not share a cache entry."""
+    get_cached_insights_json(db_session, test_user, "basic", lambda: {"kind": "basic"})
+    result = get_cached_insights_json(
+        db_session, test_user, "detailed", lambda: {"kind": "detailed"}
+    )
+    assert json.loads(result) == {"kind": "detailed"}
+
+
+def test_stale_and_excess_entries_are_pruned(db_session: Session, test_user: User):
+    """Test storing an entry drops unservable ones and caps entries per user."""
+    get_cached_insights_json(db_session, test_user, "old", lambda: {"kind": "old"})
+    bump_data_version(db_session, str(test_user.user_id))
+    db_session.commit()
+    db_session.refresh(test_user)
+
+    with patch("app.insights_cache.settings.INSIGHTS_CACHE_MAX_ENTRIES_PER_USER", 3):
+        for i in range(5):
+            get_cached_insights_json(
+                db_session, test_user, f"detailed:{i}", lambda: {"kind": "detailed"}
+            )
+
+    payload_types = {
+        entry.payload_type
+        for entry in db_session.query(InsightsCache).filter_by(
+            user_id=test_user.user_id
+        )
+    }
+    assert payload_types == {"detailed:2", "detailed:3", "detailed:4"}
+
+
+def test_etag_changes_with_data_version(db_session: Session, test_user: User):
+    """Test the ETag is stable until a sync bumps the data version."""
+    etag = insights_etag(test_user, "basic")
+    assert etag == insights_etag(test_user, "basic")
+    assert etag != insights_etag(test_user, "detailed")
+    assert etag.startswith('"') and etag.endswith('"')
+
+    bump_data_version(db_session, str(test_user.user_id))
+    db_session.commit()
+    db_session.refresh(test_user)
+
+    assert insights_etag(test_user, "basic") != etag
+
+
+def test_etag_matches_if_none_match_forms():
+    """Test If-None-Match lists, weak tags and wildcards."""
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"xyz"', etag)
+    assert not etag_matches(None, etag)
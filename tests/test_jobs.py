@@ -0,0 +1,147 @@
+"""
+Tests for app.jobs module.
+"""
+
+import json
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.jobs import (
+    claim_next_job,
+    enqueue_sync_job,
+    requeue_stale_jobs,
+    run_sync_job,
+    work,
+)
+from app.models import SyncJob, User
+from app.spotify_api import SpotifyAPI
+
+
+@pytest.fixture
+def test_user(db_session: Session) -> User:
+    """Create a test user for sync jobs."""
+    user = User(
+        user_id="jobs_user_123",
+        spotify_user_id="spotify_jobs_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.now() + timedelta(hours=1),
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_enqueue_coalesces_pending_jobs(db_session: Session, test_user: User):
+    """Test repeated sync requests share the user's pending job."""
+    first = enqueue_sync_job(db_session, str(test_user.user_id))
+    second = enqueue_sync_job(db_session, str(test_user.user_id))
+    assert first.id == second.id
+
+    claimed = claim_next_job(db_session, "worker-1")
+    assert claimed is not None and claimed.id == first.id
+    assert claimed.status == "running"  # type: ignore
+    assert claimed.attempts == 1  # type: ignore
+
+    # Once claimed, a new request queues a new job
+    third = enqueue_sync_job(db_session, str(test_user.user_id))
+    assert third.id != first.id
+    assert db_session.query(SyncJob).count() == 2
+
+
+def test_claim_next_job_when_queue_is_empty(db_session: Session):
+    """Test workers get nothing when no job is pending."""
+    assert claim_next_job(db_session, "worker-1") is None
+
+
+@patch.object(
+    SpotifyAPI,
+    "fetch_and_store_top_items",
+    return_value={"status": "success", "message": "ok"},
+)
+@patch.object(SpotifyAPI, "backfill_recently_played")
+def test_run_sync_job_records_progress_and_result(
+    mock_backfill: MagicMock,
+    mock_top_items: MagicMock,
+    db_session: Session,
+    test_user: User,
+):
+    """Test a job runs both sync steps and stores their results."""
+
+    def backfill(progress):
+        progress({"pages": 1, "stored": 50})
+        return {"status": "success", "message": "stored", "pages": 1, "stored": 50}
+
+    mock_backfill.side_effect = backfill
+    enqueue_sync_job(db_session, str(test_user.user_id))
+    job = claim_next_job(db_session, "worker-1")
+
+    run_sync_job(db_session, job)  # type: ignore[arg-type]
+
+    assert job.status == "succeeded"  # type: ignore
+    assert job.finished_at is not None  # type: ignore
+    assert json.loads(job.result)["recently_played"]["stored"] == 50  # type: ignore
+    assert json.loads(job.progress)["step"] == "done"  # type: ignore
+    mock_top_items.assert_called_once()
+
+
+@patch.object(
+    SpotifyAPI,
+    "fetch_and_store_top_items",
+    return_value={"status": "error", "message": "boom"},
+)
+@patch.object(
+    SpotifyAPI,
+    "backfill_recently_played",
+    return_value={"status": "success", "message": "ok"},
+)
+def test_run_sync_job_marks_failures(
+    mock_backfill: MagicMock,
+    mock_top_items: MagicMock,
+    db_session: Session,
+    test_user: User,
+):
+    """Test a failed sync step fails the job with its message."""
+    enqueue_sync_job(db_session, str(test_user.user_id))
+    job = claim_next_job(db_session, "worker-1")
+
+    run_sync_job(db_session, job)  # type: ignore[arg-type]
+
+    assert job.status == "failed"  # type: ignore
+    assert job.error == "top_items: boom"  # type: ignore
+
+
+def test_requeue_stale_jobs(db_session: Session, test_user: User):
+    """Test jobs abandoned by a dead worker are failed and queued again."""
+    enqueue_sync_job(db_session, str(test_user.user_id))
+    job = claim_next_job(db_session, "worker-1")
+    # A job the worker just updated is left alone
+    assert requeue_stale_jobs(db_session, timedelta(minutes=30)) == 0
+
+    # Timestamps come from the database clock, not this process's
+    db_now = db_session.scalar(select(func.now()))
+    setattr(job, "updated_at", db_now - timedelta(hours=2))
+    db_session.commit()
+
+    assert requeue_stale_jobs(db_session, timedelta(minutes=30)) == 1
+
+    assert job.status == "failed"  # type: ignore
+    pending = db_session.query(SyncJob).filter(SyncJob.status == "pending").one()
+    assert pending.user_id == test_user.user_id
+
+
+@patch("app.jobs.run_sync_job")
+def test_work_runs_pending_jobs(
+    mock_run: MagicMock, db_session: Session, test_user: User
+):
+    """Test the worker loop claims and runs queued jobs."""
+    enqueue_sync_job(db_session, str(test_user.user_id))
+
+    jobs_run = work("worker-1", lambda: db_session, poll_interval=0, max_jobs=1)
+
+    assert jobs_run == 1
+    mock_run.assert_called_once()
@@ -2,12 +2,75 @@
 Tests for app.main (FastAPI endpoints).
 """
 
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncGenerator, Generator
+from unittest.mock import AsyncMock, patch
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.auth import ACCESS_TOKEN_COOKIE, create_access_token
+from app.columnar import ColumnarInsightsGenerator
+from app.config import settings
+from app.database import Base, get_async_db
 from app.main import app
+from app.models import ListeningHistory, User
+from app.profile_cache import profile_cache
 
 client = TestClient(app)
 
 
+@pytest.fixture
+def api_session(tmp_path: Path) -> Generator[Session, None, None]:
+    """Session on a file database that the app's async sessions can share."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'api.db'}")
+    Base.metadata.create_all(engine)
+    # Each test client request runs on its own event loop, so do not pool
+    async_engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'api.db'}", poolclass=NullPool
+    )
+    async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def get_test_async_db() -> AsyncGenerator[AsyncSession, None]:
+        async with async_session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = get_test_async_db
+    profile_cache.session_factory = async_session_factory
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    profile_cache.session_factory = None
+    app.dependency_overrides.clear()
+    engine.dispose()
+
+
+@pytest.fixture
+def authed_user(api_session: Session) -> Generator[User, None, None]:
+    """Log a test user in with a JWT cookie."""
+    user = User(
+        user_id="api_user_123",
+        spotify_user_id="spotify_api_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.utcnow() + timedelta(hours=1),
+    )
+    api_session.add(user)
+    api_session.commit()
+
+    client.cookies.set(
+        ACCESS_TOKEN_COOKIE, create_access_token({"sub": "api_user_123"})
+    )
+    yield user
+    client.cookies.clear()
+
+
 def test_root():
     """Test root endpoint returns 200 and expected content."""
     response = client.get("/")
@@ -15,4 +78,147 @@ def test_root():
     assert "message" in response.json()
 
 
+def test_insights_conditional_get(authed_user: User):
+    """Test a matching If-None-Match is answered with 304 without computing."""
+    response = client.get("/api/v1/insights/basic")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    with patch("app.main.AsyncInsightsGenerator") as generator:
+        not_modified = client.get(
+            "/api/v1/insights/basic", headers={"If-None-Match": etag}
+        )
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    assert not_modified.content == b""
+    generator.assert_not_called()
+
+    other_params = client.get(
+        "/api/v1/insights/basic?weight_by_plays=true",
+        headers={"If-None-Match": etag},
+    )
+    assert other_params.status_code == 200
+    assert other_params.headers["etag"] != etag
+
+
+def test_detailed_insights_cached(authed_user: User):
+    """Test detailed insights are built once and then served from the cache."""
+    first = client.get("/api/v1/insights/detailed?granularity=week")
+    assert first.status_code == 200
+    assert "listening_trends_by_week" in first.json()
+
+    with patch(
+        "app.insights.InsightsGenerator._detailed_sections",
+        side_effect=AssertionError("recomputed"),
+    ):
+        second = client.get("/api/v1/insights/detailed?granularity=week")
+    assert second.status_code == 200
+    assert second.content == first.content
+
+
+def test_insights_served_by_columnar_engine(authed_user: User, api_session: Session):
+    """Test INSIGHTS_ENGINE=columnar builds the insights payload from snapshots."""
+    api_session.add_all(
+        ListeningHistory(
+            user_id=authed_user.user_id,
+            track_id=f"track_{i}",
+            track_name=f"Track {i}",
+            played_at=datetime.now() - timedelta(hours=i),
+        )
+        for i in range(3)
+    )
+    api_session.commit()
+
+    with patch.object(settings, "INSIGHTS_ENGINE", "columnar"), patch.object(
+        ColumnarInsightsGenerator,
+        "_snapshot",
+        autospec=True,
+        side_effect=ColumnarInsightsGenerator._snapshot,  # type: ignore
+    ) as snapshot:
+        response = client.get("/api/v1/insights/basic")
+
+    assert response.status_code == 200
+    assert response.json()["total_tracks_listened"] == 3
+    assert snapshot.called
+
+
+def test_sync_returns_job_and_status(authed_user: User):
+    """Test sync requests are queued as one job whose status can be read."""
+    first = client.post("/api/v1/data/sync")
+    second = client.post("/api/v1/data/sync")
+    assert first.status_code == 200
+    job_id = first.json()["job_id"]
+    assert second.json()["job_id"] == job_id
+
+    status_response = client.get(f"/api/v1/data/sync/{job_id}")
+    assert status_response.status_code == 200
+    assert status_response.json()["status"] == "pending"
+
+    assert client.get(f"/api/v1/data/sync/{job_id + 1}").status_code == 404
+
+
+def test_profile_cached_on_user_row(authed_user: User, api_session: Session):
+    """Test the profile is fetched once, stored on the user and then served."""
+    profile: Any = {
+        "id": "spotify_api_123",
+        "display_name": "API User",
+        "email": "api@example.com",
+    }
+    hits = profile_cache.metrics.snapshot()["hits"]
+    with patch(
+        "app.spotify_client.spotify_client.get_user_profile",
+        new=AsyncMock(return_value=profile),
+    ) as get_profile:
+        first = client.get("/api/v1/user/profile")
+        second = client.get("/api/v1/user/profile")
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json() == profile
+    get_profile.assert_awaited_once_with("test_token")
+    assert profile_cache.metrics.snapshot()["hits"] == hits + 1
+
+    api_session.refresh(authed_user)
+    assert authed_user.profile_fetched_at is not None
+    assert authed_user.spotify_display_name == "API User"
+    assert authed_user.email == "api@example.com"
+
+
+def test_stale_profile_served_then_revalidated(authed_user: User, api_session: Session):
+    """Test a stale profile is returned as is and refreshed after responding."""
+    setattr(authed_user, "profile_json", json.dumps({"display_name": "Old Name"}))
+    setattr(
+        authed_user,
+        "profile_fetched_at",
+        datetime.now() - profile_cache.ttl - timedelta(minutes=1),
+    )
+    api_session.commit()
+
+    with patch(
+        "app.spotify_client.spotify_client.get_user_profile",
+        new=AsyncMock(return_value={"display_name": "New Name"}),
+    ) as get_profile:
+        response = client.get("/api/v1/user/profile")
+
+    assert response.json() == {"display_name": "Old Name"}
+    get_profile.assert_awaited_once_with("test_token")
+    api_session.refresh(authed_user)
+    assert json.loads(str(authed_user.profile_json)) == {"display_name": "New Name"}
+
+
+def test_profile_unavailable(authed_user: User):
+    """Test a profile that cannot be fetched from Spotify is a 503."""
+    with patch(
+        "app.spotify_client.spotify_client.get_user_profile",
+        new=AsyncMock(side_effect=RuntimeError("Spotify down")),
+    ):
+        response = client.get("/api/v1/user/profile")
+
+    assert response.status_code == 503
+
+
+def test_missing_cookie_is_unauthorized(api_session: Session):
+    """Test requests without the JWT cookie are rejected."""
+    assert client.get("/api/v1/insights/basic").status_code == 401
+
+
 # Add more endpoint tests, including error and edge cases
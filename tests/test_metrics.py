@@ -0,0 +1,35 @@
+"""
+Tests for app.metrics module.
+"""
+
+import threading
+
+from app.metrics import Counters
+
+
+def test_counters_report_defaults_and_increments():
+    """Test snapshots include untouched defaults and rounded totals."""
+    counters = Counters({"hits": 0, "wait_seconds": 0.0})
+    counters.increment("hits")
+    counters.increment("wait_seconds", 0.12345)
+    counters.increment("misses", 2)
+
+    assert counters.snapshot() == {"hits": 1, "wait_seconds": 0.123, "misses": 2}
+    assert Counters({"hits": 0}).snapshot() == {"hits": 0}
+
+
+def test_counters_are_thread_safe():
+    """Test concurrent increments are not lost."""
+    counters = Counters()
+
+    def work() -> None:
+        for _ in range(1000):
+            counters.increment("hits")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counters.snapshot() == {"hits": 8000}
@@ -0,0 +1,175 @@
+"""
+Tests for app.rate_limit module.
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import List
+from unittest.mock import MagicMock, Mock, patch
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.rate_limit import (
+    DatabaseTokenBucket,
+    LocalTokenBucket,
+    RateLimiter,
+    parse_retry_after,
+)
+from app.spotify_api import SpotifyAPI
+from app.spotify_client import AsyncSpotifyClient
+
+
+def _limiter(backend=None, **kwargs) -> RateLimiter:
+    """Create a limiter with small backoffs for tests."""
+    return RateLimiter(
+        backend or LocalTokenBucket(rate=1000, capacity=100),
+        max_retries=kwargs.pop("max_retries", 3),
+        backoff_base=0.01,
+        backoff_max=0.05,
+        **kwargs,
+    )
+
+
+def test_local_bucket_throttles_after_burst():
+    """Test the bucket hands out its burst, then asks callers to wait."""
+    bucket = LocalTokenBucket(rate=10, capacity=2)
+
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.1
+
+
+def test_acquire_waits_and_records_metrics():
+    """Test throttle waits are slept through and counted."""
+    limiter = _limiter(LocalTokenBucket(rate=200, capacity=1))
+
+    limiter.acquire()
+    waited = limiter.acquire()
+
+    metrics = limiter.metrics.snapshot()
+    assert waited > 0
+    assert metrics["throttle_waits"] == 1
+    assert metrics["throttle_wait_seconds"] > 0
+
+
+def test_parse_retry_after():
+    """Test Retry-After in seconds and as an HTTP date."""
+    assert parse_retry_after("3") == 3.0
+    in_ten = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10))
+    assert 8 <= parse_retry_after(in_ten) <= 10  # type: ignore[operator]
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_retry_delay_policy():
+    """Test 429 honors Retry-After and pauses the bucket; 5xx backs off."""
+    limiter = _limiter()
+
+    delay = limiter.retry_delay(429, {"Retry-After": "2"}, attempt=0)
+    assert delay is not None and 2 <= delay <= 3
+    assert limiter.backend.try_acquire() > 1  # Every user backs off
+
+    assert 0 <= limiter.retry_delay(503, {}, attempt=2) <= 0.05  # type: ignore
+    assert limiter.retry_delay(404, {}, attempt=0) is None
+    assert limiter.retry_delay(500, {}, attempt=3) is None
+
+    metrics = limiter.metrics.snapshot()
+    assert metrics["retries_rate_limited"] == 1
+    assert metrics["retries_server_error"] == 1
+    assert metrics["retries_exhausted"] == 1
+
+
+def test_async_acquire_runs_blocking_backend_off_the_loop():
+    """Test database-backed calls do not run on the event loop thread."""
+    threads: List[str] = []
+
+    class BlockingBucket:
+        blocking = True
+
+        def try_acquire(self) -> float:
+            threads.append(threading.current_thread().name)
+            time.sleep(0.05)  # Waiting on the bucket row lock
+            return 0.0
+
+        def block_for(self, seconds: float) -> None:
+            threads.append(threading.current_thread().name)
+
+    limiter = _limiter(BlockingBucket())
+    ticks = 0
+
+    async def tick() -> None:
+        nonlocal ticks
+        for _ in range(5):
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    async def run() -> None:
+        await asyncio.gather(limiter.acquire_async(), tick())
+        await limiter.retry_delay_async(429, {"Retry-After": "0"}, attempt=0)
+
+    asyncio.run(run())
+
+    assert len(threads) == 2
+    assert threading.main_thread().name not in threads
+    # The loop kept running while the bucket was locked
+    assert ticks == 5
+
+
+def test_database_bucket_is_shared(tmp_path: Path):
+    """Test the database backend keeps one bucket for every instance."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'limits.db'}")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    first = DatabaseTokenBucket(session_factory, "spotify", rate=1, capacity=2)
+    second = DatabaseTokenBucket(session_factory, "spotify", rate=1, capacity=2)
+
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    assert first.try_acquire() > 0
+
+    second.block_for(30)
+    assert first.try_acquire() > 25
+    engine.dispose()
+
+
+@patch("app.spotify_api.spotify_http.request")
+def test_make_request_retries_rate_limited_response(mock_request: MagicMock):
+    """Test a 429 is retried after Retry-After instead of failing the sync."""
+    request = httpx.Request("GET", "https://api.spotify.com/v1/me")
+    mock_request.side_effect = [
+        httpx.Response(429, headers={"Retry-After": "0"}, request=request),
+        httpx.Response(200, json={"id": "me"}, request=request),
+    ]
+
+    user = Mock(
+        access_token="token", token_expires_at=datetime.now() + timedelta(hours=1)
+    )
+    limiter = _limiter()
+    with patch("app.spotify_api.spotify_rate_limiter", limiter):
+        result = SpotifyAPI(user, Mock()).get_user_profile()
+
+    assert result == {"id": "me"}
+    assert mock_request.call_count == 2
+    assert limiter.metrics.snapshot()["retries_rate_limited"] == 1
+
+
+def test_async_client_retries_server_errors():
+    """Test the async client backs off and retries 5xx responses."""
+    statuses = iter([503, 502, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), json={"items": []})
+
+    client = AsyncSpotifyClient(
+        transport=httpx.MockTransport(handler), rate_limiter=_limiter()
+    )
+
+    assert asyncio.run(client.get_top_artists("token")) == {"items": []}
+    assert client.rate_limiter.metrics.snapshot()["retries_server_error"] == 2
@@ -0,0 +1,147 @@
+"""
+Tests for app.rollups module.
+"""
+
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.insights import InsightsGenerator
+from app.models import (
+    DailyArtistRollup,
+    DailyListeningRollup,
+    DailyTrackRollup,
+    ListeningHistory,
+    User,
+)
+from app.rollups import apply_plays_to_rollups, rebuild_rollups
+
+
+@pytest.fixture
+def test_user(db_session: Session) -> User:
+    """Create a test user for rollup testing."""
+    user = User(
+        user_id="rollup_user_123",
+        spotify_user_id="spotify_rollup_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.now() + timedelta(hours=1),
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def _make_plays(user: User, start: datetime, count: int) -> List[ListeningHistory]:
+    return [
+        ListeningHistory(
+            user_id=user.user_id,
+            track_id=f"track_{i % 4}",
+            track_name=f"Track {i % 4}",
+            artist_id=f"artist_{i % 2}",
+            artist_name=f"Artist {i % 2}",
+            played_at=start - timedelta(hours=i * 7),
+            duration_ms=200000,
+        )
+        for i in range(count)
+    ]
+
+
+def _snapshot(db_session: Session, user: User):
+    """Return the rollup tables as comparable sets."""
+    days = {
+        (r.day, r.play_count, r.total_duration_ms, r.first_played_at, r.last_played_at)
+        for r in db_session.query(DailyListeningRollup).filter_by(user_id=user.user_id)
+    }
+    artists = {
+        (r.day, r.artist_id, r.play_count, r.total_duration_ms)
+        for r in db_session.query(DailyArtistRollup).filter_by(user_id=user.user_id)
+    }
+    tracks = {
+        (r.day, r.track_id, r.artist_name, r.play_count)
+        for r in db_session.query(DailyTrackRollup).filter_by(user_id=user.user_id)
+    }
+    return days, artists, tracks
+
+
+def test_apply_plays_increments_existing_rows(db_session: Session, test_user: User):
+    """Test incremental batches add onto rollup rows for the same day."""
+    start = datetime(2025, 3, 10, 22, 0)
+    first_batch = _make_plays(test_user, start, 3)
+    second_batch = _make_plays(test_user, start + timedelta(minutes=30), 3)
+
+    for batch in (first_batch, second_batch):
+        db_session.add_all(batch)
+        apply_plays_to_rollups(db_session, batch)
+        db_session.commit()
+
+    day_row = (
+        db_session.query(DailyListeningRollup)
+        .filter_by(user_id=test_user.user_id, day=start.date())
+        .one()
+    )
+    assert day_row.play_count == 6  # type: ignore
+    assert day_row.total_duration_ms == 6 * 200000  # type: ignore
+    assert day_row.first_played_at == start - timedelta(hours=14)  # type: ignore
+    assert day_row.last_played_at == start + timedelta(minutes=30)  # type: ignore
+
+
+def test_rebuild_matches_incremental(db_session: Session, test_user: User):
+    """Test the backfill rebuild produces the same rollups as live updates."""
+    plays = _make_plays(test_user, datetime(2025, 3, 10, 22, 0), 20)
+    db_session.add_all(plays)
+    apply_plays_to_rollups(db_session, plays)
+    db_session.commit()
+    incremental = _snapshot(db_session, test_user)
+
+    rebuild_rollups(db_session, str(test_user.user_id))
+    db_session.commit()
+
+    assert _snapshot(db_session, test_user) == incremental
+
+
+def test_rebuild_bumps_data_version(db_session: Session, test_user: User):
+    """Test a rebuild invalidates insights cached from the old rollups."""
+    other = User(user_id="rollup_other_user", spotify_user_id="spotify_other")
+    db_session.add(other)
+    db_session.commit()
+    versions = (test_user.data_version or 0, other.data_version or 0)
+
+    rebuild_rollups(db_session, str(test_user.user_id))
+    db_session.commit()
+    db_session.refresh(test_user)
+    db_session.refresh(other)
+    assert (test_user.data_version, other.data_version) == (
+        versions[0] + 1,
+        versions[1],
+    )
+
+    rebuild_rollups(db_session)
+    db_session.commit()
+    db_session.refresh(test_user)
+    db_session.refresh(other)
+    assert (test_user.data_version, other.data_version) == (
+        versions[0] + 2,
+        versions[1] + 1,
+    )
+
+
+def test_insights_read_rollups(db_session: Session, test_user: User):
+    """Test top artists and trends are served from the rollup tables."""
+    plays = _make_plays(test_user, datetime.now(), 9)
+    db_session.add_all(plays)
+    apply_plays_to_rollups(db_session, plays)
+    db_session.commit()
+
+    generator = InsightsGenerator(db=db_session, user_id=str(test_user.user_id))  # type: ignore
+    top_artists = generator._get_top_artists()  # type: ignore
+    trends = generator._get_listening_trends_by_month()  # type: ignore
+
+    assert top_artists[0] == {
+        "artist_id": "artist_0",
+        "artist_name": "Artist 0",
+        "listen_count": 5,
+    }
+    assert sum(trends.values()) == 9
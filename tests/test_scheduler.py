@@ -0,0 +1,154 @@
+"""
+Tests for app.scheduler module.
+"""
+
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models import DailyListeningRollup, SyncJob, SyncSchedule, User
+from app.scheduler import (
+    SyncScheduler,
+    compute_sync_interval,
+    enqueue_due_syncs,
+    observed_plays_per_hour,
+    refresh_schedules,
+)
+
+
+@pytest.fixture
+def users(db_session: Session) -> list:
+    """Create a heavy listener and an idle user."""
+    created = [
+        User(
+            user_id=f"sched_user_{i}",
+            spotify_user_id=f"spotify_sched_{i}",
+            access_token="test_token",
+            refresh_token="test_refresh",
+            token_expires_at=datetime.now() + timedelta(hours=1),
+        )
+        for i in range(2)
+    ]
+    db_session.add_all(created)
+    db_session.add(
+        DailyListeningRollup(
+            user_id="sched_user_0",
+            day=date.today(),
+            play_count=14 * 24 * 10,
+            total_duration_ms=0,
+        )
+    )
+    db_session.commit()
+    return created
+
+
+def test_compute_sync_interval_is_clamped():
+    """Test intervals shrink with listening rate within the configured bounds."""
+    assert compute_sync_interval(0) == timedelta(hours=24)
+    assert compute_sync_interval(0.01) == timedelta(hours=24)
+    assert compute_sync_interval(5) == timedelta(hours=5)
+    assert compute_sync_interval(1000) == timedelta(minutes=15)
+
+
+def test_observed_plays_per_hour(db_session: Session, users: list):
+    """Test listening rates come from the rollups in the window."""
+    db_session.add(
+        DailyListeningRollup(
+            user_id="sched_user_1",
+            day=date.today() - timedelta(days=60),
+            play_count=1000,
+            total_duration_ms=0,
+        )
+    )
+    db_session.commit()
+
+    rates = observed_plays_per_hour(db_session, 14)
+    assert rates == {"sched_user_0": 10.0}
+
+
+def test_refresh_schedules_spreads_first_runs(db_session: Session, users: list):
+    """Test new users get a schedule due within their first interval."""
+    before = datetime.now()
+    refresh_schedules(db_session)
+
+    schedules = {s.user_id: s for s in db_session.query(SyncSchedule).all()}
+    assert set(schedules) == {"sched_user_0", "sched_user_1"}
+    heavy, idle = schedules["sched_user_0"], schedules["sched_user_1"]
+    assert heavy.plays_per_hour == 10.0
+    assert heavy.interval_seconds == 150 * 60
+    assert idle.interval_seconds == 24 * 3600
+    for schedule in (heavy, idle):
+        offset = schedule.next_run_at - before
+        assert timedelta(0) <= offset <= timedelta(seconds=schedule.interval_seconds)
+
+
+def test_refresh_schedules_brings_runs_forward(db_session: Session, users: list):
+    """Test a user who starts listening more is synced sooner."""
+    now = datetime.now()
+    db_session.add(
+        SyncSchedule(
+            user_id="sched_user_0",
+            plays_per_hour=0.0,
+            interval_seconds=24 * 3600,
+            last_enqueued_at=now - timedelta(hours=1),
+            next_run_at=now + timedelta(hours=23),
+        )
+    )
+    db_session.commit()
+
+    refresh_schedules(db_session)
+
+    schedule = db_session.query(SyncSchedule).filter_by(user_id="sched_user_0").one()
+    assert schedule.interval_seconds == 150 * 60
+    assert schedule.next_run_at <= now + timedelta(hours=2)
+
+
+def test_enqueue_due_syncs_respects_limit(db_session: Session, users: list):
+    """Test the most overdue users are queued first and rescheduled."""
+    now = datetime.now()
+    for i, user in enumerate(users):
+        db_session.add(
+            SyncSchedule(
+                user_id=user.user_id,
+                plays_per_hour=1.0,
+                interval_seconds=3600,
+                next_run_at=now - timedelta(minutes=10 * (i + 1)),
+            )
+        )
+    db_session.commit()
+
+    assert enqueue_due_syncs(db_session, 1) == 1
+    jobs = db_session.query(SyncJob).all()
+    assert [job.user_id for job in jobs] == ["sched_user_1"]
+
+    schedule = db_session.query(SyncSchedule).filter_by(user_id="sched_user_1").one()
+    assert schedule.last_enqueued_at is not None
+    assert schedule.next_run_at > now + timedelta(minutes=50)
+
+    assert enqueue_due_syncs(db_session, 5) == 1
+    assert enqueue_due_syncs(db_session, 5) == 0
+    assert db_session.query(SyncJob).count() == 2
+
+
+def test_scheduler_tick_stays_within_budget(db_session: Session, users: list):
+    """Test each tick only queues the syncs the request budget allows."""
+    past = datetime.now() - timedelta(hours=1)
+    for user in users:
+        db_session.add(
+            SyncSchedule(
+                user_id=user.user_id,
+                plays_per_hour=1.0,
+                interval_seconds=3600,
+                next_run_at=past,
+            )
+        )
+    db_session.commit()
+
+    session_factory = MagicMock(return_value=db_session)
+    scheduler = SyncScheduler(
+        session_factory, requests_per_second=1, requests_per_sync=10, tick_seconds=10
+    )
+    assert scheduler.tick() == 1
+    assert db_session.query(SyncJob).count() == 1
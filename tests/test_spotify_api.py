@@ -2,12 +2,26 @@
 Tests for app.spotify_api module.
 """
 
-from datetime import datetime, timedelta
+import threading
+import time
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
 from unittest.mock import Mock, patch, MagicMock
+import httpx
 import pytest
 from app.spotify_api import SpotifyAPI
-from app.models import User
-from sqlalchemy.orm import Session
+from app.models import (
+    AudioFeatures,
+    DailyListeningRollup,
+    ListeningHistory,
+    TopArtist,
+    TopTrack,
+    User,
+)
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import Base
 
 
 @pytest.fixture
@@ -33,18 +47,24 @@ def spotify_api(db_session: Session, test_user_with_tokens: User) -> SpotifyAPI:
     return SpotifyAPI(user=test_user_with_tokens, db=db_session)
 
 
-@patch("app.spotify_api.requests.get")
-def test_get_user_profile_success(mock_get: MagicMock, spotify_api: SpotifyAPI):
+def _response(status_code: int, json: Any = None) -> httpx.Response:
+    """Build a Spotify API response to a GET request."""
+    request = httpx.Request("GET", "https://api.spotify.com/v1/me")
+    return httpx.Response(status_code, json=json, request=request)
+
+
+@patch("app.spotify_api.spotify_http.request")
+def test_get_user_profile_success(mock_request: MagicMock, spotify_api: SpotifyAPI):
     """Test successful user profile retrieval."""
-    mock_response = Mock()
-    mock_response.json.return_value = {
-        "id": "spotify_user_123",
-        "display_name": "Test User",
-        "email": "test@example.com",
-        "followers": {"total": 100},
-    }
-    mock_response.raise_for_status.return_value = None
-    mock_get.return_value = mock_response
+    mock_request.return_value = _response(
+        200,
+        {
+            "id": "spotify_user_123",
+            "display_name": "Test User",
+            "email": "test@example.com",
+            "followers": {"total": 100},
+        },
+    )
 
     profile = spotify_api.get_user_profile()
     assert profile["id"] == "spotify_user_123"
@@ -52,17 +72,15 @@ def test_get_user_profile_success(mock_get: MagicMock, spotify_api: SpotifyAPI):
     assert profile["email"] == "test@example.com"
 
 
-@patch("app.spotify_api.requests.get")
-def test_make_request_get_method(mock_get: MagicMock, spotify_api: SpotifyAPI):
+@patch("app.spotify_api.spotify_http.request")
+def test_make_request_get_method(mock_request: MagicMock, spotify_api: SpotifyAPI):
     """Test _make_request with GET method."""
-    mock_response = Mock()
-    mock_response.json.return_value = {"test": "data"}
-    mock_response.raise_for_status.return_value = None
-    mock_get.return_value = mock_response
+    mock_request.return_value = _response(200, {"test": "data"})
 
     result = spotify_api._make_request("/test")  # type: ignore
     assert result == {"test": "data"}
-    mock_get.assert_called_once()
+    mock_request.assert_called_once()
+    assert mock_request.call_args.args[0] == "GET"
 
 
 def test_spotify_api_initialization(
@@ -82,17 +100,329 @@ def test_check_token_not_expired(spotify_api: SpotifyAPI):
     assert spotify_api.access_token == original_token  # type: ignore
 
 
-@patch("app.spotify_api.requests.get")
-def test_make_request_http_error(mock_get: MagicMock, spotify_api: SpotifyAPI):
+@patch("app.spotify_api.spotify_http.request")
+def test_make_request_http_error(mock_request: MagicMock, spotify_api: SpotifyAPI):
     """Test _make_request handling HTTP errors."""
-    import requests
+    mock_request.return_value = _response(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        spotify_api._make_request("/nonexistent")  # type: ignore
+
+
+@patch("app.spotify_api.refresh_spotify_token")
+@patch("app.spotify_api.spotify_http.request")
+def test_make_request_refreshes_token_on_401(
+    mock_request: MagicMock, mock_refresh: MagicMock, spotify_api: SpotifyAPI
+):
+    """Test a 401 forces a token refresh and retries with the new token once."""
+    mock_request.side_effect = [_response(401), _response(200, {"id": "me"})]
+    mock_refresh.return_value = {"access_token": "new_token", "expires_in": 3600}
+
+    assert spotify_api._make_request("/me") == {"id": "me"}  # type: ignore
+    mock_refresh.assert_called_once_with("test_refresh_token")
+    assert mock_request.call_count == 2
+    retry_headers = mock_request.call_args.kwargs["headers"]
+    assert retry_headers == {"Authorization": "Bearer new_token"}
+
+
+@patch("app.spotify_api.refresh_spotify_token")
+@patch("app.spotify_api.spotify_http.request")
+def test_make_request_raises_repeated_401(
+    mock_request: MagicMock, mock_refresh: MagicMock, spotify_api: SpotifyAPI
+):
+    """Test a 401 after refreshing is raised instead of retried again."""
+    mock_request.return_value = _response(401)
+    mock_refresh.return_value = {"access_token": "new_token", "expires_in": 3600}
+
+    with pytest.raises(httpx.HTTPStatusError):
+        spotify_api._make_request("/me")  # type: ignore
+    mock_refresh.assert_called_once()
+    assert mock_request.call_count == 2
+
+
+def _recently_played_page(
+    start: datetime, count: int, has_next: bool = True
+) -> Dict[str, Any]:
+    """Build a recently played page, newest first, one play per minute."""
+    items = [
+        {
+            "played_at": (start - timedelta(minutes=i)).strftime(
+                "%Y-%m-%dT%H:%M:%S.000Z"
+            ),
+            "track": {
+                "id": f"track_{i % 7}",
+                "name": f"Track {i % 7}",
+                "duration_ms": 180000,
+                "artists": [{"id": "artist_1", "name": "Artist 1"}],
+                "album": {"id": "album_1", "name": "Album 1"},
+            },
+        }
+        for i in range(count)
+    ]
+    oldest = start - timedelta(minutes=count - 1)
+    return {
+        "items": items,
+        "cursors": {"before": str(int(oldest.timestamp() * 1000))},
+        "next": (
+            "https://api.spotify.com/v1/me/player/recently-played" if has_next else None
+        ),
+    }
 
-    mock_response = Mock()
-    mock_response.status_code = 404
-    mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
-        response=mock_response
+
+@patch.object(SpotifyAPI, "get_audio_features", return_value=[])
+def test_backfill_follows_cursors_until_history_ends(
+    mock_features: MagicMock, spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test a new user's history is paged back until Spotify has no more."""
+    newest = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    pages = [
+        _recently_played_page(newest, 50),
+        _recently_played_page(newest - timedelta(minutes=50), 50),
+        _recently_played_page(newest - timedelta(minutes=100), 20, has_next=False),
+    ]
+    progress: List[Dict[str, int]] = []
+
+    with patch.object(SpotifyAPI, "get_recently_played", side_effect=pages) as mock:
+        result = spotify_api.backfill_recently_played(progress=progress.append)
+
+    assert result["status"] == "success"
+    assert result["stored"] == 120
+    assert result["pages"] == 3
+    assert progress[-1] == {"pages": 3, "stored": 120}
+    # Each page asks for plays before the previous page's oldest play
+    assert mock.call_args_list[0].kwargs["before"] is None
+    assert mock.call_args_list[1].kwargs["before"] == int(pages[0]["cursors"]["before"])
+    assert db_session.query(ListeningHistory).count() == 120
+
+
+@patch.object(SpotifyAPI, "get_audio_features", return_value=[])
+def test_backfill_stops_at_watermark(
+    mock_features: MagicMock, spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test paging stops at the latest stored play without re-storing it."""
+    newest = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    db_session.add(
+        ListeningHistory(
+            user_id=spotify_api.user.user_id,
+            track_id="track_stored",
+            played_at=(newest - timedelta(minutes=70)).replace(tzinfo=None),
+        )
     )
-    mock_get.return_value = mock_response
+    db_session.commit()
+    pages = [
+        _recently_played_page(newest, 50),
+        _recently_played_page(newest - timedelta(minutes=50), 50),
+        _recently_played_page(newest - timedelta(minutes=100), 50),
+    ]
 
-    with pytest.raises(requests.exceptions.HTTPError):
-        spotify_api._make_request("/nonexistent")  # type: ignore
+    with patch.object(SpotifyAPI, "get_recently_played", side_effect=pages) as mock:
+        result = spotify_api.fetch_and_store_recently_played()
+
+    # 70 plays are newer than the stored one; the third page is never fetched
+    assert result["stored"] == 70
+    assert mock.call_count == 2
+    assert db_session.query(ListeningHistory).count() == 71
+
+
+@patch.object(SpotifyAPI, "get_audio_features", return_value=[])
+def test_interrupted_backfill_resumes_at_cursor(
+    mock_features: MagicMock, tmp_path: Path
+):
+    """Test a backfill that fails midway resumes below the stored pages."""
+    # The failed page rolls back, so use a database the test does not wrap
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    Base.metadata.create_all(engine)
+    db_session = sessionmaker(bind=engine)()
+    user = User(user_id="backfill_user", access_token="token")
+    user.token_expires_at = datetime.utcnow() + timedelta(hours=1)
+    db_session.add(user)
+    db_session.commit()
+    spotify_api = SpotifyAPI(user=user, db=db_session)
+    newest = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    db_session.add(
+        ListeningHistory(
+            user_id=spotify_api.user.user_id,
+            track_id="track_stored",
+            played_at=(newest - timedelta(minutes=200)).replace(tzinfo=None),
+        )
+    )
+    db_session.commit()
+    first = _recently_played_page(newest, 50)
+    second = _recently_played_page(newest - timedelta(minutes=50), 50)
+    third = _recently_played_page(newest - timedelta(minutes=100), 50, has_next=False)
+
+    with patch.object(
+        SpotifyAPI,
+        "get_recently_played",
+        side_effect=[first, RuntimeError("Spotify down")],
+    ):
+        failed = spotify_api.backfill_recently_played()
+    assert failed["status"] == "error"
+    assert failed["stored"] == 50
+
+    # The next sync finishes the gap, then picks up plays made since
+    newer = _recently_played_page(newest + timedelta(minutes=10), 11)
+    with patch.object(
+        SpotifyAPI, "get_recently_played", side_effect=[second, third, newer]
+    ) as mock:
+        result = spotify_api.backfill_recently_played()
+
+    assert result["status"] == "success"
+    assert result["stored"] == 110
+    assert mock.call_args_list[0].kwargs["before"] == int(first["cursors"]["before"])
+    assert mock.call_args_list[2].kwargs["before"] is None
+    assert db_session.query(ListeningHistory).count() == 161
+    assert spotify_api.user.history_backfill_before is None
+    db_session.close()
+    engine.dispose()
+
+
+@patch.object(SpotifyAPI, "get_audio_features", return_value=[])
+def test_backfill_page_cap_resumes_next_sync(
+    mock_features: MagicMock, spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test hitting the page cap leaves the rest for the next sync."""
+    newest = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    pages = [
+        _recently_played_page(newest, 50),
+        _recently_played_page(newest - timedelta(minutes=50), 50, has_next=False),
+        {"items": [], "cursors": None, "next": None},
+    ]
+
+    with patch.object(SpotifyAPI, "get_recently_played", side_effect=pages):
+        capped = spotify_api.backfill_recently_played(max_pages=1)
+        assert capped["stored"] == 50
+        assert spotify_api.user.history_watermark is None
+        resumed = spotify_api.backfill_recently_played(max_pages=2)
+
+    assert resumed["stored"] == 50
+    assert db_session.query(ListeningHistory).count() == 100
+    assert spotify_api.user.history_watermark is not None
+
+
+@patch.object(SpotifyAPI, "get_audio_features", return_value=[])
+def test_store_recently_played_skips_duplicates(
+    mock_features: MagicMock, spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test stored plays and in-page repeats are skipped in one insert."""
+    page = _recently_played_page(datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc), 5)
+    items = page["items"] + page["items"][:2]  # Repeat two plays within the page
+
+    first = spotify_api._store_recently_played_items(items)  # type: ignore
+    second = spotify_api._store_recently_played_items(page["items"])  # type: ignore
+
+    assert first == 5
+    assert second == 0
+    assert db_session.query(ListeningHistory).count() == 5
+    rollup = db_session.query(DailyListeningRollup).one()
+    assert rollup.play_count == 5  # type: ignore
+
+
+def test_fetch_and_store_top_items_fans_out(
+    spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test top items are fetched concurrently and stored in one batch."""
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    token_checks: List[str] = []
+
+    def fake_top_items(
+        kind: str, time_range: str, check_token: bool = True
+    ) -> Dict[str, Any]:
+        nonlocal in_flight, peak
+        assert not check_token
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        # The same two tracks are top tracks in every term
+        return {
+            "items": [
+                {"id": f"{kind[:-1]}_{i}", "name": f"{kind} {i} {time_range}"}
+                for i in range(2)
+            ]
+        }
+
+    def check_token(self: SpotifyAPI) -> None:
+        token_checks.append(threading.current_thread().name)
+
+    def get_audio_features(track_ids: List[str]) -> List[Dict[str, Any]]:
+        # Another sync stores track_1's features first
+        db_session.add(AudioFeatures(track_id="track_1"))
+        db_session.flush()
+        return [{"id": "track_0", "energy": 0.5}, {"id": "track_1"}]
+
+    with patch.object(
+        SpotifyAPI, "_get_top_items", side_effect=fake_top_items
+    ), patch.object(SpotifyAPI, "_check_token", check_token), patch.object(
+        SpotifyAPI, "get_audio_features", side_effect=get_audio_features
+    ) as mock_features, patch(
+        "app.spotify_api.settings.SPOTIFY_PER_USER_CONCURRENCY", 3
+    ):
+        result = spotify_api.fetch_and_store_top_items()
+
+    assert result["status"] == "success"
+    assert 1 < peak <= 3
+    # The token is checked once, on the calling thread only
+    assert token_checks == [threading.current_thread().name]
+    # One deduplicated audio features lookup across all three terms
+    mock_features.assert_called_once()
+    assert sorted(mock_features.call_args.args[0]) == ["track_0", "track_1"]
+    assert db_session.query(TopArtist).count() == 6
+    assert db_session.query(TopTrack).count() == 6
+    assert db_session.query(AudioFeatures).count() == 2
+    db_session.refresh(spotify_api.user)
+    assert spotify_api.user.data_version == 1  # type: ignore
+
+
+def test_fetch_and_store_top_items_writes_minimal_diff(
+    spotify_api: SpotifyAPI, db_session: Session
+):
+    """Test unchanged terms are skipped and changed terms only rewrite changed ranks."""
+    artists = {
+        "items": [{"id": f"artist_{i}", "name": f"Artist {i}"} for i in range(3)]
+    }
+    tracks: Dict[str, Any] = {"items": []}
+
+    def sync() -> Dict[str, Any]:
+        with patch.object(
+            SpotifyAPI,
+            "_get_top_items",
+            side_effect=lambda kind, *args, **kwargs: (
+                artists if kind == "artists" else tracks
+            ),
+        ):
+            return spotify_api.fetch_and_store_top_items()
+
+    first = sync()
+    assert first["changed_rows"] == 9
+    assert first["unchanged_terms"] == 0
+    ids = {(a.term, a.rank): a.id for a in db_session.query(TopArtist).all()}
+
+    second = sync()
+    assert second["changed_rows"] == 0
+    assert second["unchanged_terms"] == 6
+    db_session.refresh(spotify_api.user)
+    assert spotify_api.user.data_version == 1  # type: ignore
+
+    # Rank 2 changes and rank 3 drops out, in every term
+    artists["items"] = [artists["items"][0], {"id": "artist_9", "name": "Artist 9"}]
+    third = sync()
+    assert third["changed_rows"] == 6
+    assert third["unchanged_terms"] == 3
+
+    db_session.expire_all()
+    short_term = (
+        db_session.query(TopArtist)
+        .filter(TopArtist.term == "short_term")
+        .order_by(TopArtist.rank)
+        .all()
+    )
+    assert [a.artist_id for a in short_term] == ["artist_0", "artist_9"]
+    # Unchanged ranks keep their rows
+    assert short_term[0].id == ids[("short_term", 1)]
+    assert spotify_api.user.data_version == 2  # type: ignore
@@ -0,0 +1,145 @@
+"""
+Tests for app.spotify_client module.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from app.spotify_client import AsyncSpotifyClient
+
+
+def _client_with_handler(handler: Any, **kwargs: Any) -> AsyncSpotifyClient:
+    """Create a client whose requests are answered by handler."""
+    return AsyncSpotifyClient(transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_get_recently_played_sends_token_and_params():
+    """Test the access token and cursor params are sent."""
+    seen: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json={"items": [{"played_at": "x"}]})
+
+    client = _client_with_handler(handler)
+
+    async def run() -> Dict[str, Any]:
+        try:
+            return await client.get_recently_played("token_a", after=123)
+        finally:
+            await client.aclose()
+
+    data = asyncio.run(run())
+
+    assert data == {"items": [{"played_at": "x"}]}
+    assert seen[0].headers["Authorization"] == "Bearer token_a"
+    assert seen[0].url.path == "/v1/me/player/recently-played"
+    assert seen[0].url.params["after"] == "123"
+    assert seen[0].url.params["limit"] == "50"
+
+
+def test_get_audio_features_batches_ids():
+    """Test more than 100 IDs are split into batches and merged in order."""
+    batches: List[List[str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        ids = request.url.params["ids"].split(",")
+        batches.append(ids)
+        return httpx.Response(
+            200, json={"audio_features": [{"id": track_id} for track_id in ids]}
+        )
+
+    client = _client_with_handler(handler)
+    track_ids = [f"track_{i}" for i in range(250)]
+
+    features = asyncio.run(client.get_audio_features("token", track_ids))
+
+    assert sorted(len(batch) for batch in batches) == [50, 100, 100]
+    assert [feature["id"] for feature in features] == track_ids
+
+
+def test_per_host_limit_caps_concurrency():
+    """Test concurrent requests to one host never exceed max_per_host."""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"items": []})
+
+    client = _client_with_handler(handler, max_per_host=3)
+
+    async def run() -> None:
+        # Many users synced concurrently from one worker
+        await asyncio.gather(*(client.get_top_tracks(f"token_{i}") for i in range(12)))
+
+    asyncio.run(run())
+    assert peak == 3
+
+
+def test_http_errors_are_raised():
+    """Test 4xx/5xx responses raise HTTPStatusError."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(401, json={"error": "expired"})
+
+    client = _client_with_handler(handler)
+
+    with pytest.raises(httpx.HTTPStatusError) as exc_info:
+        asyncio.run(client.get_user_profile("expired_token"))
+    assert exc_info.value.response.status_code == 401
+
+
+def test_refresh_token_posts_form_to_token_endpoint():
+    """Test token refresh uses client credentials and form data."""
+    seen: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json={"access_token": "new", "expires_in": 3600})
+
+    client = _client_with_handler(handler)
+
+    token_data = asyncio.run(client.refresh_token("refresh_abc"))
+
+    assert token_data["access_token"] == "new"
+    assert seen[0].url.host == "accounts.spotify.com"
+    assert seen[0].headers["Authorization"].startswith("Basic ")
+    assert "refresh_token=refresh_abc" in seen[0].content.decode()
+
+
+def test_client_of_previous_loop_is_closed():
+    """Test moving to a new event loop closes the pool of the old one."""
+    client = _client_with_handler(lambda request: httpx.Response(200, json={}))
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(
+            client.get_user_profile("token"), other_loop
+        ).result(timeout=5)
+        first_pool = client._client  # type: ignore
+
+        asyncio.run(client.get_user_profile("token"))
+
+        assert first_pool is not None
+        assert client._client is not first_pool  # type: ignore
+        # Closed on its own loop, which is still running
+        for _ in range(50):
+            if first_pool.is_closed:
+                break
+            time.sleep(0.01)
+        assert first_pool.is_closed
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join(timeout=5)
+        other_loop.close()
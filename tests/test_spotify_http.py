@@ -0,0 +1,41 @@
+"""
+Tests for app.spotify_http module.
+"""
+
+import threading
+import time
+from typing import List
+
+import httpx
+
+from app.spotify_http import HostLimitedClient
+
+
+def test_requests_are_capped_per_host():
+    """Test concurrent requests to one host never exceed max_per_host."""
+    in_flight = {"api.spotify.com": 0, "accounts.spotify.com": 0}
+    peaks = dict(in_flight)
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        with lock:
+            in_flight[host] += 1
+            peaks[host] = max(peaks[host], in_flight[host])
+        time.sleep(0.02)
+        with lock:
+            in_flight[host] -= 1
+        return httpx.Response(200, json={})
+
+    client = HostLimitedClient(2, transport=httpx.MockTransport(handler))
+    urls: List[str] = ["https://api.spotify.com/v1/me"] * 6 + [
+        "https://accounts.spotify.com/api/token"
+    ] * 6
+    threads = [threading.Thread(target=client.get, args=(url,)) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.close()
+
+    assert peaks == {"api.spotify.com": 2, "accounts.spotify.com": 2}
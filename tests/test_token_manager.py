@@ -0,0 +1,184 @@
+"""
+Tests for app.token_manager module.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import User
+from app.spotify_api import SpotifyAPI
+from app.token_manager import TokenManager, token_needs_refresh
+
+
+def _expiring_user(user_id: str = "token_user_123") -> User:
+    return User(
+        user_id=user_id,
+        spotify_user_id=f"spotify_{user_id}",
+        access_token="old_token",
+        refresh_token="old_refresh",
+        token_expires_at=datetime.utcnow() + timedelta(minutes=1),
+    )
+
+
+def test_token_needs_refresh():
+    """Test tokens inside the refresh margin are due for a refresh."""
+    user = _expiring_user()
+    assert token_needs_refresh(user)
+    setattr(user, "token_expires_at", datetime.utcnow() + timedelta(hours=1))
+    assert not token_needs_refresh(user)
+    setattr(user, "token_expires_at", None)
+    assert token_needs_refresh(user)
+
+
+def test_concurrent_refreshes_are_coalesced(tmp_path):  # type: ignore
+    """Test concurrent requests for one user make a single refresh call."""
+    # Each thread uses its own session, as concurrent requests would
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'tokens.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(file_engine)
+    session_factory = sessionmaker(bind=file_engine)
+    db = session_factory()
+    db.add(_expiring_user())
+    db.commit()
+    db.close()
+
+    calls: List[str] = []
+
+    def refresh(refresh_token: str) -> Dict[str, Any]:
+        calls.append(refresh_token)
+        time.sleep(0.05)
+        return {
+            "access_token": "new_token",
+            "refresh_token": "new_refresh",
+            "expires_in": 3600,
+        }
+
+    manager = TokenManager()
+    tokens: List[str] = []
+
+    def request() -> None:
+        session = session_factory()
+        try:
+            user = session.query(User).one()
+            manager.ensure_fresh(session, user, refresh)
+            tokens.append(str(user.access_token))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=request) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["old_refresh"]
+    assert tokens == ["new_token"] * 5
+
+    db = session_factory()
+    stored = db.query(User).one()
+    assert stored.refresh_token == "new_refresh"  # type: ignore
+    assert not token_needs_refresh(stored)
+    db.close()
+    file_engine.dispose()
+
+
+def test_refresh_failure_propagates(db_session: Session):
+    """Test refresh errors reach the caller and release the user's lock."""
+    user = _expiring_user()
+    db_session.add(user)
+    db_session.commit()
+
+    manager = TokenManager()
+    refresh = MagicMock(side_effect=RuntimeError("token endpoint down"))
+    with pytest.raises(RuntimeError):
+        manager.ensure_fresh(db_session, user, refresh)
+
+    refresh.assert_called_once_with("old_refresh")
+    assert not manager._lock_for("token_user_123").locked()  # type: ignore
+
+
+def test_user_locks_are_released_after_refresh(db_session: Session):
+    """Test per-user locks do not accumulate once their refresh finishes."""
+    manager = TokenManager()
+    for i in range(5):
+        user = _expiring_user(f"token_user_{i}")
+        db_session.add(user)
+        db_session.commit()
+        manager.ensure_fresh(
+            db_session, user, lambda _: {"access_token": "new", "expires_in": 3600}
+        )
+
+    assert len(manager._locks) == 0  # type: ignore
+
+
+@patch("app.spotify_api.refresh_spotify_token")
+def test_spotify_api_refreshes_through_manager(
+    mock_refresh: MagicMock, db_session: Session
+):
+    """Test SpotifyAPI refreshes tokens inside the margin and updates its headers."""
+    user = _expiring_user()
+    db_session.add(user)
+    db_session.commit()
+    mock_refresh.return_value = {"access_token": "new_token", "expires_in": 3600}
+
+    spotify_api = SpotifyAPI(user, db_session)
+    spotify_api._check_token()  # type: ignore
+    spotify_api._check_token()  # type: ignore
+
+    mock_refresh.assert_called_once_with("old_refresh")
+    assert spotify_api.headers == {"Authorization": "Bearer new_token"}
+    assert user.refresh_token == "old_refresh"  # type: ignore
+
+
+def test_rejected_token_is_refreshed_once(db_session: Session):
+    """Test a rejected token is refreshed even when it has not expired."""
+    user = _expiring_user()
+    setattr(user, "token_expires_at", datetime.utcnow() + timedelta(hours=1))
+    db_session.add(user)
+    db_session.commit()
+    refresh = MagicMock(return_value={"access_token": "new_token", "expires_in": 60})
+
+    manager = TokenManager()
+    manager.ensure_fresh(db_session, user, refresh, rejected_token="old_token")
+    # A second worker that saw the same 401 finds the token already replaced
+    manager.ensure_fresh(db_session, user, refresh, rejected_token="old_token")
+
+    refresh.assert_called_once_with("old_refresh")
+    assert user.access_token == "new_token"  # type: ignore
+
+
+def test_failed_rejected_token_refresh_keeps_expiry(tmp_path):  # type: ignore
+    """Test a failed forced refresh leaves the stored token and expiry untouched."""
+    # The failed refresh rolls back, so it needs its own database
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'tokens.db'}")
+    Base.metadata.create_all(file_engine)
+    session_factory = sessionmaker(bind=file_engine)
+    db = session_factory()
+    user = _expiring_user()
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    setattr(user, "token_expires_at", expires_at)
+    db.add(user)
+    db.commit()
+
+    manager = TokenManager()
+    refresh = MagicMock(side_effect=RuntimeError("token endpoint down"))
+    with pytest.raises(RuntimeError):
+        manager.ensure_fresh(db, user, refresh, rejected_token="old_token")
+    db.close()
+
+    db = session_factory()
+    stored = db.query(User).one()
+    assert stored.access_token == "old_token"  # type: ignore
+    assert stored.token_expires_at == expires_at  # type: ignore
+    db.close()
+    file_engine.dispose()
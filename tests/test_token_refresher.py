@@ -0,0 +1,164 @@
+"""
+Tests for app.token_refresher module.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base
+from app.models import User
+from app.rate_limit import LocalTokenBucket, RateLimiter
+from app.token_refresher import TokenRefresher, users_due_for_refresh
+
+
+def _user(user_id: str, expires_in: timedelta) -> User:
+    return User(
+        user_id=user_id,
+        spotify_user_id=f"spotify_{user_id}",
+        access_token=f"{user_id}_token",
+        refresh_token=f"{user_id}_refresh",
+        token_expires_at=datetime.utcnow() + expires_in,
+    )
+
+
+@pytest.fixture
+def session_factory(tmp_path):  # type: ignore
+    """Shared file database, as refreshes run on their own sessions."""
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'refresher.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    Base.metadata.create_all(file_engine)
+    factory = sessionmaker(bind=file_engine)
+    db = factory()
+    db.add_all(
+        [
+            _user("expiring", timedelta(minutes=3)),
+            _user("soon", timedelta(minutes=10)),
+            _user("fresh", timedelta(hours=1)),
+        ]
+    )
+    db.commit()
+    db.close()
+    yield factory
+    file_engine.dispose()
+
+
+def _refresher(session_factory: Any, refresh: Any) -> TokenRefresher:
+    return TokenRefresher(
+        session_factory=session_factory,
+        refresh=refresh,
+        rate_limiter=RateLimiter(
+            LocalTokenBucket(rate=1000, capacity=100),
+            max_retries=0,
+            backoff_base=0.01,
+            backoff_max=0.01,
+        ),
+        lead=timedelta(minutes=15),
+        concurrency=2,
+    )
+
+
+def test_users_due_for_refresh(db_session: Session):
+    """Test users are selected by token expiry, soonest first."""
+    db_session.add_all(
+        [
+            _user("later", timedelta(minutes=10)),
+            _user("first", timedelta(minutes=1)),
+            _user("fresh", timedelta(hours=1)),
+        ]
+    )
+    db_session.commit()
+
+    assert users_due_for_refresh(db_session, timedelta(minutes=15), 10) == [
+        "first",
+        "later",
+    ]
+    assert users_due_for_refresh(db_session, timedelta(minutes=15), 1) == ["first"]
+
+
+def test_run_once_refreshes_expiring_tokens(session_factory: Any):
+    """Test tokens expiring within the lead time are refreshed ahead of requests."""
+    calls: List[str] = []
+
+    def refresh(refresh_token: str) -> Dict[str, Any]:
+        calls.append(refresh_token)
+        return {"access_token": f"new_{refresh_token}", "expires_in": 3600}
+
+    result = _refresher(session_factory, refresh).run_once()
+
+    assert result == {"refreshed": 2, "failed": 0}
+    assert sorted(calls) == ["expiring_refresh", "soon_refresh"]
+    db = session_factory()
+    tokens = {u.user_id: u.access_token for u in db.query(User).all()}
+    db.close()
+    assert tokens == {
+        "expiring": "new_expiring_refresh",
+        "soon": "new_soon_refresh",
+        "fresh": "fresh_token",
+    }
+
+
+def test_failed_refresh_is_retried_later(session_factory: Any):
+    """Test a user whose refresh failed is skipped until the retry delay passes."""
+    refresh = MagicMock(side_effect=RuntimeError("invalid_grant"))
+    refresher = _refresher(session_factory, refresh)
+
+    assert refresher.run_once() == {"refreshed": 0, "failed": 2}
+    assert refresh.call_count == 2
+
+    assert refresher.run_once() == {"refreshed": 0, "failed": 0}
+    assert refresh.call_count == 2
+
+
+def test_failing_users_do_not_starve_the_batch(session_factory: Any):
+    """Test users in backoff do not take the batch from users due after them."""
+    db = session_factory()
+    db.add_all(
+        [
+            _user("revoked_1", timedelta(minutes=-5)),
+            _user("revoked_2", timedelta(minutes=-4)),
+        ]
+    )
+    db.commit()
+    db.close()
+
+    def refresh(refresh_token: str) -> Dict[str, Any]:
+        if refresh_token.startswith("revoked"):
+            raise RuntimeError("invalid_grant")
+        return {"access_token": f"new_{refresh_token}", "expires_in": 3600}
+
+    refresher = _refresher(session_factory, refresh)
+    refresher.batch_size = 2
+
+    assert refresher.run_once() == {"refreshed": 0, "failed": 2}
+    assert refresher.run_once() == {"refreshed": 2, "failed": 0}
+
+    db = session_factory()
+    tokens = {u.user_id: u.access_token for u in db.query(User).all()}
+    db.close()
+    assert tokens["expiring"] == "new_expiring_refresh"
+    assert tokens["soon"] == "new_soon_refresh"
+
+
+def test_expired_backoff_entries_are_pruned(session_factory: Any):
+    """Test backoff entries are dropped once their retry delay has passed."""
+    refresh = MagicMock(side_effect=RuntimeError("invalid_grant"))
+    refresher = _refresher(session_factory, refresh)
+    refresher.retry_after = timedelta(0)
+    refresher.run_once()
+    assert set(refresher._failed_until) == {"expiring", "soon"}
+
+    # The users are gone, so only pruning can forget them
+    db = session_factory()
+    db.query(User).delete()
+    db.commit()
+    db.close()
+
+    assert refresher.run_once() == {"refreshed": 0, "failed": 0}
+    assert refresher._failed_until == {}
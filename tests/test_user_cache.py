@@ -0,0 +1,123 @@
+"""
+Tests for app.user_cache module.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Generator, List
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.auth import ACCESS_TOKEN_COOKIE, create_access_token, get_current_user
+from app.insights_cache import bump_data_version
+from app.models import User
+from app.user_cache import LocalUserCacheBackend, user_cache
+
+
+@pytest.fixture
+def test_user(db_session: Session) -> User:
+    """Create a user whose Spotify token is valid for an hour."""
+    user = User(
+        user_id="cache_user_123",
+        spotify_user_id="spotify_cache_123",
+        access_token="test_token",
+        refresh_token="test_refresh",
+        token_expires_at=datetime.utcnow() + timedelta(hours=1),
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def statements(db_session: Session) -> Generator[List[str], None, None]:
+    """Record SQL statements executed on the test connection."""
+    executed: List[str] = []
+    bind = db_session.get_bind()
+
+    def record(conn, cursor, statement, *args):  # type: ignore
+        executed.append(statement)
+
+    event.listen(bind, "before_cursor_execute", record)
+    yield executed
+    event.remove(bind, "before_cursor_execute", record)
+
+
+def _authenticate(db_session: Session, user_id: str) -> User:
+    token = create_access_token({"sub": user_id})
+    request = MagicMock(cookies={ACCESS_TOKEN_COOKIE: token})
+    return asyncio.run(get_current_user(request, db_session))
+
+
+def test_get_current_user_uses_cache(
+    db_session: Session, test_user: User, statements: List[str]
+):
+    """Test repeated authentication skips the user query."""
+    _authenticate(db_session, "cache_user_123")
+    assert len(statements) == 1
+
+    db_session.expunge_all()
+    statements.clear()
+    user = _authenticate(db_session, "cache_user_123")
+    assert statements == []
+    assert user.access_token == "test_token"  # type: ignore
+
+    # Uncached columns load on access, seeing updates from other processes
+    bump_data_version(db_session, "cache_user_123")
+    db_session.commit()
+    assert user.data_version == 1  # type: ignore
+
+
+def test_user_update_invalidates_cache(db_session: Session, test_user: User):
+    """Test ORM updates to the user drop the cached entry."""
+    _authenticate(db_session, "cache_user_123")
+    assert user_cache.backend.get("cache_user_123") is not None
+
+    setattr(test_user, "access_token", "new_token")
+    db_session.commit()
+    assert user_cache.backend.get("cache_user_123") is None
+
+    db_session.expunge_all()
+    user = _authenticate(db_session, "cache_user_123")
+    assert user.access_token == "new_token"  # type: ignore
+
+
+@patch("app.auth.refresh_spotify_token")
+def test_expiring_token_bypasses_cache(
+    mock_refresh: MagicMock, db_session: Session, test_user: User
+):
+    """Test users due a token refresh are read from the database and refreshed."""
+    _authenticate(db_session, "cache_user_123")
+    db_session.expunge_all()
+
+    # Cached fields still say the token expires in an hour
+    cached = user_cache.backend.get("cache_user_123")
+    cached["token_expires_at"] = datetime.utcnow() + timedelta(minutes=1)
+    db_session.query(User).filter(User.user_id == "cache_user_123").update(
+        {User.token_expires_at: datetime.utcnow() + timedelta(minutes=1)}
+    )
+    db_session.commit()
+    mock_refresh.return_value = {"access_token": "refreshed", "expires_in": 3600}
+
+    user = _authenticate(db_session, "cache_user_123")
+
+    mock_refresh.assert_called_once_with("test_refresh")
+    assert user.access_token == "refreshed"  # type: ignore
+    assert user_cache.backend.get("cache_user_123")["access_token"] == "refreshed"
+
+
+def test_local_backend_expiry_and_eviction():
+    """Test entries expire after their TTL and the least recently used is evicted."""
+    backend = LocalUserCacheBackend(max_size=2)
+    backend.set("a", {"user_id": "a"}, ttl=60)
+    backend.set("b", {"user_id": "b"}, ttl=60)
+    assert backend.get("a") == {"user_id": "a"}
+    backend.set("c", {"user_id": "c"}, ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+
+    backend.set("d", {"user_id": "d"}, ttl=0)
+    assert backend.get("d") is None
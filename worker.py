@@ -0,0 +1,43 @@
+import argparse
+import logging
+import multiprocessing
+import signal
+import sys
+import threading
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = Path(__file__).parent
+sys.path.append(str(project_root))
+
+
+def run_worker() -> None:
+    """Run one sync worker until it receives SIGTERM or SIGINT"""
+    from app.jobs import work
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    work(stop=stop)
+
+
+# Run sync job workers: python worker.py [--workers N]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Spotify sync job workers")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Number of worker processes"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    processes = [
+        multiprocessing.Process(target=run_worker, name=f"sync-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()